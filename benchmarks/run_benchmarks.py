@@ -0,0 +1,228 @@
+# Offline benchmark of the pipeline stages on synthetic corpora
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.synthetic import synthetic_works
+from get_location import flatten_authors
+from get_novelty import (FOCAL_YEARS, YearPartitions, convert_to_dataframe_3, iter_prepared, save_data_by_year,
+                         validate_data)
+from id_table import IdTable
+from novelty_engine import CoocNetwork
+
+DEFAULT_SIZES = [800, 10_000, 100_000, 1_000_000]
+
+
+class StageTimer:
+    """
+    Accumulate the wall time and the peak of traced memory of named stages.
+
+    A stage can be entered several times (e.g. once per focal year): its times are summed and
+    its peak is the highest peak of all runs, above the memory allocated when the stage started.
+
+    Args:
+        trace_memory (bool): Trace Python and NumPy allocations with tracemalloc (slower).
+    """
+
+    def __init__(self, trace_memory=True):
+        self.trace_memory = trace_memory
+        self.results = {}
+
+    def stage(self, name):
+        return _Stage(self, name)
+
+
+class _Stage:
+    def __init__(self, timer, name):
+        self.timer = timer
+        self.name = name
+
+    def __enter__(self):
+        if self.timer.trace_memory:
+            tracemalloc.reset_peak()
+            self.start_memory = tracemalloc.get_traced_memory()[0]
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        seconds = time.perf_counter() - self.start
+        peak = tracemalloc.get_traced_memory()[1] - self.start_memory if self.timer.trace_memory else None
+        result = self.timer.results.setdefault(self.name, {"seconds": 0.0, "peak_bytes": peak, "calls": 0})
+        result["seconds"] += seconds
+        result["calls"] += 1
+        if peak is not None:
+            result["peak_bytes"] = max(result["peak_bytes"] or 0, peak)
+        return False
+
+
+def benchmark_size(n_works, work_dir, trace_memory=True, **generator_options):
+    """
+    Run every stage of the pipeline on a synthetic corpus of `n_works` works.
+
+    Stages: prepare (generation, preparation and NDJSON partitions, as the harvest streams them),
+    validate, network (CSR network), cooc (per-year co-occurrence matrices), lee (scoring against
+    those matrices), merge (records frame joined with the scores) and flatten (author table of
+    the location stage).
+
+    Args:
+        n_works (int): Number of works.
+        work_dir (str): Scratch directory of the partitions.
+        trace_memory (bool): Measure the peak memory of each stage with tracemalloc.
+        **generator_options: Passed to `synthetic_works`.
+
+    Returns:
+        dict: Stage name -> {'seconds', 'peak_bytes', 'calls'}, plus a 'counts' entry.
+    """
+    timer = StageTimer(trace_memory)
+    id_table = IdTable(path=None)
+    records_dir = os.path.join(work_dir, "records")
+    shutil.rmtree(records_dir, ignore_errors=True)
+
+    with timer.stage("prepare"):
+        works = synthetic_works(n_works, **generator_options)
+        year_counts = save_data_by_year(iter_prepared(works, id_table), records_dir, compress=True)
+    records = YearPartitions(records_dir, FOCAL_YEARS[0], FOCAL_YEARS[-1])
+
+    with timer.stage("validate"):
+        validate_data(records)
+
+    with timer.stage("network"):
+        network = CoocNetwork.from_records(records, n_items=len(id_table))
+
+    frames = []
+    for focal_year in FOCAL_YEARS:
+        with timer.stage("cooc"):
+            adj, n_total = network.cooc([focal_year])
+        with timer.stage("lee"):
+            frames.append(network.lee_year(focal_year, adj, n_total))
+        del adj
+    lee_df = pd.concat(frames, ignore_index=True)
+
+    with timer.stage("merge"):
+        df = convert_to_dataframe_3(records)
+        df = df.merge(lee_df[['PMID', 'Novelty']], on='PMID', how='left').dropna(subset=['Novelty'])
+
+    with timer.stage("flatten"):
+        df_authors = flatten_authors(df)
+
+    results = timer.results
+    results["counts"] = {"works": sum(year_counts.values()), "items": len(id_table),
+                         "references": int(network.lengths.sum()), "scored": len(df), "author_rows": len(df_authors)}
+    return results
+
+
+def git_commit():
+    """Return the current commit of the repository, or None outside a git checkout."""
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(sizes=DEFAULT_SIZES, output=None, trace_memory=True, seed=0, **generator_options):
+    """
+    Benchmark every size and write the results to a JSON file.
+
+    Args:
+        sizes (list): Corpus sizes, in number of works.
+        output (str): Path of the JSON report (`benchmarks/results/{commit}_{timestamp}.json` by default).
+        trace_memory (bool): Measure the peak memory of each stage.
+        seed (int): Seed of the generator.
+        **generator_options: Passed to `synthetic_works`.
+
+    Returns:
+        dict: The report.
+    """
+    report = {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "trace_memory": trace_memory,
+        "generator": dict(generator_options, seed=seed),
+        "results": {},
+    }
+    work_dir = tempfile.mkdtemp(prefix="novelty_bench_")
+    if trace_memory:
+        tracemalloc.start()
+    try:
+        for n_works in sizes:
+            print(f"Benchmarking {n_works} works")
+            results = benchmark_size(n_works, work_dir, trace_memory, seed=seed, **generator_options)
+            report["results"][str(n_works)] = results
+            for stage, result in results.items():
+                if stage != "counts":
+                    memory = f", peak {result['peak_bytes'] / 2 ** 20:.1f} MiB" if result["peak_bytes"] is not None else ""
+                    print(f"  {stage:<10} {result['seconds']:9.3f} s{memory}")
+    finally:
+        if trace_memory:
+            tracemalloc.stop()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    if output is None:
+        results_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+        output = os.path.join(results_dir, f"{report['commit'] or 'unknown'}_{time.strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results saved to {output}")
+    return report
+
+
+def compare(baseline_path, candidate_path):
+    """
+    Print the time and memory ratios of two reports (candidate / baseline) for every size and stage.
+
+    Args:
+        baseline_path (str): JSON report of the reference commit.
+        candidate_path (str): JSON report of the commit under test.
+    """
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    with open(candidate_path) as f:
+        candidate = json.load(f)
+    print(f"{baseline['commit']} -> {candidate['commit']} (ratios > 1 are regressions)")
+    for size, stages in candidate["results"].items():
+        if size not in baseline["results"]:
+            continue
+        for stage, result in stages.items():
+            old = baseline["results"][size].get(stage)
+            if stage == "counts" or old is None:
+                continue
+            time_ratio = result["seconds"] / old["seconds"] if old["seconds"] else float("nan")
+            memory_ratio = (result["peak_bytes"] / old["peak_bytes"]
+                            if result["peak_bytes"] and old["peak_bytes"] else float("nan"))
+            print(f"{size:>9} {stage:<10} time x{time_ratio:.2f}  memory x{memory_ratio:.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the novelty pipeline on synthetic OpenAlex corpora.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="Corpus sizes, in works.")
+    parser.add_argument("--output", help="Path of the JSON report.")
+    parser.add_argument("--no-memory", action="store_true", help="Only measure time (tracemalloc slows the stages down).")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--mean-references", type=float, default=35)
+    parser.add_argument("--mean-authors", type=float, default=5)
+    parser.add_argument("--first-year", type=int, default=2016)
+    parser.add_argument("--last-year", type=int, default=2024)
+    parser.add_argument("--compare", nargs=2, metavar=("BASELINE", "CANDIDATE"), help="Compare two reports and exit.")
+    args = parser.parse_args()
+    if args.compare:
+        compare(*args.compare)
+    else:
+        run(args.sizes, args.output, trace_memory=not args.no_memory, seed=args.seed,
+            mean_references=args.mean_references, mean_authors=args.mean_authors,
+            years=(args.first_year, args.last_year))
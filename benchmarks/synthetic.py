@@ -0,0 +1,78 @@
+# Generator of synthetic OpenAlex `works` payloads, for offline benchmarks
+import numpy as np
+
+OPENALEX_PREFIX = "https://openalex.org/"
+CONCEPTS = ["Economics", "Medicine", "Biology", "Computer science", "Environmental science", "Sociology",
+            "Political science", "Engineering", "Chemistry", "Physics", "Geography", "Psychology"]
+SDGS = ["No poverty", "Zero hunger", "Good health and well-being", "Quality education", "Gender equality",
+        "Clean water and sanitation", "Affordable and clean energy", "Climate action", "Life on land"]
+WORK_TYPES = ["article", "article", "article", "review", "book-chapter", "preprint"]
+OA_STATUSES = ["gold", "green", "hybrid", "bronze", "closed"]
+
+
+def _zipf_choice(rng, n, size, exponent):
+    # Draw indices in [0, n) with a Zipf-like popularity: a few items are drawn very often
+    ranks = rng.zipf(exponent, size=size) - 1
+    return ranks % n
+
+
+def synthetic_works(n_works, mean_references=35, reference_dispersion=1.5, mean_authors=5,
+                    max_institutions=3, years=(2016, 2024), n_cited=None, internal_citation_share=0.1,
+                    n_institutions=5000, seed=0):
+    """
+    Lazily generate realistic OpenAlex works, with the fields read by the pipeline.
+
+    Reference list lengths follow a negative binomial distribution (many short lists, a long tail),
+    cited works and institutions follow a Zipf-like popularity, and the number of authors is
+    1 plus a Poisson draw. A share of the references points to other generated works, so that
+    `validate_data` finds both internal and dangling references.
+
+    Args:
+        n_works (int): Number of works.
+        mean_references (float): Mean length of the reference lists.
+        reference_dispersion (float): Shape of the negative binomial; lower values give a longer tail.
+        mean_authors (float): Mean number of authors per work.
+        max_institutions (int): Maximum number of affiliations per author.
+        years (tuple): First and last publication years, drawn uniformly.
+        n_cited (int): Number of distinct works outside the corpus that can be cited (2 * n_works by default).
+        internal_citation_share (float): Share of the references pointing to generated works.
+        n_institutions (int): Number of distinct institutions.
+        seed (int): Seed of the random generator, so that runs are reproducible.
+
+    Yields:
+        dict: One OpenAlex work at a time.
+    """
+    rng = np.random.default_rng(seed)
+    n_cited = n_cited or 2 * n_works
+    # Negative binomial with mean `mean_references`: p = r / (r + mean)
+    p = reference_dispersion / (reference_dispersion + mean_references)
+    for i in range(n_works):
+        n_refs = rng.negative_binomial(reference_dispersion, p)
+        internal = rng.random(n_refs) < internal_citation_share
+        cited = np.where(internal, rng.integers(0, n_works, n_refs),
+                         n_works + _zipf_choice(rng, n_cited, n_refs, 1.3))
+        n_authors = 1 + rng.poisson(mean_authors - 1)
+        authorships = []
+        for position in range(n_authors):
+            n_inst = rng.integers(0, max_institutions + 1)
+            institutions = [{"id": f"{OPENALEX_PREFIX}I{j}", "display_name": f"Institution {j}",
+                             "country_code": "FR"}
+                            for j in _zipf_choice(rng, n_institutions, n_inst, 1.2)]
+            authorships.append({
+                "author_position": "first" if position == 0 else "middle",
+                "author": {"id": f"{OPENALEX_PREFIX}A{i}_{position}", "display_name": f"Author {i}-{position}"},
+                "institutions": institutions,
+            })
+        concepts = rng.choice(len(CONCEPTS), size=3, replace=False)
+        yield {
+            "id": f"{OPENALEX_PREFIX}W{i}",
+            "publication_year": int(rng.integers(years[0], years[1] + 1)),
+            "type": WORK_TYPES[rng.integers(len(WORK_TYPES))],
+            "cited_by_count": int(rng.zipf(1.5)),
+            "authorships": authorships,
+            "referenced_works": [f"{OPENALEX_PREFIX}W{j}" for j in cited],
+            "concepts": [{"display_name": CONCEPTS[j], "score": 0.5} for j in concepts],
+            "sustainable_development_goals": [{"display_name": SDGS[rng.integers(len(SDGS))], "score": 0.6}],
+            "open_access": {"status": OA_STATUSES[rng.integers(len(OA_STATUSES))]},
+            "apc_paid": None,
+        }
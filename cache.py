@@ -0,0 +1,151 @@
+# Persistent, content-addressed cache of HTTP JSON responses
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+from urllib.parse import urlsplit, urlunsplit
+
+from metrics import METRICS
+
+# Query parameters that identify the caller rather than the requested content
+IGNORED_PARAMS = {"mailto", "api_key", "key"}
+
+
+class CacheMissError(LookupError):
+    """Raised in replay-only mode when a response is not in the cache."""
+
+
+def normalize_request(url, params=None):
+    """
+    Build a canonical representation of a GET request.
+
+    Args:
+        url (str): URL of the resource.
+        params (dict): Query string parameters.
+
+    Returns:
+        str: JSON string with the lower-cased scheme and host, the path without trailing
+             slash and the parameters sorted by name, so that equivalent requests match.
+    """
+    parts = urlsplit(url)
+    base = urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path.rstrip("/"), "", ""))
+    items = {k: str(v) for k, v in (params or {}).items() if k not in IGNORED_PARAMS}
+    return json.dumps([base, sorted(items.items())], ensure_ascii=False)
+
+
+class ResponseCache:
+    """
+    On-disk cache of JSON responses, stored gzip-compressed under the hash of the request.
+
+    Entries older than `ttl` are refetched. When the cache grows beyond `max_bytes`, the least
+    recently used entries are evicted (a hit refreshes the modification time of its file).
+    In `offline` mode the cache only replays stored responses and never touches the network.
+
+    Args:
+        directory (str): Directory where the entries are stored.
+        ttl (float): Lifetime of an entry in seconds. None keeps entries forever.
+        max_bytes (int): Maximum size of the cache on disk. None disables eviction.
+        offline (bool): Replay-only mode: misses raise CacheMissError, expired entries are still served.
+    """
+
+    def __init__(self, directory="Cache/openalex", ttl=30 * 24 * 3600, max_bytes=2 * 1024 ** 3, offline=False):
+        self.directory = directory
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.offline = offline
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self.size = sum(os.path.getsize(path) for path in self._entries())
+
+    def _entries(self):
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if name.endswith(".json.gz"):
+                    yield os.path.join(root, name)
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], f"{key}.json.gz")
+
+    def key(self, url, params=None):
+        """Return the content address (SHA-256) of a request."""
+        return hashlib.sha256(normalize_request(url, params).encode("utf-8")).hexdigest()
+
+    def get(self, url, params=None):
+        """
+        Look up a response.
+
+        Args:
+            url (str): URL of the resource.
+            params (dict): Query string parameters.
+
+        Returns:
+            dict: Cached JSON body, or None on a miss (or an expired entry when online).
+
+        Raises:
+            CacheMissError: In offline mode, if the response has never been stored.
+        """
+        path = self._path(self.key(url, params))
+        try:
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            entry = None
+
+        expired = entry is not None and self.ttl is not None and time.time() - entry["fetched_at"] > self.ttl
+        if entry is None or (expired and not self.offline):
+            with self.lock:
+                self.misses += 1
+            METRICS.count("cache.misses", cache=os.path.basename(self.directory))
+            if self.offline:
+                raise CacheMissError(f"No cached response for {url} {params}")
+            return None
+
+        with self.lock:
+            self.hits += 1
+        METRICS.count("cache.hits", cache=os.path.basename(self.directory))
+        try:
+            # Mark the entry as recently used for the LRU eviction
+            os.utime(path)
+        except OSError:
+            pass
+        return entry["body"]
+
+    def put(self, url, params, body):
+        """
+        Store a response and evict old entries if the cache is full.
+
+        Args:
+            url (str): URL of the resource.
+            params (dict): Query string parameters.
+            body (dict): Decoded JSON body.
+        """
+        path = self._path(self.key(url, params))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        previous = os.path.getsize(path) if os.path.exists(path) else 0
+        # Write to a temporary file first so that concurrent readers never see a partial entry
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+            json.dump({"request": normalize_request(url, params), "fetched_at": time.time(), "body": body}, f)
+        os.replace(tmp_path, path)
+
+        with self.lock:
+            self.size += os.path.getsize(path) - previous
+            if self.max_bytes is not None and self.size > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        # Remove the least recently used entries until the cache is back under 90% of its budget
+        entries = sorted(self._entries(), key=os.path.getmtime)
+        for path in entries:
+            if self.size <= 0.9 * self.max_bytes:
+                break
+            try:
+                size = os.path.getsize(path)
+                os.remove(path)
+                self.size -= size
+            except OSError:
+                continue
@@ -0,0 +1,287 @@
+# Spatial clusters and hotspots of novelty, over the location and novelty tables of every SDG
+import os
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+from sklearn.cluster import DBSCAN
+from sklearn.neighbors import BallTree
+
+from gazetteer import EARTH_RADIUS_KM, unit_vectors
+from metrics import METRICS
+from storage import read_table, write_table
+
+# Folders of the inputs and of the outputs
+NOVELTY_FOLDER = "DataFrames_nov"
+LOCATION_FOLDER = "DataFrames_loc"
+CLUSTER_FOLDER = "DataFrames_clusters"
+
+# Coordinates are rounded to this many decimals (about 100 m) before clustering: every institution
+# becomes one weighted point, however many authors it has
+COORDINATE_PRECISION = 3
+
+# DBSCAN settings: points within CLUSTER_RADIUS_KM are neighbours, and a core point needs a total
+# weight (author-location rows) of at least MIN_CLUSTER_WEIGHT in its neighbourhood
+CLUSTER_RADIUS_KM = 50
+MIN_CLUSTER_WEIGHT = 20
+
+# Radius of the neighbourhood of the local hotspot statistic (Getis-Ord Gi*)
+HOTSPOT_RADIUS_KM = 100
+
+# Points whose neighbourhoods are expanded at once when computing the hotspot sums
+HOTSPOT_CHUNK_SIZE = 2000
+
+
+def load_located_novelty(location_folder=LOCATION_FOLDER, novelty_folder=NOVELTY_FOLDER, sdgs=None):
+    """
+    Join the author locations of every SDG with the novelty of their works.
+
+    Args:
+        location_folder (str): Folder of the `DF_*.parquet` tables written by `get_location.py`.
+        novelty_folder (str): Folder of the `DF_*.parquet` tables written by `get_novelty.py`.
+        sdgs (iterable): Keep only these queries (all by default).
+
+    Returns:
+        pandas.DataFrame: One row per author-location with coordinates and a novelty score, with the
+                          'sdg', 'PMID', 'Year', 'Institution', 'City', 'Region', 'State', 'Continent',
+                          'Latitude', 'Longitude' and 'Novelty' columns.
+    """
+    columns = ['sdg', 'PMID', 'Year', 'Institution', 'City', 'Region', 'State', 'Continent', 'Latitude', 'Longitude']
+    # Tables written before the continent was added get an empty column
+    locations = read_table(location_folder, sdgs=sdgs, columns=columns).reindex(columns=columns)
+    novelty = read_table(novelty_folder, sdgs=sdgs, columns=['sdg', 'PMID', 'Novelty'])
+    # Dictionary-encoded columns come back as categoricals, whose categories differ between tables
+    for df in (locations, novelty):
+        df['sdg'] = df['sdg'].astype(str)
+    df = locations.merge(novelty, on=['sdg', 'PMID'], how='inner')
+    df = df.dropna(subset=['Latitude', 'Longitude', 'Novelty'])
+    return df.reset_index(drop=True)
+
+
+def weighted_points(df, precision=COORDINATE_PRECISION):
+    """
+    Deduplicate the coordinates of a located table.
+
+    Args:
+        df (pandas.DataFrame): Table with 'Latitude' and 'Longitude' columns.
+        precision (int): Decimals kept before deduplication.
+
+    Returns:
+        tuple: (points, point_of_row) where `points` is a DataFrame of the distinct 'Latitude',
+               'Longitude' with their 'Weight' (number of rows), and `point_of_row` the index of
+               the point of each row of `df`.
+    """
+    keys = pd.DataFrame({'Latitude': df['Latitude'].round(precision).to_numpy(),
+                         'Longitude': df['Longitude'].round(precision).to_numpy()})
+    point_of_row = keys.groupby(['Latitude', 'Longitude'], sort=False).ngroup().to_numpy()
+    points = keys.groupby(point_of_row).first()
+    points['Weight'] = np.bincount(point_of_row)
+    return points.reset_index(drop=True), point_of_row
+
+
+def cluster_points(points, radius_km=CLUSTER_RADIUS_KM, min_weight=MIN_CLUSTER_WEIGHT):
+    """
+    Cluster weighted points with DBSCAN on the haversine distance.
+
+    The neighbourhoods come from a ball tree, so memory grows with the number of neighbours
+    rather than with the square of the number of points.
+
+    Args:
+        points (pandas.DataFrame): Output of `weighted_points`.
+        radius_km (float): Neighbourhood radius.
+        min_weight (float): Weight a neighbourhood needs for its point to be a core point.
+
+    Returns:
+        numpy.ndarray: Cluster of each point, -1 for noise.
+    """
+    if not len(points):
+        return np.empty(0, dtype=np.int64)
+    coordinates = np.radians(points[['Latitude', 'Longitude']].to_numpy())
+    model = DBSCAN(eps=radius_km / EARTH_RADIUS_KM, min_samples=min_weight, metric='haversine',
+                   algorithm='ball_tree')
+    return model.fit(coordinates, sample_weight=points['Weight'].to_numpy()).labels_
+
+
+def neighbourhood_sums(points, values, radius_km=HOTSPOT_RADIUS_KM, chunk_size=HOTSPOT_CHUNK_SIZE):
+    """
+    Sum point values over the neighbourhood (within `radius_km`, itself included) of every point.
+
+    Neighbourhoods are queried from a ball tree chunk by chunk and applied as a sparse matrix
+    product, so every column of `values` (e.g. every SDG) is summed in the same pass.
+
+    Args:
+        points (pandas.DataFrame): Output of `weighted_points`.
+        values (numpy.ndarray): One row per point, one column per series.
+        radius_km (float): Neighbourhood radius.
+        chunk_size (int): Points expanded at once, which bounds the memory of the neighbour lists.
+
+    Returns:
+        numpy.ndarray: Same shape as `values`.
+    """
+    coordinates = np.radians(points[['Latitude', 'Longitude']].to_numpy())
+    tree = BallTree(coordinates, metric='haversine')
+    sums = np.zeros_like(values, dtype=np.float64)
+    for start in range(0, len(points), chunk_size):
+        neighbours = tree.query_radius(coordinates[start:start + chunk_size], r=radius_km / EARTH_RADIUS_KM)
+        lengths = np.fromiter((len(n) for n in neighbours), dtype=np.int64, count=len(neighbours))
+        indptr = np.concatenate([[0], np.cumsum(lengths)])
+        indices = np.concatenate(neighbours) if len(neighbours) else np.empty(0, dtype=np.int64)
+        window = sp.csr_matrix((np.ones(len(indices)), indices, indptr), shape=(len(neighbours), len(points)))
+        sums[start:start + len(neighbours)] = window @ values
+    return sums
+
+
+def hotspot_scores(df, points, point_of_row, radius_km=HOTSPOT_RADIUS_KM):
+    """
+    Local Getis-Ord Gi* z-scores of novelty around every point, for every SDG at once.
+
+    For each SDG, the novelty of the author-location rows within `radius_km` of a point is
+    compared with the SDG-wide mean: high scores mark places surrounded by unusually novel work.
+
+    Args:
+        df (pandas.DataFrame): Output of `load_located_novelty`.
+        points (pandas.DataFrame): Output of `weighted_points` for `df`.
+        point_of_row (numpy.ndarray): Point of each row of `df`.
+        radius_km (float): Neighbourhood radius.
+
+    Returns:
+        pandas.DataFrame: One row per (sdg, point) present in the data, with 'Latitude', 'Longitude',
+                          'Rows', 'Local_rows', 'Local_novelty' (neighbourhood mean), 'Hotspot_z'
+                          and the 'Cluster' of the point when `points` has one.
+    """
+    sdg_codes, sdg_names = pd.factorize(df['sdg'])
+    n_points, n_sdgs = len(points), len(sdg_names)
+    novelty = df['Novelty'].to_numpy(dtype=np.float64)
+    # Per point and SDG: number of rows and sum of novelty, as two dense (points x SDGs) matrices
+    cells = point_of_row * n_sdgs + sdg_codes
+    counts = np.bincount(cells, minlength=n_points * n_sdgs).reshape(n_points, n_sdgs).astype(np.float64)
+    totals = np.bincount(cells, weights=novelty, minlength=n_points * n_sdgs).reshape(n_points, n_sdgs)
+
+    local = neighbourhood_sums(points, np.hstack([counts, totals]), radius_km)
+    local_counts, local_totals = local[:, :n_sdgs], local[:, n_sdgs:]
+
+    # SDG-wide moments of the row values
+    n = counts.sum(axis=0)
+    mean = totals.sum(axis=0) / n
+    squares = np.bincount(sdg_codes, weights=novelty ** 2, minlength=n_sdgs)
+    std = np.sqrt(np.maximum(squares / n - mean ** 2, 0))
+    # Gi* with binary weights: sum(w) = sum(w^2) = number of rows in the neighbourhood
+    with np.errstate(divide='ignore', invalid='ignore'):
+        denominator = std * np.sqrt((n * local_counts - local_counts ** 2) / (n - 1))
+        z = (local_totals - mean * local_counts) / denominator
+        local_mean = local_totals / local_counts
+
+    point, sdg = np.nonzero(counts)
+    hotspots = pd.DataFrame({
+        'sdg': sdg_names[sdg],
+        'Latitude': points['Latitude'].to_numpy()[point],
+        'Longitude': points['Longitude'].to_numpy()[point],
+        'Rows': counts[point, sdg].astype(np.int64),
+        'Local_rows': local_counts[point, sdg].astype(np.int64),
+        'Local_novelty': local_mean[point, sdg],
+        'Hotspot_z': np.where(np.isfinite(z[point, sdg]), z[point, sdg], np.nan),
+    })
+    if 'Cluster' in points.columns:
+        hotspots['Cluster'] = points['Cluster'].to_numpy()[point]
+    return hotspots
+
+
+def novelty_stats(df, keys):
+    """
+    Novelty statistics of groups of author-location rows, compared with the mean of their SDG.
+
+    Args:
+        df (pandas.DataFrame): Output of `load_located_novelty`, possibly with a 'Cluster' column.
+        keys (list): Grouping columns; the first one must be 'sdg'.
+
+    Returns:
+        pandas.DataFrame: 'Rows', 'Works', 'Institutions', 'Mean_novelty', 'Median_novelty',
+                          'Std_novelty' and 'Novelty_z' (mean relative to the SDG, in standard errors) per group.
+    """
+    # Rows with an unknown region or country still count, under a missing key
+    grouped = df.groupby(keys, observed=True, sort=True, dropna=False)
+    stats = grouped.agg(Rows=('Novelty', 'size'), Works=('PMID', 'nunique'), Institutions=('Institution', 'nunique'),
+                        Mean_novelty=('Novelty', 'mean'), Median_novelty=('Novelty', 'median'),
+                        Std_novelty=('Novelty', 'std')).reset_index()
+    sdg_moments = df.groupby('sdg', observed=True)['Novelty'].agg(['mean', 'std'])
+    sdg_mean = stats['sdg'].map(sdg_moments['mean'])
+    sdg_std = stats['sdg'].map(sdg_moments['std'])
+    stats['Novelty_z'] = (stats['Mean_novelty'] - sdg_mean) / (sdg_std / np.sqrt(stats['Rows']))
+    return stats
+
+
+def cluster_summary(df, points):
+    """
+    Per-cluster statistics of every SDG, with the centroid and the main city of each cluster.
+
+    Args:
+        df (pandas.DataFrame): Output of `load_located_novelty`, with a 'Cluster' column.
+        points (pandas.DataFrame): Output of `weighted_points`, with a 'Cluster' column.
+
+    Returns:
+        pandas.DataFrame: One row per (sdg, cluster), noise excluded.
+    """
+    clustered = df[df['Cluster'] >= 0]
+    stats = novelty_stats(clustered, ['sdg', 'Cluster'])
+    # Weighted centroid on the sphere: mean of the unit vectors, projected back to latitude and longitude
+    members = points[points['Cluster'] >= 0]
+    vectors = unit_vectors(members['Latitude'], members['Longitude']) * members['Weight'].to_numpy()[:, None]
+    centroids = pd.DataFrame(vectors, columns=['x', 'y', 'z']).groupby(members['Cluster'].to_numpy()).sum()
+    centroids = pd.DataFrame({
+        'Latitude': np.degrees(np.arctan2(centroids['z'], np.hypot(centroids['x'], centroids['y']))),
+        'Longitude': np.degrees(np.arctan2(centroids['y'], centroids['x'])),
+    }, index=centroids.index)
+    # Most frequent city of each cluster, over all SDGs
+    cities = clustered.dropna(subset=['City']).groupby(['Cluster', 'City'], observed=True).size()
+    main_city = cities.sort_values(ascending=False).reset_index().drop_duplicates('Cluster').set_index('Cluster')['City']
+    stats = stats.join(centroids, on='Cluster')
+    stats['Main_city'] = stats['Cluster'].map(main_city)
+    return stats
+
+
+def analyze(location_folder=LOCATION_FOLDER, novelty_folder=NOVELTY_FOLDER, destination_folder=CLUSTER_FOLDER,
+            sdgs=None, radius_km=CLUSTER_RADIUS_KM, min_weight=MIN_CLUSTER_WEIGHT, hotspot_radius_km=HOTSPOT_RADIUS_KM):
+    """
+    Compute the spatial clusters, city statistics and hotspots of novelty of every SDG, and save them.
+
+    The clusters are drawn once over the distinct coordinates of all SDGs, so that a cluster is the
+    same place in every SDG; statistics and hotspot scores are then computed for all SDGs together.
+
+    Args:
+        location_folder (str): Folder of the tables written by `get_location.py`.
+        novelty_folder (str): Folder of the tables written by `get_novelty.py`.
+        destination_folder (str): Folder of `clusters.parquet`, `cities.parquet` and `hotspots.parquet`.
+        sdgs (iterable): Keep only these queries (all by default).
+        radius_km (float): DBSCAN neighbourhood radius.
+        min_weight (float): DBSCAN minimum neighbourhood weight.
+        hotspot_radius_km (float): Neighbourhood radius of the hotspot scores.
+
+    Returns:
+        dict: The 'clusters', 'cities' and 'hotspots' tables.
+    """
+    with METRICS.stage("clusters_load"):
+        df = load_located_novelty(location_folder, novelty_folder, sdgs)
+        points, point_of_row = weighted_points(df)
+    print(f"{len(df)} located author rows, {len(points)} distinct points")
+
+    with METRICS.stage("clusters_dbscan"):
+        points['Cluster'] = cluster_points(points, radius_km, min_weight)
+        df['Cluster'] = points['Cluster'].to_numpy()[point_of_row]
+
+    with METRICS.stage("clusters_stats"):
+        results = {
+            'clusters': cluster_summary(df, points),
+            'cities': novelty_stats(df.dropna(subset=['City']), ['sdg', 'Continent', 'State', 'City']),
+        }
+    with METRICS.stage("clusters_hotspots"):
+        results['hotspots'] = hotspot_scores(df, points, point_of_row, hotspot_radius_km)
+
+    for name, table in results.items():
+        write_table(table, os.path.join(destination_folder, f"{name}.parquet"))
+    print(f"{points['Cluster'].max() + 1} clusters saved in {destination_folder}")
+    return results
+
+
+if __name__ == '__main__':
+    analyze()
+    METRICS.save_run("clusters")
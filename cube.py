@@ -0,0 +1,169 @@
+# Pre-aggregated novelty cube of the dashboard, updated per SDG file
+import os
+
+import numpy as np
+import pandas as pd
+
+from manifest import StageManifest, file_digest, fingerprint
+from metrics import METRICS
+from storage import export_csv, read_table, write_table
+
+# Folders of the inputs and of the outputs
+NOVELTY_FOLDER = "DataFrames_nov"
+LOCATION_FOLDER = "DataFrames_loc"
+CUBE_FOLDER = "DataFrames_cube"
+
+# Dimensions of the cube, from the coarsest to the finest
+CUBE_KEYS = ['sdg', 'year', 'Continent', 'State', 'City', 'field']
+
+# Novelty quantiles stored for every cell
+QUANTILES = [0.1, 0.25, 0.5, 0.75, 0.9]
+
+# Label of the cells of works whose place is unknown
+UNKNOWN = "Unknown"
+
+# Number of works kept per SDG in the table of the most novel works
+TOP_N = 100
+
+# Also export the cube as CSV, for the Power BI dashboard
+EXPORT_CSV = True
+
+
+def work_locations(location_path):
+    """
+    Distinct places of the authors of each work.
+
+    Args:
+        location_path (str): Location table of an SDG, written by `get_location.py`.
+
+    Returns:
+        pandas.DataFrame: 'PMID', 'Continent', 'State' and 'City', one row per work and city.
+    """
+    columns = ['PMID', 'Continent', 'State', 'City']
+    # Tables written before the continent was added get an empty column
+    locations = read_table(location_path, columns=columns).reindex(columns=columns)
+    for column in columns[1:]:
+        locations[column] = locations[column].astype(object)
+    return locations.drop_duplicates()
+
+
+def sdg_cube(novelty_path, location_path=None):
+    """
+    Aggregate the works of one SDG over the dimensions of the cube.
+
+    A work with authors in several cities counts once in each of them. Works without a known place
+    (or without a location table) fall under `UNKNOWN` Continent, State and City.
+
+    Args:
+        novelty_path (str): Novelty table of the SDG, written by `get_novelty.py`.
+        location_path (str): Location table of the same SDG, if it exists.
+
+    Returns:
+        pandas.DataFrame: One row per cell, with 'Works', 'Mean_novelty', 'Std_novelty', the novelty
+                          quantiles ('Novelty_q10', ...), 'Min_novelty', 'Max_novelty', 'Citations',
+                          'Mean_citations', 'Median_citations', 'Mean_authors' and 'Median_authors'.
+    """
+    works = read_table(novelty_path, columns=['sdg', 'PMID', 'year', 'field', 'num_citations', 'num_authors', 'Novelty'])
+    works['sdg'] = works['sdg'].astype(str)
+    works['field'] = works['field'].astype(object)
+    if location_path is not None and os.path.exists(location_path):
+        works = works.merge(work_locations(location_path), on='PMID', how='left')
+    else:
+        works = works.assign(Continent=None, State=None, City=None)
+
+    # Missing places are kept as their own cells
+    works[['Continent', 'State', 'City']] = works[['Continent', 'State', 'City']].fillna(UNKNOWN)
+    works['field'] = works['field'].fillna('')
+    grouped = works.groupby(CUBE_KEYS, sort=True)
+    cube = grouped.agg(Works=('PMID', 'nunique'), Mean_novelty=('Novelty', 'mean'), Std_novelty=('Novelty', 'std'),
+                       Min_novelty=('Novelty', 'min'), Max_novelty=('Novelty', 'max'),
+                       Citations=('num_citations', 'sum'), Mean_citations=('num_citations', 'mean'),
+                       Median_citations=('num_citations', 'median'), Mean_authors=('num_authors', 'mean'),
+                       Median_authors=('num_authors', 'median'))
+    # Reindexed, so that an SDG without any scored work still gets every quantile column
+    quantiles = grouped['Novelty'].quantile(QUANTILES).unstack().reindex(columns=QUANTILES)
+    quantiles.columns = [f"Novelty_q{round(q * 100)}" for q in QUANTILES]
+    return cube.join(quantiles).reset_index()
+
+
+def top_works(novelty_path, n=TOP_N):
+    """
+    The `n` most novel works of an SDG, sorted by decreasing novelty.
+
+    Args:
+        novelty_path (str): Novelty table of the SDG.
+        n (int): Number of works.
+
+    Returns:
+        pandas.DataFrame: 'sdg', 'Rank', 'PMID', 'year', 'type', 'field', 'num_citations', 'num_authors' and 'Novelty'.
+    """
+    works = read_table(novelty_path, columns=['sdg', 'PMID', 'year', 'type', 'field', 'num_citations', 'num_authors',
+                                              'Novelty'])
+    top = works.nlargest(n, 'Novelty').reset_index(drop=True)
+    top.insert(1, 'Rank', np.arange(1, len(top) + 1))
+    top['sdg'] = top['sdg'].astype(str)
+    return top
+
+
+def cube_fingerprint(novelty_path, location_path, top_n):
+    """Fingerprint of the cube part of an SDG: the content of its two tables and the size of its top table."""
+    location_digest = file_digest(location_path) if location_path and os.path.exists(location_path) else None
+    return fingerprint(file_digest(novelty_path), location_digest, CUBE_KEYS, QUANTILES, top_n)
+
+
+def build_cube(novelty_folder=NOVELTY_FOLDER, location_folder=LOCATION_FOLDER, destination_folder=CUBE_FOLDER,
+               state_dir="Cache/cube", manifest=None, top_n=TOP_N):
+    """
+    Build the aggregate cube and the top works table of every SDG, recomputing only the changed SDGs.
+
+    Each SDG is aggregated into its own part (`state_dir/parts`), keyed by the content of its novelty
+    and location tables. As SDG is the first dimension of the cube, the parts never overlap and the
+    cube is their concatenation, so a change to one SDG file only recomputes that SDG.
+
+    Args:
+        novelty_folder (str): Folder of the `DF_*.parquet` novelty tables.
+        location_folder (str): Folder of the `DF_*.parquet` location tables.
+        destination_folder (str): Folder of `cube.parquet` and `top_works.parquet` (and their CSV exports).
+        state_dir (str): Folder of the per-SDG parts.
+        manifest (StageManifest): Record of the completed stages (`state_dir/manifest` by default).
+        top_n (int): Number of works per SDG in the top works table (0 to skip it).
+
+    Returns:
+        tuple: (cube, top) DataFrames.
+    """
+    manifest = manifest if manifest is not None else StageManifest(os.path.join(state_dir, "manifest"))
+    parts_dir = os.path.join(state_dir, "parts")
+    os.makedirs(parts_dir, exist_ok=True)
+    names = sorted(os.path.splitext(name)[0] for name in os.listdir(novelty_folder) if name.endswith(".parquet"))
+
+    cube_parts, top_parts = [], []
+    for name in names:
+        novelty_path = os.path.join(novelty_folder, f"{name}.parquet")
+        location_path = os.path.join(location_folder, f"{name}.parquet")
+        outputs = [os.path.join(parts_dir, f"{name}.cube.parquet"), os.path.join(parts_dir, f"{name}.top.parquet")]
+        stage_fingerprint = cube_fingerprint(novelty_path, location_path, top_n)
+        if not manifest.is_current("cube", name, stage_fingerprint):
+            with METRICS.stage("cube", file=name):
+                write_table(sdg_cube(novelty_path, location_path), outputs[0])
+                write_table(top_works(novelty_path, top_n), outputs[1])
+            manifest.record("cube", name, stage_fingerprint, outputs=outputs)
+            print(f"Cube of {name} updated")
+        cube_parts.append(outputs[0])
+        top_parts.append(outputs[1])
+
+    # Parts of SDG files that no longer exist are left out, as only the current names are read
+    cube = read_table(cube_parts) if cube_parts else pd.DataFrame(columns=CUBE_KEYS)
+    top = read_table(top_parts) if top_parts and top_n else pd.DataFrame()
+    write_table(cube, os.path.join(destination_folder, "cube.parquet"))
+    write_table(top, os.path.join(destination_folder, "top_works.parquet"))
+    if EXPORT_CSV:
+        # export_csv leaves out the 'sdg' column of the Parquet tables, keep it under its dashboard name
+        export_csv(cube.rename(columns={'sdg': 'SDG'}), os.path.join(destination_folder, "cube.csv"))
+        export_csv(top.rename(columns={'sdg': 'SDG'}), os.path.join(destination_folder, "top_works.csv"))
+    print(f"Cube of {len(names)} SDGs saved in {destination_folder} ({len(cube)} cells)")
+    return cube, top
+
+
+if __name__ == '__main__':
+    build_cube()
+    METRICS.save_run("cube")
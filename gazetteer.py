@@ -0,0 +1,155 @@
+# Offline reverse geocoding with a KD-tree over a local GeoNames gazetteer
+import os
+
+import numpy as np
+import pandas as pd
+from scipy.spatial import cKDTree
+
+EARTH_RADIUS_KM = 6371.0088
+
+# GeoNames dump files (https://download.geonames.org/export/dump/)
+CITIES_FILE = "cities15000.txt"
+ADMIN1_FILE = "admin1CodesASCII.txt"
+COUNTRY_FILE = "countryInfo.txt"
+
+# Columns of the GeoNames "geoname" table used here
+CITY_COLUMNS = {1: 'name', 4: 'latitude', 5: 'longitude', 8: 'country_code', 10: 'admin1_code', 14: 'population'}
+
+CONTINENT_NAMES = {
+    "AF": "Africa",
+    "AS": "Asia",
+    "EU": "Europe",
+    "NA": "North America",
+    "SA": "South America",
+    "OC": "Oceania",
+    "AN": "Antarctica"
+}
+
+
+def unit_vectors(lat, lng):
+    """Convert latitudes and longitudes in degrees to 3D unit vectors, where chord distance grows with arc distance."""
+    lat = np.radians(np.asarray(lat, dtype=np.float64))
+    lng = np.radians(np.asarray(lng, dtype=np.float64))
+    cos_lat = np.cos(lat)
+    return np.column_stack([cos_lat * np.cos(lng), cos_lat * np.sin(lng), np.sin(lat)])
+
+
+def chord_to_km(chord):
+    """Convert a chord length on the unit sphere to a great-circle distance in kilometers."""
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.clip(np.asarray(chord) / 2, 0, 1))
+
+
+class Gazetteer:
+    """
+    Nearest-city lookups over a GeoNames-style gazetteer, for whole arrays of coordinates at once.
+
+    Cities are indexed by a KD-tree on unit-sphere coordinates, so the nearest neighbour in 3D is
+    the nearest city on the globe, with no distortion near the poles or the antimeridian. Regions
+    come from the admin1 table and countries and continents from the country table.
+
+    Args:
+        cities (pandas.DataFrame): Columns 'name', 'latitude', 'longitude', 'country_code', 'admin1_code'.
+        admin1 (pandas.DataFrame): Columns 'code' ("FR.11") and 'name'. Optional.
+        countries (pandas.DataFrame): Columns 'code' ("FR"), 'name' and 'continent' ("EU"). Optional.
+    """
+
+    def __init__(self, cities, admin1=None, countries=None):
+        self.cities = cities.reset_index(drop=True)
+        self.tree = cKDTree(unit_vectors(self.cities['latitude'], self.cities['longitude']))
+        admin1_names = admin1.set_index('code')['name'] if admin1 is not None else pd.Series(dtype=object)
+        self.countries = countries.set_index('code') if countries is not None else None
+        # Resolve the region and country of every city once, so that lookups are plain array indexing
+        region_keys = self.cities['country_code'] + "." + self.cities['admin1_code'].fillna("").astype(str)
+        self.regions = region_keys.map(admin1_names).to_numpy(dtype=object)
+        if self.countries is not None:
+            self.country_names = self.cities['country_code'].map(self.countries['name']).to_numpy(dtype=object)
+            continent_codes = self.cities['country_code'].map(self.countries['continent'])
+            self.continents = continent_codes.map(CONTINENT_NAMES).to_numpy(dtype=object)
+        else:
+            self.country_names = np.full(len(self.cities), None, dtype=object)
+            self.continents = np.full(len(self.cities), None, dtype=object)
+
+    @classmethod
+    def load(cls, directory="Data/geonames", cities_file=CITIES_FILE):
+        """
+        Load the GeoNames dump files of a directory.
+
+        Args:
+            directory (str): Folder holding `cities15000.txt` (or another cities file), and optionally
+                             `admin1CodesASCII.txt` and `countryInfo.txt`.
+            cities_file (str): Name of the cities file (cities500/1000/5000/15000.txt).
+
+        Returns:
+            Gazetteer: The loaded gazetteer.
+        """
+        cities = pd.read_csv(os.path.join(directory, cities_file), sep="\t", header=None, quoting=3,
+                             usecols=list(CITY_COLUMNS), names=range(19), keep_default_na=False,
+                             na_values=[""], dtype={8: str, 10: str}).rename(columns=CITY_COLUMNS)
+        admin1 = None
+        admin1_path = os.path.join(directory, ADMIN1_FILE)
+        if os.path.exists(admin1_path):
+            admin1 = pd.read_csv(admin1_path, sep="\t", header=None, quoting=3, usecols=[0, 1],
+                                 names=['code', 'name'], keep_default_na=False, dtype=str)
+        countries = None
+        country_path = os.path.join(directory, COUNTRY_FILE)
+        if os.path.exists(country_path):
+            # Header lines start with '#'; "NA" is the continent code of North America, not a missing value
+            countries = pd.read_csv(country_path, sep="\t", header=None, comment="#", quoting=3, usecols=[0, 4, 8],
+                                    names=['code', 'name', 'continent'], keep_default_na=False, dtype=str)
+        return cls(cities, admin1, countries)
+
+    def __len__(self):
+        return len(self.cities)
+
+    def reverse(self, lat, lng, max_distance_km=50):
+        """
+        Find the nearest city of each point.
+
+        Args:
+            lat (array-like): Latitudes in degrees.
+            lng (array-like): Longitudes in degrees.
+            max_distance_km (float): Points farther than this from any city get no City (their
+                                     region, country and continent are still those of the nearest city).
+
+        Returns:
+            pandas.DataFrame: One row per point with City, Region, State (country name), Country_Code,
+                              Continent and Distance_km. Points with missing coordinates get empty rows.
+        """
+        lat = np.asarray(lat, dtype=np.float64)
+        lng = np.asarray(lng, dtype=np.float64)
+        valid = np.isfinite(lat) & np.isfinite(lng)
+        result = pd.DataFrame({column: np.full(len(lat), None, dtype=object)
+                               for column in ['City', 'Region', 'State', 'Country_Code', 'Continent']})
+        result['Distance_km'] = np.nan
+        if not valid.any() or not len(self.cities):
+            return result
+
+        chord, nearest = self.tree.query(unit_vectors(lat[valid], lng[valid]))
+        distance = chord_to_km(chord)
+        rows = np.flatnonzero(valid)
+        cities = self.cities['name'].to_numpy(dtype=object)[nearest]
+        if max_distance_km is not None:
+            cities = np.where(distance <= max_distance_km, cities, None)
+        result.loc[rows, 'City'] = cities
+        result.loc[rows, 'Region'] = self.regions[nearest]
+        result.loc[rows, 'State'] = self.country_names[nearest]
+        result.loc[rows, 'Country_Code'] = self.cities['country_code'].to_numpy(dtype=object)[nearest]
+        result.loc[rows, 'Continent'] = self.continents[nearest]
+        result.loc[rows, 'Distance_km'] = distance
+        return result
+
+    def continents_of_countries(self, country_names):
+        """
+        Map country names (as in the country table) to continent names, vectorized.
+
+        Args:
+            country_names (array-like): Country names, possibly repeated or missing.
+
+        Returns:
+            pandas.Series: Continent names, None for unknown countries.
+        """
+        names = pd.Series(country_names, dtype=object)
+        if self.countries is None:
+            return pd.Series(None, index=names.index, dtype=object)
+        by_name = self.countries.reset_index().drop_duplicates('name').set_index('name')['continent']
+        return names.map(by_name).map(CONTINENT_NAMES)
@@ -0,0 +1,386 @@
+# Persistent store and batched, concurrent engine for forward and reverse geocoding
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+from geopy.geocoders import Nominatim
+
+from http_utils import RateLimiter, backoff_delay, get_json, make_session
+from metrics import METRICS
+
+GOOGLE_GEOCODE_URL = "https://maps.googleapis.com/maps/api/geocode/json"
+FORWARD_COLUMNS = ['City', 'Region', 'State', 'Latitude', 'Longitude']
+REVERSE_COLUMNS = ['City', 'Region', 'State']
+
+
+def normalize_place_name(place_name):
+    """
+    Normalize an institution name so that spelling variants share one cache entry.
+
+    Args:
+        place_name (str): Raw institution name, e.g. " University  of Benin ".
+
+    Returns:
+        str: Unicode-normalized, case-folded name with collapsed whitespace and without
+             surrounding punctuation, e.g. "university of benin". None for empty names.
+    """
+    if not isinstance(place_name, str):
+        return None
+    name = unicodedata.normalize("NFKC", place_name).casefold()
+    name = re.sub(r"\s+", " ", name).strip(" .,;:-")
+    return name or None
+
+
+def coordinates_key(lat, lng, precision=4):
+    """Round coordinates (4 decimals is about 11 m) so that nearby points share a reverse lookup."""
+    return round(float(lat), precision), round(float(lng), precision)
+
+
+class GeocodeStore:
+    """
+    SQLite-backed cache of geocoding results, shared by every run and every input file.
+
+    Forward lookups are keyed by the normalized institution name and reverse lookups by rounded
+    coordinates. Places that could not be resolved are stored too, so they are not requested again.
+
+    Args:
+        path (str): SQLite database file.
+        precision (int): Number of decimals kept in the reverse lookup keys.
+    """
+
+    def __init__(self, path="Cache/geocode.sqlite", precision=4):
+        self.path = path
+        self.precision = precision
+        self.lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS forward (
+                key TEXT PRIMARY KEY, name TEXT, city TEXT, region TEXT, state TEXT,
+                latitude REAL, longitude REAL);
+            CREATE TABLE IF NOT EXISTS reverse (
+                lat REAL, lng REAL, city TEXT, region TEXT, state TEXT,
+                PRIMARY KEY (lat, lng));
+        """)
+
+    def get_forward(self, place_name):
+        """Return the cached (city, region, state, latitude, longitude) of a place, or None if unknown."""
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT city, region, state, latitude, longitude FROM forward WHERE key = ?",
+                (normalize_place_name(place_name),)).fetchone()
+        return tuple(row) if row else None
+
+    def put_forward(self, place_name, result):
+        """Store the (city, region, state, latitude, longitude) tuple of a place."""
+        with self.lock, self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO forward VALUES (?, ?, ?, ?, ?, ?, ?)",
+                              (normalize_place_name(place_name), place_name, *result))
+
+    def missing_forward(self, place_names):
+        """
+        Deduplicate place names and keep those that were never geocoded.
+
+        Args:
+            place_names (iterable): Raw institution names, possibly repeated across files.
+
+        Returns:
+            dict: Normalized key -> first raw name seen, for the places that still need a request.
+        """
+        unique = {}
+        for name in place_names:
+            key = normalize_place_name(name)
+            if key and key not in unique:
+                unique[key] = name
+        with self.lock:
+            known = {row[0] for row in self.conn.execute("SELECT key FROM forward")}
+        return {key: name for key, name in unique.items() if key not in known}
+
+    def get_forward_many(self, place_names):
+        """Return a dict normalized key -> cached forward result, for the known places among `place_names`."""
+        keys = list({normalize_place_name(name) for name in place_names} - {None})
+        found = {}
+        with self.lock:
+            for start in range(0, len(keys), 500):
+                chunk = keys[start:start + 500]
+                rows = self.conn.execute(
+                    "SELECT key, city, region, state, latitude, longitude FROM forward "
+                    f"WHERE key IN ({','.join('?' * len(chunk))})", chunk)
+                found.update((row[0], tuple(row[1:])) for row in rows)
+        return found
+
+    def get_reverse(self, lat, lng):
+        """Return the cached (city, region, state) at some coordinates, or None if unknown."""
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT city, region, state FROM reverse WHERE lat = ? AND lng = ?",
+                coordinates_key(lat, lng, self.precision)).fetchone()
+        return tuple(row) if row else None
+
+    def put_reverse(self, lat, lng, result):
+        """Store the (city, region, state) tuple found at some coordinates."""
+        with self.lock, self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO reverse VALUES (?, ?, ?, ?, ?)",
+                              (*coordinates_key(lat, lng, self.precision), *result))
+
+    def close(self):
+        self.conn.close()
+
+
+class GeocodingBackend:
+    """
+    Interface of the geocoding services used by `geocode_batch` and `reverse_geocode_batch`.
+
+    `geocode` and `reverse` return None when the place does not exist and raise an exception on
+    transient failures (network errors, quotas), so that failures are retried and never cached.
+    """
+
+    def geocode(self, place_name):
+        """Return (city, region, state, latitude, longitude) for a place name, or None."""
+        raise NotImplementedError
+
+    def reverse(self, lat, lng):
+        """Return (city, region, state) for coordinates, or None."""
+        raise NotImplementedError
+
+
+def parse_google_components(components):
+    """Extract (city, region, state) from the address components of a Google Geocoding result."""
+    city = None
+    region = None
+    state = None
+    for component in components:
+        if "locality" in component['types']:
+            city = component['long_name']
+        if not city and "postal_town" in component['types']:
+            city = component['long_name']
+        if "administrative_area_level_1" in component['types']:
+            region = component['long_name']
+        if "country" in component['types']:
+            state = component['long_name']
+    return city, region, state
+
+
+class GoogleBackend(GeocodingBackend):
+    """
+    Google Maps Geocoding API.
+
+    Args:
+        api_key (str): Your Google Maps API key.
+        timeout (float): Timeout of each request, in seconds.
+    """
+
+    def __init__(self, api_key, timeout=30, pool_size=10):
+        self.api_key = api_key
+        self.timeout = timeout
+        self.session = make_session(pool_size=pool_size)
+
+    def _results(self, params):
+        # HTTP-level retries are left to the batch engine, which owns the retry budget
+        data = get_json(self.session, GOOGLE_GEOCODE_URL, params={**params, "key": self.api_key},
+                        max_retries=0, timeout=self.timeout)
+        # Only ZERO_RESULTS means the place does not exist. Any other status (quota, denied key,
+        # invalid request) is a failure, raised so that it is retried and never cached as "not found"
+        status = data.get('status')
+        if status == 'ZERO_RESULTS':
+            return []
+        if status != 'OK':
+            raise RuntimeError(f"Google geocoding failed: {status} {data.get('error_message', '')}".rstrip())
+        return data.get('results', [])
+
+    def geocode(self, place_name):
+        results = self._results({"address": place_name})
+        if not results:
+            return None
+        location = results[0]["geometry"]["location"]
+        return (*parse_google_components(results[0]['address_components']), location["lat"], location["lng"])
+
+    def reverse(self, lat, lng):
+        results = self._results({"latlng": f"{lat},{lng}"})
+        if not results:
+            return None
+        return parse_google_components(results[0]['address_components'])
+
+
+class NominatimBackend(GeocodingBackend):
+    """
+    OpenStreetMap Nominatim through geopy. The public instance allows about one request per second.
+
+    Args:
+        user_agent (str): Application name sent to Nominatim, as required by its usage policy.
+        timeout (float): Timeout of each request, in seconds.
+    """
+
+    def __init__(self, user_agent="novelty-components-of-scientific-productions", timeout=30):
+        self.geolocator = Nominatim(user_agent=user_agent, timeout=timeout)
+
+    @staticmethod
+    def _address(location):
+        address = location.raw.get('address', {})
+        city = address.get('city') or address.get('town') or address.get('village')
+        return city, address.get('state'), address.get('country')
+
+    def geocode(self, place_name):
+        location = self.geolocator.geocode(place_name, addressdetails=True, language='en')
+        if location is None:
+            return None
+        return (*self._address(location), location.latitude, location.longitude)
+
+    def reverse(self, lat, lng):
+        location = self.geolocator.reverse((lat, lng), addressdetails=True, language='en')
+        if location is None:
+            return None
+        return self._address(location)
+
+
+class StubBackend(GeocodingBackend):
+    """
+    Offline backend answering from dictionaries, for tests and dry runs.
+
+    Args:
+        places (dict): Normalized place name -> (city, region, state, latitude, longitude).
+        coordinates (dict): Rounded (lat, lng) -> (city, region, state).
+    """
+
+    def __init__(self, places=None, coordinates=None):
+        self.places = places or {}
+        self.coordinates = coordinates or {}
+        self.calls = 0
+
+    def geocode(self, place_name):
+        self.calls += 1
+        return self.places.get(normalize_place_name(place_name))
+
+    def reverse(self, lat, lng):
+        self.calls += 1
+        return self.coordinates.get(coordinates_key(lat, lng))
+
+
+def record_lookup(service, seconds, outcome, retries=0):
+    """Record one geocoding lookup (outcome, latency and retries), apart from the HTTP requests it sent."""
+    METRICS.count("geocode.lookups", service=service, outcome=outcome)
+    if retries:
+        METRICS.count("geocode.retries", retries, service=service)
+    METRICS.observe("geocode.latency", seconds, service=service)
+
+
+def _run_batch(function, arguments, max_workers, rate_limit, max_retries, backoff, service="geocoding"):
+    """
+    Call `function(*args)` for every tuple of `arguments` in a thread pool.
+
+    Each call is recorded in the run metrics as a lookup of `service`, with its outcome, latency and
+    retries. The HTTP requests themselves are counted by `http_utils.get_json` when the backend uses it.
+
+    Returns:
+        list: One result per argument tuple, with `False` for the calls that still failed after the retries.
+    """
+    limiter = RateLimiter(rate_limit)
+
+    def call(args):
+        start = time.perf_counter()
+        for attempt in range(max_retries + 1):
+            limiter.acquire()
+            try:
+                result = function(*args)
+                record_lookup(service, time.perf_counter() - start, "found" if result else "not_found", attempt)
+                return result
+            except Exception as e:
+                if attempt == max_retries:
+                    record_lookup(service, time.perf_counter() - start, type(e).__name__, attempt)
+                    print(f"Geocoding failed for {args}: {e}")
+                    return False
+                time.sleep(backoff_delay(attempt, backoff))
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(call, arguments))
+
+
+def geocode_batch(place_names, backend, store=None, max_workers=8, rate_limit=10, max_retries=3, backoff=1.0):
+    """
+    Forward-geocode a batch of place names, requesting each distinct normalized name once.
+
+    Args:
+        place_names (iterable): Raw institution names, possibly repeated.
+        backend (GeocodingBackend): Geocoding service.
+        store (GeocodeStore): Optional persistent cache; only the unknown places are requested.
+        max_workers (int): Number of concurrent requests.
+        rate_limit (float): Maximum number of requests per second.
+        max_retries (int): Number of retries of a failing request.
+        backoff (float): Base delay of the jittered exponential backoff, in seconds.
+
+    Returns:
+        pandas.DataFrame: Indexed by normalized name ('key'), with columns City, Region, State,
+                          Latitude and Longitude. Places that failed are left out and retried on the next run.
+    """
+    unique = {}
+    for name in place_names:
+        key = normalize_place_name(name)
+        if key and key not in unique:
+            unique[key] = name
+    known = store.get_forward_many(unique.values()) if store is not None else {}
+    missing = [(key, name) for key, name in unique.items() if key not in known]
+    print(f"Geocoding {len(missing)} new places ({len(unique)} distinct, {len(known)} cached)")
+    METRICS.count("geocode_cache.hits", len(known), kind="forward")
+    METRICS.count("geocode_cache.misses", len(missing), kind="forward")
+
+    results = _run_batch(backend.geocode, [(name,) for _, name in missing],
+                         max_workers, rate_limit, max_retries, backoff, service=f"{type(backend).__name__}.geocode")
+    resolved = dict(known)
+    for (key, name), result in zip(missing, results):
+        if result is False:
+            continue
+        result = result or (None,) * len(FORWARD_COLUMNS)
+        resolved[key] = result
+        if store is not None:
+            store.put_forward(name, result)
+
+    table = pd.DataFrame.from_dict(resolved, orient='index', columns=FORWARD_COLUMNS)
+    table.index.name = 'key'
+    return table
+
+
+def reverse_geocode_batch(coordinates, backend, store=None, max_workers=8, rate_limit=10, max_retries=3, backoff=1.0):
+    """
+    Reverse-geocode a batch of coordinates, requesting each distinct rounded point once.
+
+    Args:
+        coordinates (iterable): (latitude, longitude) pairs, possibly repeated.
+        backend (GeocodingBackend): Geocoding service.
+        store (GeocodeStore): Optional persistent cache; only the unknown points are requested.
+        max_workers, rate_limit, max_retries, backoff: See `geocode_batch`.
+
+    Returns:
+        pandas.DataFrame: Indexed by the rounded ('lat_key', 'lng_key'), with columns City, Region and State.
+    """
+    precision = store.precision if store is not None else 4
+    unique = list(dict.fromkeys(coordinates_key(lat, lng, precision) for lat, lng in coordinates))
+    resolved = {}
+    missing = []
+    for point in unique:
+        cached = store.get_reverse(*point) if store is not None else None
+        if cached is None:
+            missing.append(point)
+        else:
+            resolved[point] = cached
+    print(f"Reverse geocoding {len(missing)} new points ({len(unique)} distinct)")
+    METRICS.count("geocode_cache.hits", len(resolved), kind="reverse")
+    METRICS.count("geocode_cache.misses", len(missing), kind="reverse")
+
+    results = _run_batch(backend.reverse, missing, max_workers, rate_limit, max_retries, backoff,
+                         service=f"{type(backend).__name__}.reverse")
+    for point, result in zip(missing, results):
+        if result is False:
+            continue
+        result = result or (None,) * len(REVERSE_COLUMNS)
+        resolved[point] = result
+        if store is not None:
+            store.put_reverse(*point, result)
+
+    table = pd.DataFrame([(*point, *result) for point, result in resolved.items()],
+                         columns=['lat_key', 'lng_key', *REVERSE_COLUMNS])
+    return table.set_index(['lat_key', 'lng_key'])
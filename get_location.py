@@ -1,11 +1,25 @@
 import os
-import requests
 import pandas as pd
 import pycountry_convert as pc
-from geopy.geocoders import Nominatim
+from geocoding import (GeocodeStore, GoogleBackend, NominatimBackend, coordinates_key,
+                       geocode_batch, normalize_place_name, reverse_geocode_batch)
+from gazetteer import CITIES_FILE, CONTINENT_NAMES, Gazetteer
+from manifest import StageManifest, file_digest, fingerprint
+from metrics import METRICS
+from storage import export_csv, read_legacy_csv, read_table, write_table
 
 API_KEY = ''
 
+# Also export the results as CSV (e.g. for Power BI); the Parquet files are always written
+EXPORT_CSV = True
+
+# Folder of the GeoNames dump files (cities15000.txt, admin1CodesASCII.txt, countryInfo.txt) of the
+# offline reverse geocoder; without them the reverse lookups go to the geocoding service
+GAZETTEER_DIR = "Data/geonames"
+
+# Concurrency and retry settings of the geocoding engine
+GEOCODING_OPTIONS = {"max_workers": 8, "rate_limit": 10, "max_retries": 3, "backoff": 1.0}
+
 def get_city_state(place_name):
 
     """
@@ -13,37 +27,16 @@ def get_city_state(place_name):
 
     Args:
         place_name (str): The name of the place to geocode.
-        api_key (str): Your Google Maps API key.
 
     Returns:
         tuple: A tuple containing city (str), region (str), state (str), latitude (float), longitude (float).
                Returns (None, None, None, None, None) if the place is not found or an error occurs.
     """
 
-    base_url = "https://maps.googleapis.com/maps/api/geocode/json"
-    params = {"address": place_name, "key": API_KEY}
-    response = requests.get(base_url, params=params)
-    if response.status_code == 200:
-        data = response.json()
-        if data['results']:
-            city = None
-            region = None
-            state = None
-            latitude = None
-            longitude = None
-            for component in data['results'][0]['address_components']:
-                if "locality" in component['types']:
-                    city = component['long_name']
-                if not city and "postal_town" in component['types']:
-                    city = component['long_name']
-                if "administrative_area_level_1" in component['types']:
-                    region = component['long_name']
-                if "country" in component['types']:
-                    state = component['long_name']
-                latitude = data["results"][0]["geometry"]["location"]["lat"]
-                longitude = data["results"][0]["geometry"]["location"]["lng"]
-            return city, region, state, latitude, longitude
-    return None, None, None, None, None
+    try:
+        return GoogleBackend(API_KEY).geocode(place_name) or (None, None, None, None, None)
+    except Exception:
+        return None, None, None, None, None
 
 def get_city_from_coordinates(lat, lng):
 
@@ -53,34 +46,16 @@ def get_city_from_coordinates(lat, lng):
     Args:
         lat (float): The latitude of the location.
         lng (float): The longitude of the location.
-        api_key (str): Your Google Maps API key.
 
     Returns:
         tuple: A tuple containing city (str), region (str), and state (str).
             Returns (None, None, None) if the location is not found or an error occurs.
     """
 
-    base_url = "https://maps.googleapis.com/maps/api/geocode/json"
-    params = {"latlng": f"{lat},{lng}", "key": API_KEY}  # Latitudine e Longitudine
-    response = requests.get(base_url, params=params)
-    if response.status_code == 200:
-        data = response.json()
-        if data['results']:
-            city = None
-            region = None
-            state = None
-            for result in data['results']:
-                for component in result['address_components']:
-                    if "locality" in component['types']:
-                        city = component['long_name']
-                    if not city and "postal_town" in component['types']:
-                        city = component['long_name']
-                    if "administrative_area_level_1" in component['types']:
-                        region = component['long_name']
-                    if "country" in component['types']:
-                        state = component['long_name']
-                return city, region, state
-    return None, None, None
+    try:
+        return GoogleBackend(API_KEY).reverse(lat, lng) or (None, None, None)
+    except Exception:
+        return None, None, None
 
 def get_continent_from_country(country_name):
 
@@ -92,95 +67,377 @@ def get_continent_from_country(country_name):
 
     Returns:
         str: The name of the continent (e.g., "Africa", "Asia", "Europe").
-            Returns None if the country name is invalid or an error occurs.
+            Returns None if the country name is unknown.
     """
 
     try:
         country_code = pc.country_name_to_country_alpha2(country_name)
         continent_code = pc.country_alpha2_to_continent_code(country_code)
-        continent_name = {
-            "AF": "Africa",
-            "AS": "Asia",
-            "EU": "Europe",
-            "NA": "North America",
-            "SA": "South America",
-            "OC": "Oceania",
-            "AN": "Antarctica"
-        }
-        return continent_name.get(continent_code, None)
-    except Exception as e:
+        return CONTINENT_NAMES.get(continent_code, None)
+    except KeyError:
+        # pycountry_convert raises KeyError for names and codes it does not know
         return None
 
+def continents_from_countries(countries, gazetteer=None):
+    """
+    Map a column of country names to continent names, looking up each distinct name once.
+
+    Args:
+        countries (pandas.Series): Country names, possibly repeated or missing.
+        gazetteer (Gazetteer): Optional offline country table, tried before pycountry_convert.
+
+    Returns:
+        pandas.Series: Continent names, aligned with `countries`.
+    """
+    unique = pd.Series(countries.dropna().unique(), dtype=object)
+    found = gazetteer.continents_of_countries(unique) if gazetteer is not None else pd.Series(None, index=unique.index, dtype=object)
+    mapping = {name: continent if isinstance(continent, str) else get_continent_from_country(name)
+               for name, continent in zip(unique, found)}
+    return countries.map(mapping)
+
+def load_gazetteer(directory=None):
+    """
+    Load the offline gazetteer (GeoNames dump files) if it is available.
+
+    Args:
+        directory (str): Folder of the GeoNames files (`GAZETTEER_DIR` by default).
+
+    Returns:
+        Gazetteer: The gazetteer, or None if the cities file is missing.
+    """
+    directory = directory or GAZETTEER_DIR
+    if not os.path.exists(os.path.join(directory, CITIES_FILE)):
+        return None
+    return Gazetteer.load(directory)
+
+def load_novelty_file(file_path):
+    """
+    Load a novelty table with its 'authors', 'institutions' and 'authorships' columns as lists.
+
+    Args:
+        file_path (str): Path of a `DF_*.parquet` file written by `get_novelty.py`, or of an older `DF_*.csv`.
+
+    Returns:
+        pandas.DataFrame: The novelty table with list columns.
+    """
+    if file_path.endswith(".parquet"):
+        # Parquet stores typed list columns, no parsing needed
+        return read_table(file_path, columns=['PMID', 'year', 'authors', 'institutions', 'authorships'])
+    # Older CSV files store the lists as strings, parsed with ast.literal_eval
+    return read_legacy_csv(file_path)
+
+def list_novelty_files(folder):
+    """
+    List the novelty tables of a folder, preferring the Parquet file when a query also has a CSV export.
+
+    Args:
+        folder (str): Folder holding `DF_*.parquet` and/or `DF_*.csv` files.
+
+    Returns:
+        dict: Table name (e.g. "DF_SDG 3") -> file path.
+    """
+    files = {}
+    for filename in sorted(os.listdir(folder)):
+        name, extension = os.path.splitext(filename)
+        if extension == ".parquet" or (extension == ".csv" and name not in files):
+            files[name] = os.path.join(folder, filename)
+    return files
+
+# Columns of the flattened author table
+AUTHOR_COLUMNS = ['PMID', 'Year', 'Author_Position', 'Author', 'Institution_ID', 'Institution']
+
+def flatten_authors(df):
+    """
+    Flatten the authors and their institutions into a row-wise format.
+
+    The rows come from the structured 'authorships' column (one entry per author-institution pair),
+    exploded and expanded with vectorized operations. Tables written before that column existed
+    fall back to pairing 'authors' and 'institutions' by position.
+
+    Args:
+        df (pandas.DataFrame): Novelty table with the list column 'authorships', or 'authors' and 'institutions'.
+
+    Returns:
+        pandas.DataFrame: One row per author-institution pair, with 'PMID', 'Year', 'Author_Position',
+                          'Author', 'Institution_ID' and 'Institution'.
+    """
+    if 'authorships' not in df.columns:
+        return flatten_legacy_authors(df)
+    exploded = df[['PMID', 'year', 'authorships']].explode('authorships', ignore_index=True)
+    exploded = exploded[exploded['authorships'].notna()].reset_index(drop=True)
+    fields = pd.DataFrame(exploded['authorships'].tolist(),
+                          columns=['author_position', 'author', 'institution_id', 'institution_name'])
+    return pd.DataFrame({
+        'PMID': exploded['PMID'],
+        'Year': exploded['year'],
+        'Author_Position': fields['author_position'],
+        'Author': fields['author'].str.strip(),
+        'Institution_ID': fields['institution_id'],
+        'Institution': fields['institution_name'].str.strip()
+    }, columns=AUTHOR_COLUMNS)
+
+def flatten_legacy_authors(df):
+    """
+    Flatten a table without 'authorships', pairing the i-th author with the i-th institution.
+
+    The flat lists of these tables do not record which author each institution belongs to, so the
+    pairing is only right when every author has exactly one affiliation.
+
+    Args:
+        df (pandas.DataFrame): Novelty table with list columns 'authors' and 'institutions'.
+
+    Returns:
+        pandas.DataFrame: Same columns as `flatten_authors`, with empty 'Institution_ID'.
+    """
+    df = df.reset_index(drop=True)
+    authors = df[['PMID', 'year', 'authors']].explode('authors').dropna(subset=['authors'])
+    authors['Author_Position'] = authors.groupby(level=0).cumcount()
+    institutions = df[['institutions']].explode('institutions').dropna(subset=['institutions'])
+    institutions['Author_Position'] = institutions.groupby(level=0).cumcount()
+    df_authors = authors.reset_index().merge(institutions.reset_index(), on=['index', 'Author_Position'], how='left')
+    institution = df_authors['institutions'].str.strip()
+    return pd.DataFrame({
+        'PMID': df_authors['PMID'],
+        'Year': df_authors['year'],
+        'Author_Position': df_authors['Author_Position'],
+        'Author': df_authors['authors'].str.strip(),
+        'Institution_ID': None,
+        'Institution': institution.mask(institution == '')
+    }, columns=AUTHOR_COLUMNS)
+
+def add_locations(df_authors, backend, store=None, gazetteer=None):
+    """
+    Geocode the distinct institutions of an author table and join the results back with vectorized merges.
+
+    Args:
+        df_authors (pandas.DataFrame): Output of `flatten_authors`, possibly covering several files.
+        backend (GeocodingBackend): Geocoding service (Google, Nominatim or a stub).
+        store (GeocodeStore): Optional persistent cache; only unknown places and points are requested.
+        gazetteer (Gazetteer): Optional offline reverse geocoder. When given, the missing details are
+                               filled from the nearest city of every point, without any request.
+
+    Returns:
+        pandas.DataFrame: The author table with City, Region, State, Latitude, Longitude and Continent columns.
+    """
+    # Populate location data for each institution, geocoding each distinct normalized name once.
+    forward = geocode_batch(df_authors['Institution'].dropna(), backend, store, **GEOCODING_OPTIONS)
+    df_authors = df_authors.reset_index(drop=True)
+    keys = df_authors['Institution'].map(normalize_place_name)
+    df_authors = df_authors.join(forward, on=keys.rename('key'))
+
+    # Validate and enrich location data with reverse lookups, only for rows missing some detail.
+    has_coords = df_authors['Latitude'].notna() & df_authors['Longitude'].notna()
+    incomplete = df_authors[['City', 'Region', 'State']].isna().any(axis=1)
+    todo = df_authors[has_coords & incomplete]
+    nearest = None
+    if gazetteer is not None:
+        # Offline pass: nearest city of every point, in one vectorized KD-tree query
+        located = df_authors[has_coords]
+        nearest = gazetteer.reverse(located['Latitude'], located['Longitude']).set_axis(located.index)
+        for column in ['City', 'Region', 'State']:
+            df_authors[column] = df_authors[column].fillna(nearest[column])
+    elif len(todo):
+        reverse = reverse_geocode_batch(zip(todo['Latitude'], todo['Longitude']), backend, store, **GEOCODING_OPTIONS)
+        precision = store.precision if store is not None else 4
+        points = pd.MultiIndex.from_tuples(
+            [coordinates_key(lat, lng, precision) for lat, lng in zip(todo['Latitude'], todo['Longitude'])])
+        found = reverse.reindex(points).set_axis(todo.index)
+        for column in ['City', 'Region', 'State']:
+            df_authors[column] = df_authors[column].fillna(found[column])
+
+    # Continent of each institution's country, each distinct country looked up once
+    df_authors['Continent'] = continents_from_countries(df_authors['State'], gazetteer)
+    if nearest is not None:
+        df_authors['Continent'] = df_authors['Continent'].fillna(nearest['Continent'])
+    return df_authors
+
 ##################
 ##################
 
+def make_backend():
+    """
+    Pluggable geocoding service: GoogleBackend(API_KEY) when a key is set, NominatimBackend() otherwise
+    (or a StubBackend(...) for offline tests).
+    """
+    if API_KEY:
+        return GoogleBackend(API_KEY)
+    # The public Nominatim instance allows one request per second
+    GEOCODING_OPTIONS.update(max_workers=1, rate_limit=1)
+    return NominatimBackend()
+
+def save_locations(df_authors, name, destination_folder):
+    """
+    Save an enriched author table to the destination folder, as Parquet plus an optional CSV export.
+
+    Returns:
+        list: Paths of the written files.
+    """
+    paths = [os.path.join(destination_folder, f"{name}.parquet")]
+    write_table(df_authors, paths[0], sdg=name[len("DF_"):])
+    if EXPORT_CSV:
+        paths.append(os.path.join(destination_folder, f"{name}.csv"))
+        export_csv(df_authors, paths[1])
+    print(f"File {name} elaborated and saved in {destination_folder}")
+    return paths
+
+def geocode_fingerprint(file_path, backend, destination_folder, gazetteer=None):
+    """
+    Fingerprint of the location stage of a novelty table: its content, the geocoding service,
+    the size of the gazetteer and the output folder.
+    """
+    return fingerprint(file_digest(file_path), type(backend).__name__, len(gazetteer) if gazetteer is not None else None,
+                       os.path.abspath(destination_folder), EXPORT_CSV)
+
+def locate_file(file_path, destination_folder, backend, store=None, manifest=None, gazetteer=None):
+    """
+    Run the location stage on a single novelty table, e.g. as soon as it has been written.
+
+    Args:
+        file_path (str): Path of a `DF_*.parquet` (or older `DF_*.csv`) novelty table.
+        destination_folder (str): Folder of the enriched tables.
+        backend (GeocodingBackend): Geocoding service.
+        store (GeocodeStore): Persistent cache shared by all files; places already resolved for
+                              another file are not requested again.
+        manifest (StageManifest): Record of the completed stages; a table already enriched from
+                                  the same content is skipped.
+        gazetteer (Gazetteer): Optional offline reverse geocoder, see `add_locations`.
+
+    Returns:
+        str: Path of the enriched Parquet table.
+    """
+    name = os.path.splitext(os.path.basename(file_path))[0]
+    stage_fingerprint = geocode_fingerprint(file_path, backend, destination_folder, gazetteer) if manifest else None
+    if manifest and manifest.is_current("geocode", name, stage_fingerprint):
+        print(f"File {name} unchanged, skipping")
+        return os.path.join(destination_folder, f"{name}.parquet")
+    with METRICS.stage("flatten", file=name):
+        df_authors = flatten_authors(load_novelty_file(file_path))
+    with METRICS.stage("geocode", file=name):
+        df_authors = add_locations(df_authors, backend, store, gazetteer)
+    paths = save_locations(df_authors, name, destination_folder)
+    if manifest:
+        manifest.record("geocode", name, stage_fingerprint, outputs=paths, rows=len(df_authors))
+    return paths[0]
+
+def locate_files(file_paths, destination_folder, backend, store=None, manifest=None, gazetteer=None):
+    """
+    Run the location stage on several novelty tables, geocoding their institutions in one batch.
+
+    Args:
+        file_paths (dict): Name of each table (e.g. "DF_No Poverty") mapped to its path.
+        destination_folder (str): Folder of the enriched tables.
+        backend (GeocodingBackend): Geocoding service.
+        store (GeocodeStore): Persistent geocode cache.
+        manifest (StageManifest): Record of the completed stages; the tables already enriched from
+                                  the same content are skipped.
+        gazetteer (Gazetteer): Optional offline reverse geocoder, see `add_locations`.
+
+    Returns:
+        dict: Name of each table mapped to the path of its enriched Parquet table.
+    """
+    outputs = {}
+    pending = {}
+    for name, file_path in file_paths.items():
+        stage_fingerprint = geocode_fingerprint(file_path, backend, destination_folder, gazetteer) if manifest else None
+        if manifest and manifest.is_current("geocode", name, stage_fingerprint):
+            print(f"File {name} unchanged, skipping")
+            outputs[name] = os.path.join(destination_folder, f"{name}.parquet")
+        else:
+            pending[name] = (file_path, stage_fingerprint)
+    if not pending:
+        return outputs
+
+    # Take the novelty tables from the DataFrame folder and flatten their authors into one table.
+    with METRICS.stage("flatten"):
+        tables = {name: flatten_authors(load_novelty_file(file_path)) for name, (file_path, _) in pending.items()}
+    df_all = pd.concat(tables, names=['file', None]).reset_index(level='file')
+
+    # Geocode the distinct institutions and points of all files in one batch.
+    with METRICS.stage("geocode"):
+        df_all = add_locations(df_all, backend, store, gazetteer)
+
+    groups = dict(tuple(df_all.groupby('file', sort=False)))
+    for name, (_, stage_fingerprint) in pending.items():
+        # A table without any author still gets its (empty) output, and is recorded so that it is not redone
+        df_authors = groups.get(name, df_all.iloc[:0]).drop(columns='file')
+        paths = save_locations(df_authors, name, destination_folder)
+        outputs[name] = paths[0]
+        if manifest:
+            manifest.record("geocode", name, stage_fingerprint, outputs=paths, rows=len(df_authors))
+    return outputs
+
+def locate_works(works_path, backend, store=None, manifest=None, gazetteer=None, destination=None):
+    """
+    Run the location stage once over the shared table of unique works (see `get_novelty.build_corpus`).
+
+    A work matched by several queries is flattened and geocoded once; the location table of each
+    query is then a view of the result (see `write_location_view`).
+
+    Args:
+        works_path (str): Path of the works table.
+        backend (GeocodingBackend): Geocoding service.
+        store (GeocodeStore): Persistent geocode cache.
+        manifest (StageManifest): Record of the completed stages; the stage is skipped when the
+                                  works table did not change.
+        gazetteer (Gazetteer): Optional offline reverse geocoder, see `add_locations`.
+        destination (str): Path of the location table (`locations.parquet` next to the works table by default).
+
+    Returns:
+        str: Path of the location table.
+    """
+    destination = destination or os.path.join(os.path.dirname(works_path), "locations.parquet")
+    stage_fingerprint = geocode_fingerprint(works_path, backend, destination, gazetteer) if manifest else None
+    if manifest and manifest.is_current("geocode", "works", stage_fingerprint):
+        print("Works unchanged, keeping their locations")
+        return destination
+    with METRICS.stage("flatten", file="works"):
+        df_authors = flatten_authors(load_novelty_file(works_path))
+    with METRICS.stage("geocode", file="works"):
+        df_authors = add_locations(df_authors, backend, store, gazetteer)
+    write_table(df_authors, destination)
+    if manifest:
+        manifest.record("geocode", "works", stage_fingerprint, outputs=[destination], rows=len(df_authors))
+    return destination
+
+def write_location_view(locations_path, novelty_path, destination_folder, manifest=None):
+    """
+    Write the location table of one query: the rows of the shared location table for the works of its novelty table.
+
+    Args:
+        locations_path (str): Location table of all works, written by `locate_works`.
+        novelty_path (str): Novelty table of the query (`DF_*.parquet`).
+        destination_folder (str): Folder of the per-query location tables.
+        manifest (StageManifest): Record of the completed stages; an unchanged view is not rewritten.
+
+    Returns:
+        str: Path of the Parquet view.
+    """
+    name = os.path.splitext(os.path.basename(novelty_path))[0]
+    stage_fingerprint = fingerprint(file_digest(locations_path), file_digest(novelty_path),
+                                    os.path.abspath(destination_folder), EXPORT_CSV)
+    if manifest and manifest.is_current("location_view", name, stage_fingerprint):
+        return os.path.join(destination_folder, f"{name}.parquet")
+    pmids = read_table(novelty_path, columns=['PMID'])['PMID']
+    paths = save_locations(read_table(locations_path, pmids=pmids), name, destination_folder)
+    if manifest:
+        manifest.record("location_view", name, stage_fingerprint, outputs=paths)
+    return paths[0]
+
 source_folder = "Novelty-components-of-scientific-productions/DataFrames/"
 destination_folder = "Novelty-components-of-scientific-productions/DataFrames_to_PBI/"
 
-# Take the .csv files from the DataFrame folder.
-for filename in os.listdir(source_folder):
-    if filename.endswith(".csv"):
-        file_path = os.path.join(source_folder, filename)
-        df = pd.read_csv(file_path)
-
-        # Convert 'authors' and 'institutions' columns from strings to lists.
-        # The columns are stored as string representations of lists; 'eval' is used to parse them into actual lists.
-        df['authors'] = df['authors'].apply(lambda x: eval(x))
-        df['institutions'] = df['institutions'].apply(lambda x: eval(x))
-        
-        # Flatten the authors and their institutions into a row-wise format.
-        # Each author-institution pair is extracted into a separate row in the new dataframe.
-        rows = []
-        for _, row in df.iterrows():
-            authors = row['authors']
-            institutions = row['institutions'] if row['institutions'] else [None] * len(authors)
-            for author, institution in zip(authors, institutions):
-                rows.append({
-                    'PMID': row['PMID'],
-                    'Year': row['year'],
-                    'Author': author.strip(),
-                    'Institution': institution.strip() if institution else None
-                })
-        df_authors = pd.DataFrame(rows)
-        
-        # Add placeholder columns for location information.
-        # These columns will store the city, region, state, latitude, and longitude based on the institution's address.
-        df_authors['City'] = None
-        df_authors['Region'] = None
-        df_authors['State'] = None
-        df_authors['Latitude'] = None
-        df_authors['Longitude'] = None
-        
-        # Populate location data for each institution using the `get_city_state` function.
-        # If an institution address exists, fetch its location details and update the corresponding columns.
-        for i in range(len(df_authors)):
-            if df_authors.loc[i, 'Institution']:
-                place_name = df_authors.loc[i, 'Institution']
-                city, region, state, latitude, longitude = get_city_state(place_name)
-                df_authors.loc[i, 'City'] = city
-                df_authors.loc[i, 'Region'] = region
-                df_authors.loc[i, 'State'] = state
-                df_authors.loc[i, 'Latitude'] = latitude
-                df_authors.loc[i, 'Longitude'] = longitude
-        
-        # Validate and enrich location data using the `get_city_from_coordinates` function.
-        # For rows with valid latitude and longitude, fetch additional location details if missing.
-        for i in range(len(df_authors)):
-            lat = df_authors.loc[i, 'Latitude']
-            lng = df_authors.loc[i, 'Longitude']
-            if pd.notna(lat) and pd.notna(lng):
-                city, region, state = get_city_from_coordinates(lat, lng)
-                if not df_authors.loc[i, 'City']:
-                    df_authors.loc[i, 'City'] = city
-                if not df_authors.loc[i, 'Region']:
-                    df_authors.loc[i, 'Region'] = region
-                if not df_authors.loc[i, 'State']:
-                    df_authors.loc[i, 'State'] = state
-        
-        # Save the updated dataframe to the destination folder.
-        # Export the dataframe to a CSV file after processing and print a preview of the first row.
-        dest_path = os.path.join(destination_folder, filename)
-        df_authors.to_csv(dest_path, encoding='utf-8', index=False)
-        print(f"File {filename} elaborated and saved in {destination_folder}")
-
-print("Complete!")
+if __name__ == "__main__":
+    # Persistent geocode store, shared by all files and all runs
+    store = GeocodeStore("Cache/geocode.sqlite")
+    backend = make_backend()
+    # Offline reverse geocoder, replacing the second network pass when the GeoNames files are present
+    gazetteer = load_gazetteer()
+
+    # Only the tables whose content changed since their last run are geocoded again
+    manifest = StageManifest("Cache/manifest")
+    locate_files(list_novelty_files(source_folder), destination_folder, backend, store, manifest, gazetteer)
+
+    store.close()
+    # Run report (timings, memory, request and cache counters) and timeline of the stages
+    METRICS.save_run("location")
+    print("Complete!")
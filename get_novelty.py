@@ -1,373 +1,783 @@
-# Import packages for Lee Commonness and data manipulation
-import pandas as pd
-import numpy as np
-import json
-import os
-import requests
-import hashlib
-import novelpy
-import tqdm
-import csv
-import shutil
-
-# Function to retrieve top-cited articles from OpenAlex API
-def get_top_cited_openalex_data(query, num_results=800):
-    """
-    Récupère les articles OpenAlex les plus cités pour une requête donnée.
-
-    Args:
-        query (str): La requête de recherche.
-        num_results (int): Nombre total d'articles à récupérer.
-
-    Returns:
-        list: Liste des articles triés par nombre de citations décroissant.
-    """
-    # Base URL of the OpenAlex API endpoint
-    base_url = "https://api.openalex.org/works"
-    results = []
-    per_page = 200 # Number of results per API page
-
-    # Loop through pages to collect data until the desired count is reached
-    for offset in range(0, num_results, per_page):
-        response = requests.get(
-            f"{base_url}?filter=title.search:{query},from_publication_date:2016-01-01,to_publication_date:2024-12-31"
-            f"&sort=cited_by_count:desc&per-page={per_page}&page={offset // per_page + 1}"
-        )
-        
-        if response.status_code == 200:
-            # Add results from this page to the cumulative results list
-            data = response.json().get('results', [])
-            results.extend(data)
-        else:
-            # Print an error message if the API request fails and stop the loop
-            print(f"Erreur : {response.status_code}")
-            break
-
-        if len(data) < per_page:
-            # If fewer results than expected are returned, stop fetching more
-            break
-
-    return results[:num_results]
-
-def generate_int_id(string_id):
-    """Generate a unique integer ID from a string ID using hashing"""
-    return int(hashlib.sha256(string_id.encode('utf-8')).hexdigest(), 16) % (10**8)
-
-def prepare_data_for_novelpy(data):
-    """
-    Prepare OpenAlex data for analysis by extracting relevant fields.
-    
-    Args:
-        data (list): List of OpenAlex works data.
-    
-    Returns:
-        list: Processed data entries with standardized fields.
-    """
-    prepared_data = []
-
-    for item in data:
-        try:
-            # Ensure the item contains a unique identifier
-            if 'id' not in item:
-                print(f"Skipping item without id: {item}")
-                continue
-            
-            # Filter out items outside the date range
-            year = item.get('publication_year', None)
-            if year is None or not (2016 <= year <= 2024):
-                print(f"Skipping item outside date range: {item['id']}")
-                continue
-            
-            # Extract authors and institutions
-            authorships = item.get('authorships', [])
-            authors = [author['author']['display_name'] for author in authorships]
-            institutions = []
-            for author in authorships:
-                if 'institutions' in author:
-                    for inst in author['institutions']:
-                        institutions.append(inst.get('display_name', ''))
-
-            # Extract additional optional fields, with a default for missing data
-            keyword_analysis = item.get('keyword_analysis', 'Missing')
-            collaborative_index = item.get('collaborative_index', 'Missing')
-            license_info = item.get('license', 'Missing')
-            journal_impact_factor = item.get('journal_impact_factor', 'Missing')
-            citations_geographical = item.get('citations_geographical', 'Missing')
-            page_count = item.get('page_count', 'Missing')
-            publisher = item.get('host_venue', {}).get('publisher', 'Missing')
-            apc_paid = item.get('apc_paid', 'Missing')
-            open_access_status = item.get('open_access', {}).get('status', 'Missing')
-
-            # Construct the processed data entry
-            entry = {
-                "PMID": generate_int_id(item['id']),
-                "year": year,
-                "type": item.get('type', ''),
-                "num_citations": item.get('cited_by_count', 0),
-                "num_authors": len(authorships),
-                "authors": authors,
-                "institutions": institutions,
-                "c04_referencelist": [{"item": generate_int_id(ref)} for ref in item.get('referenced_works', [])],
-                "subfield": item.get('concepts', [{}])[0].get('display_name', '') if item.get('concepts') else '',
-                "field": item.get('concepts', [{}])[1].get('display_name', '') if len(item.get('concepts', [])) > 1 else '',
-                "domain": item.get('concepts', [{}])[2].get('display_name', '') if len(item.get('concepts', [])) > 2 else '',
-                "sustainable_development_goals": item.get('sustainable_development_goals', []),
-                "keyword_analysis": keyword_analysis,
-                "collaborative_index": collaborative_index,
-                "license": license_info,
-                "journal_impact_factor": journal_impact_factor,
-                "citations_geographical": citations_geographical,
-                "page_count": page_count,
-                "publisher": publisher,
-                "apc_paid": apc_paid,
-                "open_access_status": open_access_status
-            }
-
-            prepared_data.append(entry)
-
-        except KeyError as e:
-            # Log KeyErrors to help identify issues with missing fields
-            print(f"KeyError: {e} in item {item.get('id', 'unknown')}")
-            continue
-
-    return prepared_data
-
-def save_data_by_year(prepared_data, base_dir='Data/docs/references_sample'):
-    """
-    Save the prepared data into separate files for each year.
-    
-    Args:
-        prepared_data (list): List of processed data entries, each containing a 'year' field.
-        base_dir (str): Directory where the year-specific files will be stored.
-
-    The function organizes the data by year and writes it into JSON files,
-    creating a separate file for each year.
-    """
-    data_by_year = {}
-    for item in prepared_data:
-        year = item['year']
-        # Initialize a list for each year if not already present
-        if year not in data_by_year:
-            data_by_year[year] = []
-        # Append the item to the corresponding year list
-        data_by_year[year].append(item)
-    
-    # Ensure the target directory exists
-    os.makedirs(base_dir, exist_ok=True)
-    # Write each year's data to a JSON file
-    for year, data in data_by_year.items():
-        with open(os.path.join(base_dir, f"{year}.json"), 'w') as f:
-            json.dump(data, f, indent=4)
-
-def validate_data(prepared_data):
-    """
-    Validate that all referenced items exist within the dataset.
-
-    Args:
-        prepared_data (list): List of data entries, each containing a 'PMID' field and a 
-                              'c04_referencelist' field with references.
-
-    Returns:
-        bool: True if all references are valid, False if any references are missing.
-    """
-    # Collect all known PMIDs in a set
-    all_ids = set(item['PMID'] for item in prepared_data)
-    valid = True
-    
-    # Check each item's references
-    for item in prepared_data:
-        for ref in item['c04_referencelist']:
-            if ref['item'] not in all_ids:
-                # Print a message for missing references
-                print(f"Reference {ref['item']} in document {item['PMID']} does not exist in the dataset.")
-                valid = False
-    return valid
-
-def convert_to_dataframe_1(data):
-    """
-    Convert a dataset into a DataFrame with specific columns.
-
-    Args:
-        data (list): List of data entries, each containing 'PMID', 'year', and nested
-                     fields for novelty scores.
-
-    Returns:
-        pandas.DataFrame: DataFrame with 'PMID', 'Year', and 'Novelty' columns.
-    """
-    records = []
-    # Iterate through each entry and extract relevant fields
-    for item in data:
-        pmid = item.get('PMID', None)
-        year = item.get('year', None)
-        novelty_score = item.get('c04_referencelist_lee', {}).get('score', {}).get('novelty', None)
-        records.append({
-            'PMID': pmid,
-            'Year': year,
-            'Novelty': novelty_score
-        })
-    # Create a DataFrame from the extracted records
-    return pd.DataFrame(records)
-
-def load_data_from_files(start_year, end_year, directory):
-    """
-    Load data from a range of yearly JSON files.
-
-    Args:
-        start_year (int): Start year of the range to load.
-        end_year (int): End year of the range to load.
-        directory (str): Directory containing the yearly JSON files.
-
-    Returns:
-        list: Combined list of data entries from all specified year files.
-    """
-    all_data = []
-    # Loop through the specified years
-    for year in range(start_year, end_year + 1):
-        file_path = os.path.join(directory, f"{year}.json")
-        if os.path.exists(file_path):
-            # Load data if the file exists
-            with open(file_path, 'r') as f:
-                data = json.load(f)
-                all_data.extend(data)
-                print(f"Data from {year}.json loaded successfully")
-        else:
-            print(f"File {file_path} does not exist")
-    return all_data
-
-def convert_to_dataframe_2(data):
-    """
-    Convert a dataset into a DataFrame focused on novelty scores.
-
-    Args:
-        data (list): List of data entries, each containing 'PMID' and nested novelty score fields.
-
-    Returns:
-        pandas.DataFrame: DataFrame with 'PMID' and 'Novelty' columns.
-    """
-    records = []
-    # Extract 'PMID' and 'Novelty' from each entry
-    for item in data:
-        pmid = item.get('PMID', None)
-        novelty_score = item.get('c04_referencelist_lee', {}).get('score', {}).get('novelty', None)
-        records.append({
-            'PMID': pmid,
-            'Novelty': novelty_score
-        })
-    return pd.DataFrame(records)
-
-def convert_to_dataframe_3(data):
-    # Convert a list of data entries directly into a DataFrame 
-    return pd.DataFrame(data)
-
-# Define a list of queries representing Sustainable Development Goals (SDGs)
-queries = [
-    "No Poverty", # SDG 1
-    "Zero Hunger", # SDG 2
-    "SDG 3", # SDG 3
-    "Quality Education", # SDG 4
-    "Gender Equality", # SDG 5
-    "SDG 6", # SDG 6
-    "SDG 7", # SDG 7
-    "SDG 8", # SDG 8
-    "SDG 9", # SDG 9
-    "Reduced Inequality", # SDG 10
-    "Sustainable Cities and Communities", # SDG 11
-    "Responsible Consumption and Production", # SDG 12
-    "Climate Action", # SDG 13
-    "SDG 14", # SDG 14
-    "Life on Land", # SDG 15
-    "SDG 16", # SDG 16
-    "Partnerships for the Goals" # SDG 17
-    ]
-
-# Process each query
-for query in queries:
-    print(f"Processing query: {query}")
-    # Retrieve data for the current query
-    data = get_top_cited_openalex_data(query, num_results=800)
-    # Prepare the data for Novelty
-    prepared_data = prepare_data_for_novelpy(data)
-    # Save the prepared data grouped by publication year
-    save_data_by_year(prepared_data, base_dir=f"Data/docs/references_sample")
-    # Validate the prepared data to ensure consistency
-    validate_data(prepared_data)
-    
-    # Calculating the co-occurrence matrix and Lee et al. (2015) indicator
-    ref_cooc = novelpy.utils.cooc_utils.create_cooc(
-        collection_name="references_sample",
-        year_var="year",
-        var="c04_referencelist",
-        sub_var="item",
-        time_window=range(2016, 2025),
-        weighted_network=True, 
-        self_loop=True
-    )
-    ref_cooc.main()
-
-    # Define parameters for the Lee indicator calculation
-    focal_years = range(2016, 2025)
-    collection_name = 'references_sample'
-    id_variable = 'PMID'
-    year_variable = 'year'
-    variable = 'c04_referencelist'
-    sub_variable = 'item'
-
-    # Compute the Lee indicator for each focal year
-    for focal_year in tqdm.tqdm(focal_years, desc="Computing Lee indicator for window of time"):
-        Lee = novelpy.indicators.Lee2015(
-            collection_name=collection_name,
-            id_variable=id_variable,
-            year_variable=year_variable,
-            variable=variable,
-            sub_variable=sub_variable,
-            focal_year=focal_year,
-            density=True
-        )
-        Lee.get_indicator()
-
-    # Load the computed Lee data
-    start_year = 2016
-    end_year = 2024
-    directory = 'Result/lee/c04_referencelist/'
-    data_lee = load_data_from_files(start_year, end_year, directory)
-    print(f"Total records loaded: {len(data_lee)}")
-
-    # Convert Lee data into a DataFrame and summarize it
-    lee_df = convert_to_dataframe_2(data_lee)
-    lee_df.describe()
-    
-    # Reprocess the query data, prepare it, and save it by year
-    data = get_top_cited_openalex_data(query, 800)
-    prepared_data = prepare_data_for_novelpy(data)
-    save_data_by_year(prepared_data)
-    
-    # Load all yearly data into a single list
-    start_year = 2016
-    end_year = 2024
-    directory = 'Data/docs/references_sample/'
-    data = load_data_from_files(start_year, end_year, directory)
-    
-    # Convert the loaded data into a DataFrame and summarize it
-    df_articles = convert_to_dataframe_3(data)
-    df_articles.describe()
-    
-    # Merge the Lee data with the article data and filter out rows without novelty scores
-    df = df_articles.merge(lee_df, on='PMID', how='left').dropna(subset=['Novelty'])
-    df.describe()
-    
-    # Save the final DataFrame to a CSV file
-    df.to_csv(f"DataFrames/DF_{query}.csv", index=False)
-    print(df.describe())
-    print(f"Data for query '{query}' saved to DF_{query}.csv")
-    
-    # Clean up temporary data and results folders
-    folders_to_delete = ['Data', 'Result']
-    for folder in folders_to_delete:
-        if os.path.exists(folder):
-            try:
-                shutil.rmtree(folder)
-                print(f"Folder '{folder}' successfully deleted.")
-            except Exception as e:
-                print(f"Error deleting folder '{folder}': {e}")
-
-print("All queries processed successfully.")
+# Import packages for Lee Commonness and data manipulation
+import pandas as pd
+import numpy as np
+import json
+import os
+import hashlib
+import gzip
+import shutil
+import csv
+from cache import ResponseCache, normalize_request
+from id_table import IdTable, short_openalex_id
+from manifest import StageManifest, fingerprint
+from metrics import METRICS
+from novelty_engine import SCORES_VERSION, CoocNetwork, IncrementalLee, indicator_column
+from openalex import ID_BATCH_SIZE, OpenAlexHarvester
+from storage import export_csv as export_csv_file, read_table, write_table
+from work_store import WorkStore
+
+# Function to retrieve top-cited articles from OpenAlex API
+def get_top_cited_openalex_data(query, num_results=800, harvester=None):
+    """
+    Récupère les articles OpenAlex les plus cités pour une requête donnée.
+
+    Args:
+        query (str): La requête de recherche.
+        num_results (int): Nombre total d'articles à récupérer.
+        harvester (OpenAlexHarvester): Client OpenAlex à réutiliser (un client par défaut sinon).
+
+    Returns:
+        list: Liste des articles triés par nombre de citations décroissant.
+    """
+    # Cursor pagination with a pooled session, rate limiting and retries on 429/5xx
+    harvester = harvester or OpenAlexHarvester()
+    return list(harvester.iter_works(query, num_results))
+
+def generate_int_id(string_id):
+    """
+    Generate an integer ID from a string ID using hashing.
+
+    Kept for reading older outputs: the hash is reduced modulo 10**8, so distinct IDs collide once
+    the corpus grows. New outputs use the collision-free indices of `IdTable` instead.
+    """
+    return int(hashlib.sha256(string_id.encode('utf-8')).hexdigest(), 16) % (10**8)
+
+def prepare_data_for_novelpy(data, id_table=None):
+    """
+    Prepare OpenAlex data for analysis by extracting relevant fields.
+    
+    Args:
+        data (list): List of OpenAlex works data.
+        id_table (IdTable): Interning table giving each work and reference a dense integer ID
+                            (an in-memory table by default; share one table across queries and runs).
+    
+    Returns:
+        list: Processed data entries with standardized fields. 'c04_referencelist' holds the
+              interned IDs of the referenced works.
+    """
+    return list(iter_prepared(data, id_table))
+
+def prepare_authorships(authorships):
+    """
+    Build the structured authorship rows of a work: one row per (author, institution) pair.
+
+    Unlike the flat 'authors' and 'institutions' lists, each institution stays attached to its
+    author, whatever the number of affiliations. An author without affiliation gets a single row
+    with empty institution fields.
+
+    Args:
+        authorships (list): The 'authorships' field of an OpenAlex work.
+
+    Returns:
+        list: Dicts with 'author_position' (rank of the author in the work), 'author',
+              'institution_id' (short OpenAlex ID) and 'institution_name'.
+    """
+    rows = []
+    for position, authorship in enumerate(authorships):
+        author = authorship['author']['display_name']
+        institutions = authorship.get('institutions') or [{}]
+        for inst in institutions:
+            rows.append({
+                "author_position": position,
+                "author": author,
+                "institution_id": short_openalex_id(inst['id']) if inst.get('id') else None,
+                "institution_name": inst.get('display_name') or None
+            })
+    return rows
+
+def iter_prepared(data, id_table=None):
+    """
+    Lazily prepare OpenAlex works, one at a time (see `prepare_data_for_novelpy`).
+
+    Args:
+        data (iterable): OpenAlex works, e.g. streamed by the harvester.
+        id_table (IdTable): Interning table of the OpenAlex IDs.
+
+    Yields:
+        dict: Processed data entries with standardized fields.
+    """
+    id_table = id_table if id_table is not None else IdTable(path=None)
+
+    for item in data:
+        try:
+            # Ensure the item contains a unique identifier
+            if 'id' not in item:
+                print(f"Skipping item without id: {item}")
+                continue
+            
+            # Filter out items outside the date range
+            year = item.get('publication_year', None)
+            if year is None or not (2016 <= year <= 2024):
+                print(f"Skipping item outside date range: {item['id']}")
+                continue
+            
+            # Extract authors and institutions
+            authorships = item.get('authorships', [])
+            authors = [author['author']['display_name'] for author in authorships]
+            institutions = []
+            for author in authorships:
+                if 'institutions' in author:
+                    for inst in author['institutions']:
+                        institutions.append(inst.get('display_name', ''))
+            authorship_rows = prepare_authorships(authorships)
+
+            # Extract additional optional fields, with a default for missing data.
+            # keyword_analysis, collaborative_index, journal_impact_factor, citations_geographical and
+            # page_count are not OpenAlex fields: they are not requested and stay "Missing".
+            keyword_analysis = item.get('keyword_analysis', 'Missing')
+            collaborative_index = item.get('collaborative_index', 'Missing')
+            journal_impact_factor = item.get('journal_impact_factor', 'Missing')
+            citations_geographical = item.get('citations_geographical', 'Missing')
+            page_count = item.get('page_count', 'Missing')
+            # License and publisher come from the primary location (host_venue is deprecated)
+            primary_location = item.get('primary_location') or {}
+            source = primary_location.get('source') or {}
+            license_info = primary_location.get('license') or item.get('license', 'Missing')
+            publisher = source.get('host_organization_name') or item.get('host_venue', {}).get('publisher', 'Missing')
+            apc_paid = item.get('apc_paid', 'Missing')
+            open_access_status = item.get('open_access', {}).get('status', 'Missing')
+
+            # Construct the processed data entry
+            entry = {
+                "PMID": id_table.pmid(item['id']),
+                "year": year,
+                "type": item.get('type', ''),
+                "num_citations": item.get('cited_by_count', 0),
+                "num_authors": len(authorships),
+                "authors": authors,
+                "institutions": institutions,
+                "authorships": authorship_rows,
+                "c04_referencelist": id_table.intern_many(item.get('referenced_works', [])).tolist(),
+                "subfield": item.get('concepts', [{}])[0].get('display_name', '') if item.get('concepts') else '',
+                "field": item.get('concepts', [{}])[1].get('display_name', '') if len(item.get('concepts', [])) > 1 else '',
+                "domain": item.get('concepts', [{}])[2].get('display_name', '') if len(item.get('concepts', [])) > 2 else '',
+                "sustainable_development_goals": item.get('sustainable_development_goals', []),
+                "keyword_analysis": keyword_analysis,
+                "collaborative_index": collaborative_index,
+                "license": license_info,
+                "journal_impact_factor": journal_impact_factor,
+                "citations_geographical": citations_geographical,
+                "page_count": page_count,
+                "publisher": publisher,
+                "apc_paid": apc_paid,
+                "open_access_status": open_access_status
+            }
+
+            yield entry
+
+        except KeyError as e:
+            # Log KeyErrors to help identify issues with missing fields
+            print(f"KeyError: {e} in item {item.get('id', 'unknown')}")
+            continue
+
+def partition_path(base_dir, year, compress=False):
+    """Path of the newline-delimited JSON partition of a year."""
+    return os.path.join(base_dir, f"{year}.ndjson" + (".gz" if compress else ""))
+
+def save_data_by_year(prepared_data, base_dir='Data/docs/references_sample', compress=False, mode='w'):
+    """
+    Save the prepared data into separate files for each year.
+    
+    Args:
+        prepared_data (iterable): Processed data entries, each containing a 'year' field.
+                                  A generator is consumed lazily, one record at a time.
+        base_dir (str): Directory where the year-specific files will be stored.
+        compress (bool): Write gzip-compressed partitions (`{year}.ndjson.gz`).
+        mode (str): 'w' replaces the partitions of the years present in `prepared_data` (both the
+                    compressed and the plain one), 'a' appends to them.
+
+    Returns:
+        dict: Number of records written for each year.
+
+    The function writes each record as one line of JSON to the file of its year
+    (newline-delimited JSON), so it never holds more than one record in memory.
+    """
+    if mode not in ('w', 'a'):
+        raise ValueError(f"Unknown mode: {mode}")
+    # Ensure the target directory exists
+    os.makedirs(base_dir, exist_ok=True)
+    files = {}
+    counts = {}
+    try:
+        for item in prepared_data:
+            year = item['year']
+            # Open the partition of a year the first time it is needed
+            if year not in files:
+                path = partition_path(base_dir, year, compress)
+                other_path = partition_path(base_dir, year, not compress)
+                if mode == 'w' and os.path.exists(other_path):
+                    # The partition in the other format would be read back along with the new one
+                    os.remove(other_path)
+                files[year] = (gzip.open(path, mode + 't', encoding='utf-8') if compress
+                               else open(path, mode, encoding='utf-8'))
+                counts[year] = 0
+            files[year].write(json.dumps(item) + "\n")
+            counts[year] += 1
+    finally:
+        for f in files.values():
+            f.close()
+    return counts
+
+def iter_records(directory, start_year=2016, end_year=2024):
+    """
+    Lazily read the records of a range of yearly partitions, in year order.
+
+    Reads `{year}.ndjson`, `{year}.ndjson.gz`, and the `{year}.json` files written by older versions.
+
+    Args:
+        directory (str): Directory containing the yearly files.
+        start_year (int): Start year of the range to load.
+        end_year (int): End year of the range to load.
+
+    Yields:
+        dict: One data entry at a time.
+    """
+    for year in range(start_year, end_year + 1):
+        for path in (partition_path(directory, year), partition_path(directory, year, compress=True)):
+            if os.path.exists(path):
+                with (gzip.open(path, 'rt', encoding='utf-8') if path.endswith(".gz") else open(path, encoding='utf-8')) as f:
+                    for line in f:
+                        if line.strip():
+                            yield json.loads(line)
+        legacy_path = os.path.join(directory, f"{year}.json")
+        if os.path.exists(legacy_path):
+            with open(legacy_path, 'r') as f:
+                yield from json.load(f)
+
+class YearPartitions:
+    """
+    Re-iterable view over the yearly partitions of a directory: each iteration reads them again
+    lazily, so the records can be traversed several times without being held in memory.
+
+    Args:
+        directory (str): Directory containing the yearly files.
+        start_year (int): Start year of the range to load.
+        end_year (int): End year of the range to load.
+    """
+
+    def __init__(self, directory, start_year=2016, end_year=2024):
+        self.directory = directory
+        self.start_year = start_year
+        self.end_year = end_year
+
+    def __iter__(self):
+        return iter_records(self.directory, self.start_year, self.end_year)
+
+def validate_data(prepared_data):
+    """
+    Check which referenced items exist within the dataset, as a set difference.
+
+    Args:
+        prepared_data (iterable): Data entries, each containing a 'PMID' field and a 
+                                  'c04_referencelist' field with the IDs of the references.
+
+    Returns:
+        dict: 'documents' (number of entries), 'citations' (number of references), 'distinct_references',
+              'internal' (distinct references that are documents of the dataset) and 'dangling'
+              (set of the referenced IDs that are not in the dataset).
+    """
+    # Collect all known PMIDs and all referenced IDs in sets, in a single pass
+    all_ids = set()
+    references = set()
+    citations = 0
+    for item in prepared_data:
+        all_ids.add(item['PMID'])
+        references.update(item['c04_referencelist'])
+        citations += len(item['c04_referencelist'])
+    dangling = references - all_ids
+
+    print(f"{len(all_ids)} documents cite {len(references)} distinct works ({citations} citations): "
+          f"{len(references) - len(dangling)} in the dataset, {len(dangling)} outside it")
+    return {'documents': len(all_ids), 'citations': citations, 'distinct_references': len(references),
+            'internal': len(references) - len(dangling), 'dangling': dangling}
+
+def hydrate_references(references, id_table, harvester, store, batch_size=ID_BATCH_SIZE):
+    """
+    Fetch the metadata of referenced works that are not in the local work store yet.
+
+    The works are requested by batches of `batch_size` IDs with an OR-filter, i.e. about
+    1/`batch_size` of the requests a lookup per work would need.
+
+    Args:
+        references (iterable): Interned IDs of the referenced works, e.g. the 'dangling' set of `validate_data`.
+        id_table (IdTable): Interning table of the OpenAlex IDs.
+        harvester (OpenAlexHarvester): OpenAlex client.
+        store (WorkStore): Persistent store of the fetched works.
+        batch_size (int): Number of IDs per request.
+
+    Returns:
+        int: Number of works requested.
+    """
+    openalex_ids = {id_table.lookup(ref) for ref in references}
+    missing = openalex_ids - store.known(openalex_ids)
+    n_requests = -(-len(missing) // batch_size)
+    print(f"Hydrating {len(missing)} referenced works ({len(openalex_ids) - len(missing)} already stored) "
+          f"in {n_requests} requests")
+    for batch, works in harvester.hydrate(missing, batch_size):
+        returned = {short_openalex_id(work['id']) for work in works}
+        store.put_many(works, not_found=set(batch) - returned)
+    return len(missing)
+
+def reference_metadata(records, id_table, store, chunksize=5000):
+    """
+    Describe the references of every work from the metadata of the referenced works.
+
+    The year and field of a reference come from the dataset when the referenced work is one of its
+    works, and from the hydrated works of the store otherwise (see `hydrate_references`). The field
+    is the second concept of the work, as in the 'field' column of the prepared records.
+
+    Args:
+        records (iterable): Prepared records, e.g. `YearPartitions` (read twice).
+        id_table (IdTable): Interning table of the OpenAlex IDs.
+        store (WorkStore): Store of the hydrated referenced works.
+        chunksize (int): Number of works read from the store at once.
+
+    Returns:
+        pandas.DataFrame: 'PMID', 'reference_age' (mean number of years between the work and its
+                          references), 'reference_fields' (number of distinct fields of its references)
+                          and 'references_described' (share of its references with a known year or field).
+    """
+    # Year and field of the works of the dataset
+    metadata = {}
+    references = set()
+    for record in records:
+        metadata[record['PMID']] = (record['year'], record['field'] or None)
+        references.update(record['c04_referencelist'])
+    # ... and of the referenced works outside it, fetched into the store
+    outside = {id_table.lookup(ref): ref for ref in references - set(metadata)}
+    openalex_ids = list(outside)
+    for start in range(0, len(openalex_ids), chunksize):
+        for openalex_id, work in store.get_many(openalex_ids[start:start + chunksize]).items():
+            concepts = work.get('concepts') or []
+            field = concepts[1].get('display_name') if len(concepts) > 1 else None
+            metadata[outside[openalex_id]] = (work.get('publication_year'), field or None)
+
+    columns = ['PMID', 'reference_age', 'reference_fields', 'references_described']
+    rows = []
+    for record in records:
+        refs = record['c04_referencelist']
+        known = [metadata[ref] for ref in refs if ref in metadata and metadata[ref] != (None, None)]
+        ages = [record['year'] - year for year, _ in known if year is not None]
+        rows.append((record['PMID'], float(np.mean(ages)) if ages else np.nan,
+                     len({field for _, field in known if field}), len(known) / len(refs) if refs else np.nan))
+    return pd.DataFrame(rows, columns=columns)
+
+def frame_in_chunks(rows, chunksize=10000, columns=None):
+    """
+    Build a DataFrame from an iterable of dicts, chunk by chunk.
+
+    Only `chunksize` dicts are alive at a time; each chunk is turned into a columnar frame
+    before the next one is read.
+
+    Args:
+        rows (iterable): Dicts, e.g. read lazily by `iter_records`.
+        chunksize (int): Number of rows per chunk.
+        columns (list): Columns of the empty frame returned when there is no row.
+
+    Returns:
+        pandas.DataFrame: Concatenation of the chunks.
+    """
+    frames = []
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == chunksize:
+            frames.append(pd.DataFrame(chunk))
+            chunk = []
+    if chunk:
+        frames.append(pd.DataFrame(chunk))
+    if not frames:
+        return pd.DataFrame(columns=columns)
+    return pd.concat(frames, ignore_index=True)
+
+def convert_to_dataframe_1(data, chunksize=10000):
+    """
+    Convert a dataset into a DataFrame with specific columns.
+
+    Args:
+        data (iterable): Data entries, each containing 'PMID', 'year', and nested
+                         fields for novelty scores.
+        chunksize (int): Number of entries converted at a time.
+
+    Returns:
+        pandas.DataFrame: DataFrame with 'PMID', 'Year', and 'Novelty' columns.
+    """
+    # Iterate through each entry and extract relevant fields
+    rows = ({
+        'PMID': item.get('PMID', None),
+        'Year': item.get('year', None),
+        'Novelty': item.get('c04_referencelist_lee', {}).get('score', {}).get('novelty', None)
+    } for item in data)
+    # Create a DataFrame from the extracted records
+    return frame_in_chunks(rows, chunksize, columns=['PMID', 'Year', 'Novelty'])
+
+def load_data_from_files(start_year, end_year, directory):
+    """
+    Load data from a range of yearly files.
+
+    Args:
+        start_year (int): Start year of the range to load.
+        end_year (int): End year of the range to load.
+        directory (str): Directory containing the yearly files.
+
+    Returns:
+        list: Combined list of data entries from all specified year files.
+        Prefer `iter_records` to process large corpora without loading them at once.
+    """
+    all_data = list(iter_records(directory, start_year, end_year))
+    print(f"{len(all_data)} records loaded from {directory}")
+    return all_data
+
+def convert_to_dataframe_2(data, chunksize=10000):
+    """
+    Convert a dataset into a DataFrame focused on novelty scores.
+
+    Args:
+        data (iterable): Data entries, each containing 'PMID' and nested novelty score fields.
+        chunksize (int): Number of entries converted at a time.
+
+    Returns:
+        pandas.DataFrame: DataFrame with 'PMID' and 'Novelty' columns.
+    """
+    # Extract 'PMID' and 'Novelty' from each entry
+    rows = ({
+        'PMID': item.get('PMID', None),
+        'Novelty': item.get('c04_referencelist_lee', {}).get('score', {}).get('novelty', None)
+    } for item in data)
+    return frame_in_chunks(rows, chunksize, columns=['PMID', 'Novelty'])
+
+def convert_to_dataframe_3(data, chunksize=10000):
+    # Convert data entries directly into a DataFrame, chunk by chunk
+    return frame_in_chunks(data, chunksize)
+
+# Define a list of queries representing Sustainable Development Goals (SDGs)
+queries = [
+    "No Poverty", # SDG 1
+    "Zero Hunger", # SDG 2
+    "SDG 3", # SDG 3
+    "Quality Education", # SDG 4
+    "Gender Equality", # SDG 5
+    "SDG 6", # SDG 6
+    "SDG 7", # SDG 7
+    "SDG 8", # SDG 8
+    "SDG 9", # SDG 9
+    "Reduced Inequality", # SDG 10
+    "Sustainable Cities and Communities", # SDG 11
+    "Responsible Consumption and Production", # SDG 12
+    "Climate Action", # SDG 13
+    "SDG 14", # SDG 14
+    "Life on Land", # SDG 15
+    "SDG 16", # SDG 16
+    "Partnerships for the Goals" # SDG 17
+    ]
+
+# Set to True to replay cached OpenAlex responses without any network access
+OFFLINE = False
+
+# "union" builds one co-occurrence network over the works of all queries and slices it per SDG;
+# "per_query" reproduces the original semantics, with one network restricted to each query's works.
+CORPUS_MODE = "union"
+
+# Also export the results as CSV (e.g. for Power BI); the Parquet files are always written
+EXPORT_CSV = True
+
+# Fetch the metadata of the referenced works outside the dataset into the local work store
+HYDRATE_REFERENCES = True
+
+# Publication years whose works are scored
+FOCAL_YEARS = range(2016, 2025)
+
+# Novelty indicators computed in the same pass over the co-occurrences (see novelty_engine.INDICATORS):
+# Lee et al. (2015) fills the 'Novelty' column, the others add 'Novelty_uzzi', 'Novelty_foster', 'Novelty_wang'
+INDICATORS = ["lee", "uzzi", "foster", "wang"]
+
+def harvest_all_queries(queries, harvester, num_results=800, id_table=None, records_dir="Cache/records",
+                        compress=True):
+    """
+    Harvest and prepare every query, keeping a single record per work shared by several queries.
+
+    The works are streamed from the harvester, prepared one at a time and appended to yearly
+    newline-delimited JSON partitions, so memory stays bounded whatever the number of results.
+
+    Args:
+        queries (list): Title search queries.
+        harvester (OpenAlexHarvester): OpenAlex client.
+        num_results (int): Number of works per query.
+        id_table (IdTable): Interning table shared by all queries.
+        records_dir (str): Directory of the yearly partitions, emptied at the start of the harvest.
+        compress (bool): Write gzip-compressed partitions.
+
+    Returns:
+        tuple: (YearPartitions over the unique prepared records, dict mapping each query to the PMIDs of its works).
+    """
+    id_table = id_table if id_table is not None else IdTable(path=None)
+    # Start from an empty directory, so that no partition of a year missing from this harvest remains
+    os.makedirs(records_dir, exist_ok=True)
+    for name in os.listdir(records_dir):
+        if name.endswith((".ndjson", ".ndjson.gz")):
+            os.remove(os.path.join(records_dir, name))
+
+    membership = {query: [] for query in queries}
+    seen = set()
+
+    def unique_records():
+        for query, work in harvester.harvest(queries, num_results):
+            for item in iter_prepared([work], id_table):
+                METRICS.count("harvest.works", query=query)
+                membership[query].append(item['PMID'])
+                if item['PMID'] not in seen:
+                    seen.add(item['PMID'])
+                    yield item
+
+    counts = save_data_by_year(unique_records(), records_dir, compress=compress)
+    for query in queries:
+        print(f"Query '{query}': {len(membership[query])} works")
+    print(f"{len(seen)} unique works across {len(queries)} queries")
+    years = sorted(counts) or [0]
+    return YearPartitions(records_dir, years[0], years[-1]), membership
+
+def harvest_fingerprint(harvester, query, num_results):
+    """Fingerprint of the harvest of a query: its normalized first request and the number of results."""
+    first_page = harvester.query_params(query, "*", harvester.per_page)
+    return fingerprint(normalize_request(harvester.base_url, first_page), num_results)
+
+def build_corpus(queries, harvester, corpus=CORPUS_MODE, num_results=800, state_dir="Cache/novelty", id_table=None,
+                 manifest=None, hydrate=HYDRATE_REFERENCES, work_store=None):
+    """
+    Harvest every query and build the co-occurrence structure shared by all of them.
+
+    The structure is built once over the union of all queries. In "union" mode the works are scored
+    against the whole corpus, once, and the scores are saved to `state_dir/scores.parquet`; the
+    network and the per-year scores are persisted, so a rerun only recomputes the focal years
+    affected by new or changed works. In "per_query" mode the network of the corpus is saved to
+    `state_dir/corpus.npz`, and each query is scored later against its own works only.
+
+    Each stage (harvest, prepare, cooc, lee) is recorded in a manifest with the fingerprint of its
+    inputs, and skipped on a rerun when its inputs did not change.
+
+    Args:
+        queries (list): Title search queries.
+        harvester (OpenAlexHarvester): OpenAlex client.
+        corpus (str): "union" or "per_query".
+        num_results (int): Number of works per query.
+        state_dir (str): Where the ID table, the yearly record partitions, the network and the
+                         scores are persisted between runs.
+        id_table (IdTable): Interning table of the OpenAlex IDs; the PMIDs are its indices.
+        manifest (StageManifest): Record of the completed stages (`state_dir/manifest` by default).
+        hydrate (bool): Fetch the referenced works missing from the dataset (see `hydrate_references`).
+        work_store (WorkStore): Store of the referenced works (`state_dir/works.sqlite` by default).
+
+    Returns:
+        dict: Each query mapped to the PMIDs of its works, to be passed to `score_query`.
+    """
+    if corpus not in ("union", "per_query"):
+        raise ValueError(f"Unknown corpus mode: {corpus}")
+
+    # Persistent table of OpenAlex IDs, so that PMIDs and reference IDs are stable across runs
+    id_table = id_table if id_table is not None else IdTable(os.path.join(state_dir, "ids.txt"))
+    manifest = manifest if manifest is not None else StageManifest(os.path.join(state_dir, "manifest"))
+    records_dir = os.path.join(state_dir, "records")
+    # Store of the works and of their many-to-many membership in the queries
+    work_store = work_store if work_store is not None else WorkStore(os.path.join(state_dir, "works.sqlite"))
+    stored_members = {query: work_store.members(query) for query in queries}
+
+    # Harvest and preparation are skipped when the queries and their parameters did not change,
+    # as long as the harvested pages would still be fresh in the response cache
+    harvest_fingerprints = {query: harvest_fingerprint(harvester, query, num_results) for query in queries}
+    prepare_fingerprint = fingerprint(sorted(harvest_fingerprints.values()))
+    max_age = harvester.cache.ttl if harvester.cache is not None else None
+    if (all(manifest.is_current("harvest", query, fp, max_age) for query, fp in harvest_fingerprints.items())
+            and manifest.is_current("prepare", "records", prepare_fingerprint)
+            and all(members is not None for members in stored_members.values())):
+        print("Harvest and preparation unchanged, reusing the prepared records")
+        membership = {query: [id_table.pmid(openalex_id) for openalex_id in members]
+                      for query, members in stored_members.items()}
+    else:
+        # After a crash, the pages already fetched are replayed from the response cache
+        with METRICS.stage("harvest"):
+            records, membership = harvest_all_queries(queries, harvester, num_results, id_table, records_dir=records_dir)
+        id_table.save()
+        for query, fp in harvest_fingerprints.items():
+            work_store.set_members(query, [id_table.lookup(pmid) for pmid in membership[query]])
+            manifest.record("harvest", query, fp, works=len(membership[query]))
+        partitions = [os.path.join(records_dir, name) for name in sorted(os.listdir(records_dir))]
+        manifest.record("prepare", "records", prepare_fingerprint, outputs=partitions)
+    records = YearPartitions(records_dir, FOCAL_YEARS[0], FOCAL_YEARS[-1])
+
+    # Validate the prepared data to ensure consistency
+    with METRICS.stage("validate"):
+        report = validate_data(records)
+    if hydrate:
+        # Batched lookups of the referenced works that have never been fetched (none on a plain rerun)
+        with METRICS.stage("hydrate"):
+            hydrate_references(report['dangling'], id_table, harvester, work_store)
+
+    # The co-occurrences and the scores only depend on the prepared records and on the scoring rules
+    cooc_fingerprint = fingerprint(corpus, manifest.digest("prepare", "records"), SCORES_VERSION)
+    score_columns = ['PMID'] + [indicator_column(name) for name in INDICATORS]
+    current = manifest.is_current("cooc", corpus, cooc_fingerprint)
+    if corpus == "union":
+        current = current and manifest.is_current(
+            "lee", corpus, fingerprint(manifest.digest("cooc", corpus), list(FOCAL_YEARS), INDICATORS, SCORES_VERSION))
+    if current:
+        print("Co-occurrences and scores unchanged, skipping")
+    elif corpus == "union":
+        # Fold the corpus into the persisted network: only the years touched by new or changed
+        # works get their co-occurrences and scores recomputed, for every indicator at once
+        engine = IncrementalLee(state_dir, focal_years=FOCAL_YEARS, indicators=INDICATORS)
+        # Communities are built with the ranks of the OpenAlex IDs, which do not depend on the harvest order
+        engine.update(records, n_items=len(id_table), item_ranks=id_table.ranks())
+        engine.save()
+        cooc_files = [os.path.join(state_dir, "network.npz")] + [
+            os.path.join(state_dir, f"cooc_{year}.npz") for year in sorted(engine.coocs)]
+        cooc_digest = manifest.record("cooc", corpus, cooc_fingerprint, outputs=cooc_files)
+        lee_union = engine.all_scores()[score_columns]
+        scores_path = os.path.join(state_dir, "scores.parquet")
+        lee_union.to_parquet(scores_path, index=False)
+        manifest.record("lee", corpus, fingerprint(cooc_digest, list(FOCAL_YEARS), INDICATORS, SCORES_VERSION),
+                        outputs=[scores_path])
+        print(f"Total records scored: {len(lee_union)}")
+    else:
+        # Build the weighted reference co-occurrence network once for all queries
+        with METRICS.stage("network"):
+            network = CoocNetwork.from_records(records, n_items=len(id_table))
+        network.save(os.path.join(state_dir, "corpus.npz"))
+        # Ranks of the OpenAlex IDs, with which the communities do not depend on the harvest order
+        np.save(os.path.join(state_dir, "item_ranks.npy"), id_table.ranks())
+        manifest.record("cooc", corpus, cooc_fingerprint,
+                        outputs=[os.path.join(state_dir, "corpus.npz"), os.path.join(state_dir, "item_ranks.npy")])
+
+    # One row per unique work, whatever the number of queries it matched; the tables of the
+    # queries are views over it
+    works_path = os.path.join(state_dir, "works.parquet")
+    scores_digest = manifest.digest("lee", corpus) if corpus == "union" else None
+    # The reference metadata changes when new referenced works are hydrated into the store
+    works_fingerprint = fingerprint(manifest.digest("prepare", "records"), scores_digest, len(work_store))
+    if not manifest.is_current("works", corpus, works_fingerprint):
+        with METRICS.stage("works"):
+            scores = pd.read_parquet(os.path.join(state_dir, "scores.parquet")) if corpus == "union" else None
+            n_works = build_work_table(records, id_table, works_path, scores, work_store)
+        manifest.record("works", corpus, works_fingerprint, outputs=[works_path], rows=n_works)
+    return membership
+
+def build_work_table(records, id_table, path, scores=None, store=None):
+    """
+    Write the table of the unique works of all queries, with their OpenAlex ID and their scores.
+
+    Args:
+        records (iterable): Prepared records, e.g. `YearPartitions`.
+        id_table (IdTable): Interning table of the OpenAlex IDs.
+        path (str): Destination `.parquet` file.
+        scores (pandas.DataFrame): Scores of the works ('PMID' and one column per indicator), if computed for all queries.
+        store (WorkStore): Store of the hydrated referenced works; adds the columns of `reference_metadata`.
+
+    Returns:
+        int: Number of works.
+    """
+    df = convert_to_dataframe_3(records)
+    df.insert(1, 'openalex_id', [id_table.lookup(pmid) for pmid in df['PMID']])
+    if store is not None:
+        df = df.merge(reference_metadata(records, id_table, store), on='PMID', how='left')
+    if scores is not None:
+        df = df.merge(scores, on='PMID', how='left')
+    write_table(df, path)
+    return len(df)
+
+def score_query(query, members, corpus=CORPUS_MODE, state_dir="Cache/novelty", output_dir="DataFrames",
+                export_csv=EXPORT_CSV, work_dir=None, manifest=None):
+    """
+    Score the works of one query and save them to `DF_{query}.parquet`.
+
+    The table is a view of the shared works table of `build_corpus`: the rows of the query's works,
+    with their scores (computed here in "per_query" mode). Only reads the state written by
+    `build_corpus`, so the queries can be scored in separate
+    processes. The files are written to a scratch directory first and moved to `output_dir` once
+    complete, so a reader never sees a partial file. The query is skipped when its works and the
+    upstream scores did not change since its files were written.
+
+    Args:
+        query (str): Title search query.
+        members (list): PMIDs of the works of the query.
+        corpus (str): "union" or "per_query" (must match `build_corpus`).
+        state_dir (str): State directory of `build_corpus`.
+        output_dir (str): Directory of the `DF_{query}` files.
+        export_csv (bool): Also write `DF_{query}.csv` next to the Parquet file.
+        work_dir (str): Scratch directory of the task (`state_dir/tasks/{query}` by default), removed at the end.
+        manifest (StageManifest): Record of the completed stages (`state_dir/manifest` by default).
+
+    Returns:
+        str: Path of the Parquet file.
+    """
+    manifest = manifest if manifest is not None else StageManifest(os.path.join(state_dir, "manifest"))
+    names = [f"DF_{query}.parquet"] + ([f"DF_{query}.csv"] if export_csv else [])
+    outputs = [os.path.join(output_dir, name) for name in names]
+    upstream = (manifest.digest("works", corpus), manifest.digest("cooc", corpus) if corpus == "per_query" else None)
+    merge_fingerprint = fingerprint(query, sorted(members), corpus, upstream, outputs, INDICATORS, SCORES_VERSION)
+    if manifest.is_current("merge", query, merge_fingerprint):
+        print(f"Query '{query}' unchanged, keeping {names[0]}")
+        return outputs[0]
+
+    print(f"Processing query: {query}")
+    work_dir = work_dir or os.path.join(state_dir, "tasks", query)
+    os.makedirs(work_dir, exist_ok=True)
+    lee_df = None
+    if corpus == "per_query":
+        # Score the query against its own works only, through a document mask on the shared network
+        network = CoocNetwork.load(os.path.join(state_dir, "corpus.npz"))
+        item_ranks = np.load(os.path.join(state_dir, "item_ranks.npy"))
+        lee_df = network.indicators(FOCAL_YEARS, INDICATORS, doc_mask=np.isin(network.pmids, members),
+                                    item_ranks=item_ranks)
+        lee_df = lee_df[['PMID'] + [indicator_column(name) for name in INDICATORS]]
+
+    # Select the query's works in the shared table and filter out rows without novelty scores
+    with METRICS.stage("merge", query=query):
+        df = read_table(os.path.join(state_dir, "works.parquet"), pmids=members)
+        if lee_df is not None:
+            df = df.merge(lee_df, on='PMID', how='left')
+        df = df.dropna(subset=['Novelty']).reset_index(drop=True)
+
+    # Save the final DataFrame to a Parquet file, with an optional CSV export
+    os.makedirs(output_dir, exist_ok=True)
+    write_table(df, os.path.join(work_dir, names[0]), sdg=query)
+    if export_csv:
+        export_csv_file(df, os.path.join(work_dir, names[1]))
+    for name, path in zip(names, outputs):
+        os.replace(os.path.join(work_dir, name), path)
+    shutil.rmtree(work_dir, ignore_errors=True)
+    manifest.record("merge", query, merge_fingerprint, outputs=outputs, rows=len(df))
+    print(df.describe())
+    print(f"Data for query '{query}' saved to DF_{query}.parquet")
+    return outputs[0]
+
+def compute_novelty(queries, harvester, corpus=CORPUS_MODE, num_results=800, output_dir="DataFrames",
+                    state_dir="Cache/novelty", id_table=None, export_csv=EXPORT_CSV):
+    """
+    Compute the Lee et al. (2015) novelty of the works of every query and save one Parquet file per query.
+
+    Runs `build_corpus` and then `score_query` for each query, one after another (`main.py` runs
+    the queries in parallel). In "per_query" mode each query is scored against its own works only,
+    through a document mask on the shared structure, which reproduces the results of one network per query.
+
+    Args:
+        queries (list): Title search queries.
+        harvester (OpenAlexHarvester): OpenAlex client.
+        corpus (str): "union" or "per_query".
+        num_results (int): Number of works per query.
+        output_dir (str): Directory of the `DF_{query}` files.
+        state_dir (str): Where the ID table, the yearly record partitions, the network and the per-year
+                         scores are persisted between runs (network and scores in "union" mode).
+        id_table (IdTable): Interning table of the OpenAlex IDs; the PMIDs are its indices.
+        export_csv (bool): Also write `DF_{query}.csv` next to the Parquet file.
+    """
+    membership = build_corpus(queries, harvester, corpus, num_results, state_dir, id_table)
+    for query in queries:
+        score_query(query, membership[query], corpus, state_dir, output_dir, export_csv)
+
+if __name__ == "__main__":
+    # Share one pooled, rate-limited OpenAlex client between all queries.
+    # Pages are cached on disk, so reruns after a crash are free.
+    harvester = OpenAlexHarvester(cache=ResponseCache("Cache/openalex", offline=OFFLINE))
+    compute_novelty(queries, harvester, corpus=CORPUS_MODE)
+    # Run report (timings, memory, request and cache counters) and timeline of the stages
+    METRICS.save_run("novelty")
+    print("All queries processed successfully.")
@@ -0,0 +1,141 @@
+# Shared HTTP helpers: pooled sessions, rate limiting and retries with backoff
+import json
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    # Optional: orjson decodes the raw bytes directly, several times faster than the json module
+    import orjson
+except ImportError:
+    orjson = None
+
+from metrics import METRICS
+
+# Status codes worth retrying: rate limiting and transient server errors
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class RateLimiter:
+    """
+    Thread-safe token bucket limiting the number of requests per second.
+
+    Args:
+        rate (float): Average number of requests allowed per second. None or 0 disables the limit.
+        burst (int): Maximum number of requests that may be issued back to back.
+    """
+
+    def __init__(self, rate=10, burst=None):
+        self.rate = rate
+        self.capacity = burst or max(1, int(rate or 1))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Block until a request slot is available."""
+        if not self.rate:
+            return
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                # Refill the bucket according to the elapsed time
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+def make_session(pool_size=10):
+    """
+    Create a requests session whose connection pool can serve `pool_size` threads.
+
+    Args:
+        pool_size (int): Number of connections kept alive per host.
+
+    Returns:
+        requests.Session: Session with keep-alive connections shared between calls.
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def backoff_delay(attempt, backoff=1.0, max_delay=60.0, retry_after=None):
+    """
+    Compute how long to wait before retrying a request.
+
+    Args:
+        attempt (int): Number of attempts already made (0 for the first retry).
+        backoff (float): Base delay in seconds.
+        max_delay (float): Upper bound of the delay in seconds.
+        retry_after (str): Value of the Retry-After header, honoured when it is a number of seconds.
+
+    Returns:
+        float: Delay in seconds, using "full jitter" exponential backoff.
+    """
+    if retry_after:
+        try:
+            return min(max_delay, float(retry_after))
+        except ValueError:
+            pass
+    return random.uniform(0, min(max_delay, backoff * 2 ** attempt))
+
+
+def decode_json(content):
+    """Decode a JSON body from bytes, with orjson when it is installed."""
+    if orjson is not None:
+        return orjson.loads(content)
+    return json.loads(content)
+
+
+def get_json(session, url, params=None, rate_limiter=None, max_retries=5, backoff=1.0, timeout=30):
+    """
+    GET a JSON document, retrying rate-limited and transient failures.
+
+    Args:
+        session (requests.Session): Session used to issue the request.
+        url (str): URL of the resource.
+        params (dict): Query string parameters.
+        rate_limiter (RateLimiter): Optional limiter shared between threads.
+        max_retries (int): Number of retries after the first attempt.
+        backoff (float): Base delay of the exponential backoff, in seconds.
+        timeout (float): Timeout of each attempt, in seconds.
+
+    Returns:
+        dict: Decoded JSON body.
+
+    Raises:
+        requests.HTTPError: If the request still fails once the retries are exhausted,
+                            so that callers never mistake a failure for an empty page.
+    """
+    service = urlsplit(url).netloc
+    start = time.perf_counter()
+    for attempt in range(max_retries + 1):
+        if rate_limiter is not None:
+            rate_limiter.acquire()
+        try:
+            response = session.get(url, params=params, timeout=timeout)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            if attempt == max_retries:
+                METRICS.http_request(service, time.perf_counter() - start, type(e).__name__, retries=attempt)
+                raise
+            time.sleep(backoff_delay(attempt, backoff))
+            continue
+
+        if response.status_code in RETRY_STATUSES and attempt < max_retries:
+            time.sleep(backoff_delay(attempt, backoff, retry_after=response.headers.get("Retry-After")))
+            continue
+        METRICS.http_request(service, time.perf_counter() - start, response.status_code,
+                             nbytes=len(response.content), retries=attempt)
+        response.raise_for_status()
+        return decode_json(response.content)
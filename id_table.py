@@ -0,0 +1,148 @@
+# Collision-free interning of OpenAlex IDs and compact CSR storage of reference lists
+import os
+import threading
+
+import numpy as np
+
+OPENALEX_PREFIX = "https://openalex.org/"
+
+
+def short_openalex_id(openalex_id):
+    """Strip the URL prefix of an OpenAlex ID: "https://openalex.org/W123" -> "W123"."""
+    if openalex_id.startswith(OPENALEX_PREFIX):
+        return openalex_id[len(OPENALEX_PREFIX):]
+    return openalex_id
+
+
+class IdTable:
+    """
+    Persistent, reversible map between OpenAlex IDs and dense integer indices.
+
+    Indices are assigned in order of first appearance and never change: the table is stored as
+    a text file with one ID per line, and new IDs are only appended. Unlike a hash, two IDs can
+    never share an index, and the indices are small enough for int32 arrays.
+
+    Args:
+        path (str): Text file backing the table. None keeps the table in memory only.
+    """
+
+    def __init__(self, path="Cache/ids.txt"):
+        self.path = path
+        self.lock = threading.Lock()
+        self.ids = []
+        self.index = {}
+        if path and os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                self.ids = f.read().splitlines()
+            self.index = {openalex_id: i for i, openalex_id in enumerate(self.ids)}
+        self.saved = len(self.ids)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def intern(self, openalex_id):
+        """Return the index of an OpenAlex ID, assigning the next free one to a new ID."""
+        key = short_openalex_id(openalex_id)
+        index = self.index.get(key)
+        if index is None:
+            with self.lock:
+                index = self.index.get(key)
+                if index is None:
+                    index = len(self.ids)
+                    self.ids.append(key)
+                    self.index[key] = index
+        return index
+
+    def intern_many(self, openalex_ids):
+        """Intern several IDs at once and return their indices as an int32 array."""
+        return np.fromiter((self.intern(openalex_id) for openalex_id in openalex_ids), dtype=np.int32)
+
+    def lookup(self, index):
+        """Return the short OpenAlex ID of an index."""
+        return self.ids[index]
+
+    def ranks(self):
+        """
+        Rank of each index in the sorted order of the OpenAlex IDs.
+
+        Unlike the indices, which follow the order in which the IDs were first seen (e.g. the order
+        of concurrent API responses), the ranks only depend on the IDs themselves.
+
+        Returns:
+            numpy.ndarray: Rank of each index, as int64.
+        """
+        with self.lock:
+            ids = np.asarray(self.ids, dtype=str)
+        ranks = np.empty(len(ids), dtype=np.int64)
+        ranks[np.argsort(ids, kind='stable')] = np.arange(len(ids))
+        return ranks
+
+    def pmid(self, openalex_id):
+        """
+        PMID-compatible integer identifier of a work, as used in the `DF_*.csv` files and by novelpy.
+
+        The PMID is the interned index, so it is stable across runs sharing the same table file.
+        """
+        return self.intern(openalex_id)
+
+    def save(self):
+        """Append the IDs interned since the last save to the table file."""
+        if not self.path:
+            return
+        with self.lock:
+            new_ids = self.ids[self.saved:]
+            if not new_ids:
+                return
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write("".join(f"{openalex_id}\n" for openalex_id in new_ids))
+            self.saved += len(new_ids)
+
+    def export(self, path):
+        """Write the full mapping as a CSV file with columns 'PMID' and 'openalex_id'."""
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write("PMID,openalex_id\n")
+            f.writelines(f"{i},{openalex_id}\n" for i, openalex_id in enumerate(self.ids))
+
+
+class ReferenceLists:
+    """
+    Reference lists of many documents in CSR layout: the references of document `i` are
+    `indices[offsets[i]:offsets[i + 1]]`.
+
+    Both arrays use int32 while the total number of references allows it, which is the index type
+    `scipy.sparse` expects, so a CSR matrix can be built on top of them without copying.
+
+    Args:
+        offsets (numpy.ndarray): Start of each list in `indices` (length n_docs + 1).
+        indices (numpy.ndarray): Concatenated item indices.
+    """
+
+    def __init__(self, offsets, indices):
+        self.offsets = offsets
+        self.indices = indices
+
+    @classmethod
+    def from_lists(cls, lists):
+        """Pack an iterable of lists of item indices."""
+        lengths = [len(items) for items in lists]
+        total = sum(lengths)
+        dtype = np.int32 if total < 2 ** 31 else np.int64
+        offsets = np.zeros(len(lengths) + 1, dtype=dtype)
+        np.cumsum(lengths, out=offsets[1:])
+        indices = np.fromiter((item for items in lists for item in items), dtype=dtype, count=total)
+        return cls(offsets, indices)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, row):
+        return self.indices[self.offsets[row]:self.offsets[row + 1]]
+
+    @property
+    def lengths(self):
+        return np.diff(self.offsets)
+
+    @property
+    def nbytes(self):
+        return self.offsets.nbytes + self.indices.nbytes
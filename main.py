@@ -1,9 +1,101 @@
-import subprocess
-import os
-
-def run_scripts():
-    script1 = 'get_novelty.py'
-    script2 = 'get_location.py'
-
-if __name__ == '__main__':
-    run_scripts()
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import clusters
+import cube
+import get_location
+import get_novelty
+from cache import ResponseCache
+from geocoding import GeocodeStore
+from manifest import StageManifest
+from metrics import METRICS
+from openalex import OpenAlexHarvester
+
+# Number of worker processes scoring the SDG queries (None: one per CPU core)
+MAX_WORKERS = None
+
+# Output folders of the two stages
+NOVELTY_FOLDER = "DataFrames_nov"
+LOCATION_FOLDER = "DataFrames_loc"
+
+# Write a Chrome trace (chrome://tracing, ui.perfetto.dev) next to the JSON run report
+TRACE = True
+
+def score_task(*args):
+    """Run `get_novelty.score_query` in a worker process and return its result with the metrics it recorded."""
+    METRICS.reset()
+    path = get_novelty.score_query(*args)
+    return path, METRICS.snapshot()
+
+def run_pipeline(queries, harvester, backend, store=None, max_workers=MAX_WORKERS, corpus=get_novelty.CORPUS_MODE,
+                 num_results=800, novelty_folder=NOVELTY_FOLDER, location_folder=LOCATION_FOLDER,
+                 state_dir="Cache/novelty", gazetteer=None):
+    """
+    Run the novelty and location stages for every SDG query.
+
+    The queries are harvested together, and the shared co-occurrence structure and the table of
+    unique works are built once (`get_novelty.build_corpus`). In "per_query" mode each query is then
+    scored as an independent task in a process pool, with its own scratch directory; in "union" mode
+    the works are already scored and the queries are cheap views, selected in the main process.
+    Meanwhile the main process geocodes the unique works once, however many queries matched them; as
+    soon as the novelty table of a query lands, its location table is written as a view of those
+    locations. Every stage is
+    skipped when its inputs did not change since its last run (see `manifest.StageManifest`).
+
+    Args:
+        queries (list): Title search queries.
+        harvester (OpenAlexHarvester): OpenAlex client.
+        backend (GeocodingBackend): Geocoding service.
+        store (GeocodeStore): Persistent geocode cache.
+        max_workers (int): Number of worker processes in "per_query" mode (one per CPU core by default).
+        corpus (str): "union" or "per_query", see `get_novelty.build_corpus`.
+        num_results (int): Number of works per query.
+        novelty_folder (str): Folder of the novelty tables.
+        location_folder (str): Folder of the tables enriched with locations.
+        state_dir (str): State directory of the novelty stage.
+        gazetteer (Gazetteer): Optional offline reverse geocoder, see `get_location.add_locations`.
+
+    Returns:
+        dict: Each query mapped to the path of its novelty table.
+    """
+    # Completed stages are recorded, so a rerun after a crash resumes where it stopped
+    manifest = StageManifest(os.path.join(state_dir, "manifest"))
+    membership = get_novelty.build_corpus(queries, harvester, corpus, num_results, state_dir, manifest=manifest)
+
+    tasks = {query: (query, membership[query], corpus, state_dir, novelty_folder, get_novelty.EXPORT_CSV,
+                     os.path.join(state_dir, "tasks", f"task_{i}"), manifest) for i, query in enumerate(queries)}
+    paths = {}
+    if corpus == "union":
+        # The works are already scored: each query is a view of the works table, cheaper than a worker process
+        locations_path = get_location.locate_works(os.path.join(state_dir, "works.parquet"), backend, store,
+                                                   manifest, gazetteer)
+        for query, args in tasks.items():
+            paths[query] = get_novelty.score_query(*args)
+            get_location.write_location_view(locations_path, paths[query], location_folder, manifest)
+        return paths
+
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        futures = {pool.submit(score_task, *args): query for query, args in tasks.items()}
+        # Geocode every unique work once, while the queries are being scored
+        locations_path = get_location.locate_works(os.path.join(state_dir, "works.parquet"), backend, store,
+                                                   manifest, gazetteer)
+        # Select the locations of each query's works as soon as its novelty table is written
+        for future in as_completed(futures):
+            query = futures[future]
+            paths[query], snapshot = future.result()
+            METRICS.merge(snapshot)
+            get_location.write_location_view(locations_path, paths[query], location_folder, manifest)
+    return paths
+
+if __name__ == '__main__':
+    harvester = OpenAlexHarvester(cache=ResponseCache("Cache/openalex", offline=get_novelty.OFFLINE))
+    store = GeocodeStore("Cache/geocode.sqlite")
+    run_pipeline(get_novelty.queries, harvester, get_location.make_backend(), store,
+                 gazetteer=get_location.load_gazetteer())
+    store.close()
+    # Spatial clusters and hotspots of novelty, over the tables of all SDGs
+    clusters.analyze(LOCATION_FOLDER, NOVELTY_FOLDER)
+    # Pre-aggregated tables of the dashboard, recomputed only for the SDGs whose tables changed
+    cube.build_cube(NOVELTY_FOLDER, LOCATION_FOLDER)
+    METRICS.save_run("pipeline", trace=TRACE)
+    print("Pipeline complete!")
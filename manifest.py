@@ -0,0 +1,128 @@
+# Manifest of the pipeline stages, used to skip the stages whose inputs did not change
+import hashlib
+import json
+import os
+import threading
+import time
+
+
+def fingerprint(*parts):
+    """
+    Fingerprint of the inputs of a stage.
+
+    Args:
+        *parts: JSON-serializable inputs (query, parameters, upstream digests, ...).
+
+    Returns:
+        str: SHA-256 of their canonical JSON representation.
+    """
+    payload = json.dumps(parts, sort_keys=True, default=str, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def file_digest(path, chunk_size=1 << 20):
+    """Return the SHA-256 of the content of a file, read in chunks."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class StageManifest:
+    """
+    Record of the completed stages of the pipeline (harvest, prepare, cooc, lee, merge, geocode).
+
+    Each entry is identified by a stage and a key (e.g. a query or a file name) and stores the
+    fingerprint of the inputs it was computed from, and the size and hash of the files it produced.
+    A stage is current when its fingerprint is unchanged and its outputs are still on disk, so a
+    rerun after a crash skips the completed work and only redoes what is missing or stale.
+
+    Every entry is a small JSON file written atomically, so worker processes can record their
+    stages concurrently.
+
+    Args:
+        directory (str): Where the entries are stored.
+    """
+
+    def __init__(self, directory="Cache/manifest"):
+        self.directory = directory
+
+    def _path(self, stage, key):
+        name = hashlib.sha256(str(key).encode("utf-8")).hexdigest()[:32]
+        return os.path.join(self.directory, stage, f"{name}.json")
+
+    def get(self, stage, key):
+        """Return the entry of a stage, or None if it was never recorded."""
+        try:
+            with open(self._path(stage, key), encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def is_current(self, stage, key, stage_fingerprint, max_age=None):
+        """
+        Tell whether a stage can be skipped.
+
+        Args:
+            stage (str): Name of the stage.
+            key (str): Item of the stage (query, file, ...).
+            stage_fingerprint (str): Fingerprint of the current inputs, see `fingerprint`.
+            max_age (float): Entries older than this many seconds are stale. None keeps them forever.
+
+        Returns:
+            bool: True if the stage was completed with the same inputs and its outputs still exist unchanged in size.
+        """
+        entry = self.get(stage, key)
+        if entry is None or entry["fingerprint"] != stage_fingerprint:
+            return False
+        if max_age is not None and time.time() - entry["completed_at"] > max_age:
+            return False
+        for path, output in entry["outputs"].items():
+            if not os.path.exists(path) or os.path.getsize(path) != output["size"]:
+                return False
+        return True
+
+    def record(self, stage, key, stage_fingerprint, outputs=(), **info):
+        """
+        Record a completed stage.
+
+        Args:
+            stage (str): Name of the stage.
+            key (str): Item of the stage.
+            stage_fingerprint (str): Fingerprint of the inputs it was computed from.
+            outputs (iterable): Paths of the files it produced.
+            **info: Extra JSON-serializable details stored with the entry (e.g. counts).
+
+        Returns:
+            str: Digest of the entry (fingerprint and output hashes), to be used as an upstream
+                 input in the fingerprint of the next stages.
+        """
+        outputs = {path: {"size": os.path.getsize(path), "sha256": file_digest(path)} for path in sorted(outputs)}
+        entry = {"stage": stage, "key": key, "fingerprint": stage_fingerprint, "outputs": outputs,
+                 "digest": fingerprint(stage_fingerprint, [output["sha256"] for output in outputs.values()]),
+                 "completed_at": time.time(), "info": info}
+        path = self._path(stage, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write to a temporary file first so that a crash never leaves a partial entry
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(entry, f, indent=1)
+        os.replace(tmp_path, path)
+        return entry["digest"]
+
+    def digest(self, stage, key):
+        """Return the digest of a recorded stage, or None."""
+        entry = self.get(stage, key)
+        return entry["digest"] if entry else None
+
+    def invalidate(self, stage, key=None):
+        """Forget one entry of a stage, or all of them, so that it runs again."""
+        if key is not None:
+            paths = [self._path(stage, key)]
+        else:
+            stage_dir = os.path.join(self.directory, stage)
+            paths = [os.path.join(stage_dir, name) for name in os.listdir(stage_dir)] if os.path.isdir(stage_dir) else []
+        for path in paths:
+            if os.path.exists(path):
+                os.remove(path)
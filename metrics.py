@@ -0,0 +1,227 @@
+# Lightweight run metrics: stage timings, memory, HTTP and cache counters
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    # Unix only: peak memory of the process
+    import resource
+except ImportError:
+    resource = None
+
+try:
+    # Optional: memory readings on the platforms without `resource` or /proc (Windows)
+    import psutil
+except ImportError:
+    psutil = None
+
+# Upper bounds of the latency histogram buckets, in seconds (the last bucket is unbounded)
+LATENCY_BUCKETS = [0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30]
+
+
+def peak_rss():
+    """Return the peak resident set size of the process so far in bytes, or None where it cannot be read."""
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is in bytes on macOS and in kilobytes on Linux
+        return peak if sys.platform == "darwin" else peak * 1024
+    if psutil is not None:
+        # Peak working set on Windows
+        return getattr(psutil.Process().memory_info(), "peak_wset", None)
+    return None
+
+
+def current_rss():
+    """Return the current resident set size of the process in bytes, or None where it cannot be read."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError, AttributeError):
+        # No /proc (or no os.sysconf) outside Linux
+        return psutil.Process().memory_info().rss if psutil is not None else None
+
+
+def _series(name, labels):
+    # Name of a labelled series, e.g. "http.requests{service=api.openalex.org,status=200}"
+    if not labels:
+        return name
+    return name + "{" + ",".join(f"{key}={value}" for key, value in sorted(labels.items())) + "}"
+
+
+class Metrics:
+    """
+    Thread-safe recorder of the stages, counters and histograms of a run.
+
+    Stages are timed with `stage()`, which also records the resident memory, and appear both in
+    the JSON report and in the Chrome trace timeline (chrome://tracing or https://ui.perfetto.dev).
+    Counters and histograms are identified by a name and optional labels (service, query, ...).
+    Metrics recorded in worker processes are brought back with `snapshot()` and `merge()`.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Forget everything recorded so far, e.g. at the start of a run or of a worker task."""
+        with self.lock:
+            self.started_at = time.time()
+            self.stages = []
+            self.counters = {}
+            self.histograms = {}
+
+    @contextmanager
+    def stage(self, name, **labels):
+        """
+        Time a stage of the pipeline.
+
+        Args:
+            name (str): Stage name (harvest, cooc, lee, merge, geocode, ...).
+            **labels: Details of the stage, e.g. `query="SDG 3"`.
+        """
+        start = time.time()
+        rss_start = current_rss()
+        try:
+            yield
+        finally:
+            end = time.time()
+            record = {"name": name, "labels": labels, "start": start, "seconds": end - start,
+                      "rss_start_bytes": rss_start, "rss_end_bytes": current_rss(), "rss_peak_bytes": peak_rss(),
+                      "pid": os.getpid(), "tid": threading.get_ident()}
+            with self.lock:
+                self.stages.append(record)
+
+    def count(self, name, value=1, **labels):
+        """Add `value` to a counter."""
+        key = _series(name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, value, buckets=LATENCY_BUCKETS, **labels):
+        """Add a value (e.g. a latency in seconds) to a histogram."""
+        key = _series(name, labels)
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = {"buckets": list(buckets), "counts": [0] * (len(buckets) + 1),
+                                                    "count": 0, "sum": 0.0, "max": 0.0}
+            index = next((i for i, bound in enumerate(histogram["buckets"]) if value <= bound), len(histogram["buckets"]))
+            histogram["counts"][index] += 1
+            histogram["count"] += 1
+            histogram["sum"] += value
+            histogram["max"] = max(histogram["max"], value)
+
+    def http_request(self, service, seconds, status, nbytes=0, retries=0):
+        """
+        Record one HTTP call, including its retries.
+
+        Args:
+            service (str): Host of the service (api.openalex.org, maps.googleapis.com, ...).
+            seconds (float): Total latency of the call, backoff delays included.
+            status (int or str): Final HTTP status, or the name of the error.
+            nbytes (int): Size of the response body.
+            retries (int): Number of retried attempts.
+        """
+        self.count("http.requests", service=service, status=status)
+        if nbytes:
+            self.count("http.bytes", nbytes, service=service)
+        if retries:
+            self.count("http.retries", retries, service=service)
+        self.observe("http.latency", seconds, service=service)
+
+    def snapshot(self):
+        """Return everything recorded, as a picklable dict."""
+        with self.lock:
+            return {"stages": list(self.stages), "counters": dict(self.counters),
+                    "histograms": {key: dict(value, counts=list(value["counts"])) for key, value in self.histograms.items()}}
+
+    def merge(self, snapshot):
+        """Add the metrics recorded elsewhere (e.g. in a worker process) to this recorder."""
+        with self.lock:
+            self.stages.extend(snapshot["stages"])
+            for key, value in snapshot["counters"].items():
+                self.counters[key] = self.counters.get(key, 0) + value
+            for key, other in snapshot["histograms"].items():
+                histogram = self.histograms.get(key)
+                if histogram is None:
+                    self.histograms[key] = dict(other, counts=list(other["counts"]))
+                    continue
+                histogram["counts"] = [a + b for a, b in zip(histogram["counts"], other["counts"])]
+                histogram["count"] += other["count"]
+                histogram["sum"] += other["sum"]
+                histogram["max"] = max(histogram["max"], other["max"])
+
+    def report(self):
+        """
+        Build the run report.
+
+        Returns:
+            dict: Stages, per-stage totals, counters, histograms and cache hit ratios.
+        """
+        snapshot = self.snapshot()
+        totals = {}
+        for record in snapshot["stages"]:
+            total = totals.setdefault(record["name"], {"seconds": 0.0, "calls": 0, "rss_peak_bytes": None})
+            total["seconds"] += record["seconds"]
+            total["calls"] += 1
+            # Memory readings are None on the platforms where they are not available
+            peaks = [peak for peak in (total["rss_peak_bytes"], record["rss_peak_bytes"]) if peak is not None]
+            total["rss_peak_bytes"] = max(peaks) if peaks else None
+        # Hit ratio of every cache with "<name>.hits" and "<name>.misses" counters
+        ratios = {}
+        for key, hits in snapshot["counters"].items():
+            if ".hits" in key:
+                misses = snapshot["counters"].get(key.replace(".hits", ".misses"), 0)
+                ratios[key.replace(".hits", ".hit_ratio")] = hits / (hits + misses) if hits + misses else None
+        return {"started_at": self.started_at, "duration": time.time() - self.started_at,
+                "peak_rss_bytes": peak_rss(), "stage_totals": totals, "stages": snapshot["stages"],
+                "counters": snapshot["counters"], "cache_hit_ratios": ratios, "histograms": snapshot["histograms"]}
+
+    def save(self, path, trace_path=None):
+        """
+        Write the JSON run report, and optionally the Chrome trace of the stages.
+
+        Args:
+            path (str): Path of the JSON report.
+            trace_path (str): Path of the trace, in Chrome trace event format.
+        """
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w") as f:
+            json.dump(self.report(), f, indent=2, default=str)
+        if trace_path:
+            self.save_trace(trace_path)
+
+    def save_run(self, name, directory="Cache/reports", trace=True):
+        """
+        Write the report of a run (and its trace) under timestamped names.
+
+        Args:
+            name (str): Prefix of the files, e.g. "novelty".
+            directory (str): Folder of the reports.
+            trace (bool): Also write the Chrome trace.
+
+        Returns:
+            str: Path of the JSON report.
+        """
+        stem = os.path.join(directory, f"{name}_{time.strftime('%Y%m%d-%H%M%S', time.localtime(self.started_at))}")
+        self.save(f"{stem}.json", trace_path=f"{stem}.trace.json" if trace else None)
+        print(f"Run report saved to {stem}.json")
+        return f"{stem}.json"
+
+    def save_trace(self, path):
+        """Write the stages as complete ("X") events of the Chrome trace event format."""
+        events = [{"name": record["name"], "cat": "stage", "ph": "X",
+                   "ts": (record["start"] - self.started_at) * 1e6, "dur": record["seconds"] * 1e6,
+                   "pid": record["pid"], "tid": record["tid"],
+                   "args": dict(record["labels"], rss_peak_bytes=record["rss_peak_bytes"])}
+                  for record in self.snapshot()["stages"]]
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f, default=str)
+
+
+# Recorder shared by the modules of the pipeline
+METRICS = Metrics()
@@ -0,0 +1,808 @@
+# In-process reference co-occurrence network and the novelty indicators computed over it
+import json
+import os
+import shutil
+import tempfile
+from functools import cached_property
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+
+from id_table import ReferenceLists
+from metrics import METRICS
+
+# Upper bound of the number of pairs scored at once, to keep memory bounded on long reference lists
+MAX_PAIRS_PER_CHUNK = 5_000_000
+
+# Wang et al. (2017): a pair is new if it never co-occurred in the WANG_PAST_YEARS before the focal
+# year, and counts if it is reused at least WANG_REUSE times in the WANG_FUTURE_YEARS after it.
+# Focal years whose past or future window is not covered by the data get no score (NaN)
+WANG_PAST_YEARS = 3
+WANG_FUTURE_YEARS = 3
+WANG_REUSE = 1
+
+# Maximum number of rounds of the label propagation behind the Foster et al. (2015) communities
+MAX_PROPAGATION_ROUNDS = 20
+
+# Version of the scoring rules, persisted with the scores: scores of an older version are recomputed
+SCORES_VERSION = 2
+
+
+class CoocNetwork:
+    """
+    Reference co-occurrence network held in memory as a sparse document x item matrix.
+
+    The reference lists are stored CSR-style (`offsets`, `indices`), in their original order and
+    with their duplicates, which is what novelpy uses to enumerate the combinations of a document.
+    Co-occurrence matrices of any set of years are derived from the incidence matrix in one sparse
+    product, so no intermediate file is written.
+
+    Args:
+        pmids (array-like): Identifier of each document.
+        years (array-like): Publication year of each document.
+        offsets (array-like): Start of the reference list of each document in `indices` (length n_docs + 1).
+        indices (array-like): Item index of each reference.
+        items (array-like): Original identifier of each item index.
+    """
+
+    def __init__(self, pmids, years, offsets, indices, items):
+        self.pmids = np.asarray(pmids)
+        self.years = np.asarray(years)
+        self.offsets = np.asarray(offsets)
+        self.indices = np.asarray(indices)
+        self.items = np.asarray(items)
+        self._build_incidence()
+
+    def _build_incidence(self):
+        self.lengths = np.diff(self.offsets)
+        # Number of times each document cites each item. The matrix shares the offsets and indices
+        # arrays, so it keeps the duplicate entries: they are summed on the row slices in `cooc`
+        self.incidence = sp.csr_matrix(
+            (np.ones(len(self.indices), dtype=np.int32), self.indices, self.offsets),
+            shape=(len(self.pmids), len(self.items)), copy=False)
+
+    @classmethod
+    def from_records(cls, records, id_variable='PMID', year_variable='year',
+                     variable='c04_referencelist', sub_variable=None, n_items=None):
+        """
+        Build the network from prepared records, as produced by `prepare_data_for_novelpy`.
+
+        Args:
+            records (list): Dicts holding an id, a year and a list of references.
+            id_variable (str): Key of the document identifier.
+            year_variable (str): Key of the publication year.
+            variable (str): Key of the list of references.
+            sub_variable (str): Key of the item identifier inside each reference (e.g. 'item' for
+                                novelpy-style dicts), or None for plain lists.
+            n_items (int): Size of the ID table when the references are already dense interned
+                           indices; they are then used as columns as is. None remaps arbitrary IDs.
+
+        Returns:
+            CoocNetwork: The network over all the records.
+        """
+        pmids, years, lengths, refs = _parse_records(records, id_variable, year_variable, variable, sub_variable)
+        if n_items is not None:
+            dtype = np.int32 if len(refs) < 2 ** 31 else np.int64
+            offsets = np.concatenate([[0], np.cumsum(lengths)]).astype(dtype)
+            reference_lists = ReferenceLists(offsets, np.asarray(refs, dtype=dtype))
+            return cls.from_reference_lists(pmids, years, reference_lists, n_items)
+        items, indices = np.unique(np.asarray(refs), return_inverse=True)
+        offsets = np.concatenate([[0], np.cumsum(lengths, dtype=np.int64)])
+        return cls(pmids, years, offsets, indices, items)
+
+    @classmethod
+    def from_reference_lists(cls, pmids, years, reference_lists, n_items):
+        """
+        Build the network on top of CSR reference lists of interned indices, without copying them.
+
+        Args:
+            pmids (array-like): Identifier of each document.
+            years (array-like): Publication year of each document.
+            reference_lists (ReferenceLists): References of each document, as `IdTable` indices.
+            n_items (int): Number of interned IDs (the number of columns of the incidence matrix).
+
+        Returns:
+            CoocNetwork: The network, whose item indices are the interned indices.
+        """
+        return cls(pmids, years, reference_lists.offsets, reference_lists.indices, np.arange(n_items))
+
+    def references(self, row):
+        """Return the item identifiers cited by the document at `row`, in their original order."""
+        return self.items[self.indices[self.offsets[row]:self.offsets[row + 1]]]
+
+    def column_ranks(self, item_ranks):
+        """
+        Ranks of the columns of the co-occurrence matrices, from ranks indexed by item identifier.
+
+        Args:
+            item_ranks (numpy.ndarray): Rank of each item identifier, when the items are interned
+                                        indices (e.g. `IdTable.ranks`). None keeps the column order.
+        """
+        return None if item_ranks is None else np.asarray(item_ranks)[self.items]
+
+    def data_years(self, doc_mask=None):
+        """Return the (first, last) publication years of the documents, or None without documents."""
+        years = self.years if doc_mask is None else self.years[doc_mask]
+        if not len(years):
+            return None
+        return int(years.min()), int(years.max())
+
+    def update(self, records, id_variable='PMID', year_variable='year',
+               variable='c04_referencelist', sub_variable=None):
+        """
+        Bring the network in line with the current corpus.
+
+        `records` is the whole corpus: documents whose id is unknown are added, known ones are
+        replaced when their year or reference list changed and left untouched otherwise, and
+        documents missing from `records` are removed. Known items keep their index, so per-year
+        co-occurrence matrices computed before the update remain valid for the years that were
+        not affected.
+
+        Args:
+            records (list): Prepared records of the whole corpus, see `from_records`.
+
+        Returns:
+            set: Years whose co-occurrences changed (years of the new and removed documents, and
+                 old and new years of the changed ones).
+        """
+        rows = {pmid: row for row, pmid in enumerate(self.pmids.tolist())}
+        new_pmids, new_years, new_lengths, new_refs = _parse_records(
+            records, id_variable, year_variable, variable, sub_variable)
+        # Documents that dropped out of the corpus (e.g. out of the top results after a citation refresh)
+        current = set(new_pmids)
+        keep = np.fromiter((pmid in current for pmid in rows), dtype=bool, count=len(rows))
+        affected = set(self.years[~keep].tolist())
+        pmids, years, lengths, refs = [], [], [], []
+        start = 0
+        for pmid, year, length in zip(new_pmids, new_years, new_lengths):
+            doc_refs = new_refs[start:start + length]
+            start += length
+            row = rows.get(pmid)
+            if row is not None:
+                if self.years[row] == year and self.references(row).tolist() == list(doc_refs):
+                    continue
+                keep[row] = False
+                affected.add(int(self.years[row]))
+            affected.add(int(year))
+            pmids.append(pmid)
+            years.append(year)
+            lengths.append(length)
+            refs.extend(doc_refs)
+        if not pmids and keep.all():
+            return affected
+
+        # Intern the new items after the known ones
+        item_index = {item: index for index, item in enumerate(self.items.tolist())}
+        new_items = list(dict.fromkeys(ref for ref in refs if ref not in item_index))
+        item_index.update((item, len(self.items) + i) for i, item in enumerate(new_items))
+        if new_items:
+            self.items = np.concatenate([self.items, np.asarray(new_items)])
+
+        kept_refs = np.repeat(keep, self.lengths)
+        kept_lengths = self.lengths[keep]
+        # Without new documents, the kept ones are not concatenated with empty (float) arrays
+        self.pmids = np.concatenate([self.pmids[keep], pmids]) if pmids else self.pmids[keep]
+        self.years = np.concatenate([self.years[keep], years]) if years else self.years[keep]
+        self.indices = np.concatenate([self.indices[kept_refs], np.asarray([item_index[ref] for ref in refs], dtype=np.int64)])
+        self.offsets = np.concatenate([[0], np.cumsum(np.concatenate([kept_lengths, lengths]), dtype=np.int64)])
+        self._build_incidence()
+        return affected
+
+    def save(self, path):
+        """Save the documents and reference lists to a compressed `.npz` file."""
+        np.savez_compressed(path, pmids=self.pmids, years=self.years, offsets=self.offsets,
+                            indices=self.indices, items=self.items)
+
+    @classmethod
+    def load(cls, path):
+        """Load a network saved by `save`."""
+        with np.load(path, allow_pickle=False) as data:
+            return cls(data['pmids'], data['years'], data['offsets'], data['indices'], data['items'])
+
+    def cooc(self, years, doc_mask=None):
+        """
+        Weighted co-occurrence matrix of the documents published in `years`.
+
+        Mirrors `novelpy.utils.cooc_utils.create_cooc(weighted_network=True, self_loop=True)`:
+        every pair of positions in a reference list counts once, and the diagonal counts the
+        pairs formed by a reference cited several times by the same document.
+
+        Args:
+            years (iterable): Years whose documents are included.
+            doc_mask (numpy.ndarray): Optional boolean mask restricting the documents.
+
+        Returns:
+            tuple: (symmetric csr_matrix of co-occurrences, total number of co-occurrences Nt).
+        """
+        rows = np.isin(self.years, list(years))
+        if doc_mask is not None:
+            rows &= doc_mask
+        counts = self.incidence[rows]
+        counts.sum_duplicates()
+        adj = (counts.T @ counts).tocsr()
+        # Positions i < j citing the same item: m * (m - 1) / 2 per document
+        counts_sq = counts.multiply(counts)
+        self_pairs = np.asarray((counts_sq.sum(axis=0) - counts.sum(axis=0)) // 2).ravel()
+        adj = (adj - sp.diags(adj.diagonal()) + sp.diags(self_pairs)).tocsr()
+        adj.eliminate_zeros()
+        n_total = (adj.sum() - self_pairs.sum()) / 2 + self_pairs.sum()
+        return adj, n_total
+
+    def _doc_pairs(self, docs):
+        """
+        Yield the item pairs of documents, grouped by reference list length.
+
+        Yields:
+            tuple: (document rows, left items, right items), the items being arrays of shape
+                   (n_docs, k * (k - 1) / 2) listing the combinations of positions of each document.
+        """
+        for k in np.unique(self.lengths[docs]):
+            group = docs[self.lengths[docs] == k]
+            left, right = np.triu_indices(k, 1)
+            chunk = max(1, MAX_PAIRS_PER_CHUNK // max(1, len(left)))
+            for start in range(0, len(group), chunk):
+                rows = group[start:start + chunk]
+                refs = self.indices[self.offsets[rows][:, None] + np.arange(k)]
+                yield rows, refs[:, left], refs[:, right]
+
+    def lee(self, focal_years, time_window_cooc=None, doc_mask=None):
+        """
+        Lee et al. (2015) novelty, -log of the 10th percentile of the commonness of a document's pairs.
+
+        The commonness of a pair (i, j) is N_ij * N_t / (N_i * N_j), computed on the co-occurrences of
+        the focal year (as novelpy does) or of the `time_window_cooc` previous years plus the focal year.
+
+        Args:
+            focal_years (iterable): Years whose documents are scored.
+            time_window_cooc (int): Number of previous years cumulated in the co-occurrence matrix.
+            doc_mask (numpy.ndarray): Optional boolean mask restricting both the network and the scored documents.
+
+        Returns:
+            pandas.DataFrame: Columns 'PMID', 'Year' and 'Novelty', one row per document with more than 2 references.
+        """
+        return self.indicators(focal_years, ['lee'], time_window_cooc, doc_mask)
+
+    def indicators(self, focal_years, indicators=('lee',), time_window_cooc=None, doc_mask=None, item_ranks=None):
+        """
+        Score the documents of the focal years with several indicators in one pass over their pairs.
+
+        The co-occurrence matrix of each year is built once and shared by every indicator and every
+        focal year whose windows include it; the item pairs of each document are enumerated once.
+
+        Args:
+            focal_years (iterable): Years whose documents are scored.
+            indicators (iterable): Names of `INDICATORS` ("lee", "uzzi", "foster", "wang").
+            time_window_cooc (int): Number of previous years cumulated in the co-occurrence matrix
+                                    of the focal year (Wang et al. use their own windows).
+            doc_mask (numpy.ndarray): Optional boolean mask restricting both the network and the scored documents.
+            item_ranks (numpy.ndarray): Stable rank of each item identifier, breaking the ties of the
+                                        communities (Foster); see `column_ranks` and `label_propagation`.
+
+        Returns:
+            pandas.DataFrame: 'PMID', 'Year' and one column per indicator (see `indicator_column`).
+        """
+        focal_years = sorted(focal_years)
+        year_coocs = {}
+
+        def window_cooc(years):
+            # Per-year matrices are additive, so a window is the sum of the matrices of its years
+            adj, n_total = sp.csr_matrix((len(self.items), len(self.items)), dtype=np.int64), 0
+            for year in years:
+                if year not in year_coocs:
+                    with METRICS.stage("cooc", year=year):
+                        year_coocs[year] = self.cooc([year], doc_mask)
+                adj = adj + year_coocs[year][0]
+                n_total += year_coocs[year][1]
+            return adj, n_total
+
+        frames = []
+        data_years = self.data_years(doc_mask)
+        column_ranks = self.column_ranks(item_ranks)
+        for position, focal_year in enumerate(focal_years):
+            context = YearContext(focal_year, window_cooc, time_window_cooc, item_ranks=column_ranks,
+                                  data_years=data_years)
+            with METRICS.stage("lee", year=focal_year):
+                frames.append(self.score_year(context, indicators, doc_mask))
+            # Drop the matrices of the years no later focal year depends on
+            if position + 1 < len(focal_years):
+                first_needed = min(indicator_years(indicators, focal_years[position + 1], time_window_cooc))
+                for year in [year for year in year_coocs if year < first_needed]:
+                    del year_coocs[year]
+        return _concat_scores(frames, indicators)
+
+    def lee_year(self, focal_year, adj, n_total, doc_mask=None):
+        """
+        Score the documents of one focal year against a given co-occurrence matrix.
+
+        Args:
+            focal_year (int): Year whose documents are scored.
+            adj (scipy.sparse.csr_matrix): Symmetric co-occurrence matrix, as returned by `cooc`.
+            n_total (float): Total number of co-occurrences, as returned by `cooc`.
+            doc_mask (numpy.ndarray): Optional boolean mask restricting the scored documents.
+
+        Returns:
+            pandas.DataFrame: Columns 'PMID', 'Year' and 'Novelty'.
+        """
+        return self.score_year(YearContext(focal_year, adj=adj, n_total=n_total), ['lee'], doc_mask)
+
+    def score_year(self, context, indicators=('lee',), doc_mask=None):
+        """
+        Score the documents of a focal year with several indicators.
+
+        Args:
+            context (YearContext): Co-occurrence data of the focal year.
+            indicators (iterable): Names of `INDICATORS`.
+            doc_mask (numpy.ndarray): Optional boolean mask restricting the scored documents.
+
+        Returns:
+            pandas.DataFrame: 'PMID', 'Year' and one column per indicator.
+        """
+        unknown = set(indicators) - set(INDICATORS)
+        if unknown:
+            raise ValueError(f"Unknown indicators: {sorted(unknown)}")
+
+        # Documents scored by novelpy: published in the focal year, with more than 2 references
+        scored = (self.years == context.focal_year) & (self.lengths > 2)
+        if doc_mask is not None:
+            scored &= doc_mask
+        docs = np.flatnonzero(scored)
+
+        frames = []
+        for rows, left, right in self._doc_pairs(docs):
+            # Co-occurrence counts of the pairs, shared by the indicators that need them
+            n_ij = context.pair_counts('adj', left, right)
+            frame = pd.DataFrame({'PMID': self.pmids[rows], 'Year': context.focal_year})
+            for name in indicators:
+                frame[indicator_column(name)] = INDICATORS[name](context, left, right, n_ij)
+            frames.append(frame)
+        return _concat_scores(frames, indicators)
+
+
+class YearContext:
+    """
+    Co-occurrence data of a focal year, shared by the indicators that score its documents.
+
+    The matrix of the focal window and the item totals are computed up front; the communities (Foster)
+    and the past and future matrices (Wang) are only built when an indicator asks for them.
+
+    Args:
+        focal_year (int): Year whose documents are scored.
+        window_cooc (callable): Function of a list of years returning their (co-occurrence matrix, total).
+                                Needed by the indicators looking outside the focal window.
+        time_window_cooc (int): Number of previous years cumulated in the matrix of the focal year.
+        adj (scipy.sparse.csr_matrix): Matrix of the focal window, when it is already computed.
+        n_total (float): Total number of co-occurrences of `adj`.
+        item_ranks (numpy.ndarray): Stable rank of each column of the matrices, for the communities
+                                    (column order by default).
+        data_years (tuple): (first, last) years of the data, which bound the windows of Wang et al.;
+                            None considers them covered.
+    """
+
+    def __init__(self, focal_year, window_cooc=None, time_window_cooc=None, adj=None, n_total=None,
+                 item_ranks=None, data_years=None):
+        self.focal_year = focal_year
+        self.window_cooc = window_cooc
+        self.item_ranks = item_ranks
+        self.data_years = data_years
+        if adj is None:
+            adj, n_total = window_cooc(range(focal_year - (time_window_cooc or 0), focal_year + 1))
+        self.adj = adj.tocsr()
+        self.n_total = n_total
+        self.item_sums = np.asarray(self.adj.sum(axis=0)).ravel().astype(np.float64)
+        self._keys = {}
+
+    def pair_counts(self, matrix, left, right):
+        """
+        Entries (left[k], right[k]) of one of the matrices ('adj', 'past' or 'future'), with the shape of `left`.
+
+        The pairs are looked up by binary search among the sorted (row, column) keys of the matrix,
+        which is much faster than sparse fancy indexing for millions of pairs.
+        """
+        if matrix not in self._keys:
+            self._keys[matrix] = _sorted_keys(getattr(self, matrix))
+        keys, values = self._keys[matrix]
+        return _lookup(keys, values, self.adj.shape[1], left, right)
+
+    @cached_property
+    def communities(self):
+        """Community of each item in the co-occurrence network of the focal window."""
+        return label_propagation(self.adj, self.item_ranks)
+
+    @property
+    def wang_covered(self):
+        """Whether the data covers the past and future windows of Wang et al. around the focal year."""
+        if self.data_years is None:
+            return True
+        first, last = self.data_years
+        return first <= self.focal_year - WANG_PAST_YEARS and self.focal_year + WANG_FUTURE_YEARS <= last
+
+    @cached_property
+    def past(self):
+        """Co-occurrence matrix of the WANG_PAST_YEARS before the focal year."""
+        past = self.window_cooc(range(self.focal_year - WANG_PAST_YEARS, self.focal_year))[0].tocsr()
+        past.sum_duplicates()
+        return past
+
+    @cached_property
+    def past_norms(self):
+        """Euclidean norm of the co-occurrence profile of each item in `past`."""
+        return np.sqrt(np.asarray(self.past.multiply(self.past).sum(axis=1)).ravel().astype(np.float64))
+
+    @cached_property
+    def future(self):
+        """Co-occurrence matrix of the WANG_FUTURE_YEARS after the focal year."""
+        return self.window_cooc(range(self.focal_year + 1, self.focal_year + WANG_FUTURE_YEARS + 1))[0].tocsr()
+
+
+def label_propagation(adj, ranks=None, max_rounds=MAX_PROPAGATION_ROUNDS):
+    """
+    Communities of a weighted network by synchronous label propagation.
+
+    Every round, each node takes the label with the highest total weight among its neighbours and
+    itself, as one sparse product over all nodes. Ties go to the label of the node of smallest rank:
+    with ranks derived from stable identifiers (see `IdTable.ranks`), the communities do not depend
+    on the order in which the nodes were numbered. Synchronous updates can oscillate between two
+    states; the propagation then stops at the one of higher modularity.
+
+    Args:
+        adj (scipy.sparse.csr_matrix): Symmetric weighted adjacency matrix.
+        ranks (numpy.ndarray): Rank of each node, the node index by default.
+        max_rounds (int): Maximum number of rounds.
+
+    Returns:
+        numpy.ndarray: Label of each node (the index of a node of its community); isolated nodes keep their own index.
+    """
+    labels = np.arange(adj.shape[0])
+    active = np.flatnonzero(np.diff(adj.indptr))
+    if not len(active):
+        return labels
+    if ranks is not None:
+        # Number the nodes with neighbours in rank order, so that the smallest label has the smallest rank
+        active = active[np.argsort(np.asarray(ranks)[active], kind='stable')]
+    # Restrict to the nodes with neighbours; the self loop damps the oscillations of synchronous updates
+    weights = (adj[active][:, active] + sp.identity(len(active), format='csr')).tocsr().astype(np.float64)
+    local = np.arange(len(active))
+    previous = None
+    for _ in range(max_rounds):
+        onehot = sp.csr_matrix((np.ones(len(local)), (np.arange(len(local)), local)), shape=weights.shape)
+        votes = (weights @ onehot).tocsr()
+        votes.sort_indices()
+        row_of = np.repeat(np.arange(votes.shape[0]), np.diff(votes.indptr))
+        best = np.maximum.reduceat(votes.data, votes.indptr[:-1])
+        winners = np.flatnonzero(votes.data == best[row_of])
+        # First winning entry of each row, i.e. the smallest label among the ties
+        _, first = np.unique(row_of[winners], return_index=True)
+        updated = votes.indices[winners[first]]
+        if np.array_equal(updated, local):
+            break
+        if previous is not None and np.array_equal(updated, previous):
+            # Two-state oscillation: keep the better partition of the two
+            if _modularity(weights, updated) > _modularity(weights, local):
+                local = updated
+            break
+        previous, local = local, updated
+    labels[active] = active[local]
+    return labels
+
+
+def _modularity(weights, labels):
+    # Newman modularity of a partition of a weighted network
+    weights = weights.tocoo()
+    total = weights.data.sum()
+    inside = weights.data[labels[weights.row] == labels[weights.col]].sum()
+    degrees = np.bincount(labels, weights=np.asarray(weights.sum(axis=1)).ravel())
+    return inside / total - np.square(degrees / total).sum()
+
+
+def _lee(context, left, right, n_ij):
+    # Lee et al. (2015): -log of the 10th percentile of the commonness N_ij * N_t / (N_i * N_j)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        commonness = n_ij * float(int(context.n_total)) / (context.item_sums[left] * context.item_sums[right])
+        commonness[~np.isfinite(commonness)] = 0
+        return -np.log(np.quantile(commonness, 0.1, axis=1))
+
+
+def _uzzi(context, left, right, n_ij):
+    # Uzzi et al. (2013), with an analytic null instead of rewired networks: z-score of each pair's
+    # count against its expectation N_i * N_j / N_t given the item totals, with a hypergeometric-like
+    # variance; novelty is minus the 10th percentile of the z-scores (atypical pairs score high)
+    n_total = float(context.n_total)
+    share_left = context.item_sums[left] / n_total
+    share_right = context.item_sums[right] / n_total
+    expected = share_left * context.item_sums[right]
+    variance = expected * np.clip(1 - share_left, 0, None) * np.clip(1 - share_right, 0, None)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        z = np.where(variance > 0, (n_ij - expected) / np.sqrt(variance), 0.0)
+    return -np.quantile(z, 0.1, axis=1)
+
+
+def _foster(context, left, right, n_ij):
+    # Foster et al. (2015): share of a document's pairs bridging two communities of the network
+    communities = context.communities
+    return (communities[left] != communities[right]).mean(axis=1)
+
+
+def _wang(context, left, right, n_ij):
+    # Wang et al. (2017): sum of the difficulty (1 - cosine similarity of the past co-occurrence
+    # profiles) of the pairs that are new in the focal year and reused afterwards. Without the
+    # full past window every pair would look new, and without the future one none would be reused
+    if not context.wang_covered:
+        return np.full(left.shape[0], np.nan)
+    candidates = ((context.pair_counts('past', left, right) == 0)
+                  & (context.pair_counts('future', left, right) >= WANG_REUSE) & (left != right))
+    difficulty = np.zeros(left.shape)
+    if candidates.any():
+        # Each distinct pair once, as (smaller item, larger item)
+        n_items = context.adj.shape[1]
+        low = np.minimum(left[candidates], right[candidates]).astype(np.int64)
+        high = np.maximum(left[candidates], right[candidates]).astype(np.int64)
+        pairs, inverse = np.unique(low * n_items + high, return_inverse=True)
+        cosine = _cosine(context, pairs // n_items, pairs % n_items)
+        difficulty[candidates] = 1 - cosine[inverse]
+    return difficulty.sum(axis=1)
+
+
+def _cosine(context, i, j):
+    """Cosine similarity of the rows i[k] and j[k] of the past co-occurrence matrix."""
+    past = context.past
+    lengths = np.diff(past.indptr)
+    # Walk the shorter row of each pair and look its columns up in the other row
+    swap = lengths[j] < lengths[i]
+    short, other = np.where(swap, j, i), np.where(swap, i, j)
+    dots = np.zeros(len(i))
+    bounds = np.concatenate([[0], np.cumsum(lengths[short])])
+    start = 0
+    while start < len(i):
+        # Pairs whose expanded rows fit in MAX_PAIRS_PER_CHUNK entries (at least one pair)
+        stop = max(start + 1, np.searchsorted(bounds, bounds[start] + MAX_PAIRS_PER_CHUNK, side='right') - 1)
+        chunk_lengths = lengths[short[start:stop]]
+        pair_of = np.repeat(np.arange(start, stop), chunk_lengths)
+        offsets = np.arange(len(pair_of)) - np.repeat(bounds[start:stop] - bounds[start], chunk_lengths)
+        positions = np.repeat(past.indptr[short[start:stop]], chunk_lengths) + offsets
+        matched = context.pair_counts('past', other[pair_of], past.indices[positions])
+        dots[start:stop] = np.bincount(pair_of - start, weights=past.data[positions] * matched,
+                                       minlength=stop - start)
+        start = stop
+    norms = context.past_norms[i] * context.past_norms[j]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(norms > 0, dots / norms, 0.0)
+
+
+def _sorted_keys(matrix):
+    # Keys row * n_columns + column of the entries of a matrix, sorted, with their values
+    matrix = matrix.tocsr()
+    matrix.sum_duplicates()
+    rows = np.repeat(np.arange(matrix.shape[0], dtype=np.int64), np.diff(matrix.indptr))
+    return rows * matrix.shape[1] + matrix.indices, matrix.data
+
+
+def _lookup(keys, values, n_columns, left, right):
+    # Values at (left, right) among sorted keys, 0 for the missing entries
+    query = np.asarray(left, dtype=np.int64) * n_columns + right
+    if not len(keys):
+        return np.zeros(query.shape, dtype=values.dtype)
+    positions = np.minimum(np.searchsorted(keys, query), len(keys) - 1)
+    return np.where(keys[positions] == query, values[positions], 0)
+
+
+# Indicators computed over the shared pairs: name -> function(context, left items, right items, pair counts)
+INDICATORS = {'lee': _lee, 'uzzi': _uzzi, 'foster': _foster, 'wang': _wang}
+
+
+def indicator_column(name):
+    """Column of an indicator's scores: 'Novelty' for Lee (the main score), 'Novelty_<name>' for the others."""
+    return 'Novelty' if name == 'lee' else f"Novelty_{name}"
+
+
+def indicator_years(indicators, focal_year, time_window_cooc=None):
+    """Years whose co-occurrences the scores of a focal year depend on, for a set of indicators."""
+    years = set(range(focal_year - (time_window_cooc or 0), focal_year + 1))
+    if 'wang' in indicators:
+        years.update(range(focal_year - WANG_PAST_YEARS, focal_year + WANG_FUTURE_YEARS + 1))
+    return years
+
+
+def _parse_records(records, id_variable, year_variable, variable, sub_variable):
+    """Flatten records into (pmids, years, reference list lengths, concatenated references)."""
+    pmids, years, lengths, refs = [], [], [], []
+    for record in records:
+        items = record.get(variable) or []
+        if sub_variable:
+            items = [item[sub_variable] for item in items]
+        pmids.append(record[id_variable])
+        years.append(record[year_variable])
+        lengths.append(len(items))
+        refs.extend(items)
+    return pmids, years, lengths, refs
+
+
+def _concat_scores(frames, indicators=('lee',)):
+    frames = [frame for frame in frames if len(frame)]
+    if not frames:
+        return pd.DataFrame(columns=['PMID', 'Year'] + [indicator_column(name) for name in indicators])
+    return pd.concat(frames, ignore_index=True)
+
+
+class IncrementalLee:
+    """
+    Persistent network, per-year co-occurrence counts and per-year scores, updated incrementally.
+
+    The co-occurrences of a window of years are the sum of the per-year matrices, so an update only
+    recomputes the matrices of the years touched by new, changed or removed works, and only rescores
+    the focal years whose windows (see `indicator_years`) contain one of those years. The result is
+    the same as a computation from scratch on the current corpus.
+
+    Args:
+        directory (str): Where the state is persisted.
+        focal_years (iterable): Years whose documents are scored.
+        time_window_cooc (int): Number of previous years cumulated in the co-occurrence matrix.
+        indicators (iterable): Names of the `INDICATORS` computed, Lee et al. (2015) by default.
+    """
+
+    def __init__(self, directory="Cache/novelty", focal_years=range(2016, 2025), time_window_cooc=None,
+                 indicators=('lee',)):
+        self.directory = directory
+        self.focal_years = list(focal_years)
+        self.time_window_cooc = time_window_cooc
+        self.indicators = list(indicators)
+        self.network = None
+        self.coocs = {}
+        self.scores = {}
+        self._load()
+
+    def _window(self, focal_year):
+        return indicator_years(self.indicators, focal_year, self.time_window_cooc)
+
+    def _load(self):
+        state_path = os.path.join(self.directory, "state.json")
+        if not os.path.exists(state_path):
+            return
+        with open(state_path) as f:
+            state = json.load(f)
+        self.network = CoocNetwork.load(os.path.join(self.directory, "network.npz"))
+        for year, n_total in state['n_total'].items():
+            adj = sp.load_npz(os.path.join(self.directory, f"cooc_{year}.npz")).tocsr()
+            self.coocs[int(year)] = (adj, n_total)
+        # Scores computed with other settings cannot be reused
+        if (state['focal_years'] == self.focal_years and state['time_window_cooc'] == self.time_window_cooc
+                and state.get('indicators', ['lee']) == self.indicators
+                and state.get('scores_version', 1) == SCORES_VERSION):
+            for year in self.focal_years:
+                path = os.path.join(self.directory, f"lee_{year}.csv")
+                if os.path.exists(path):
+                    self.scores[year] = pd.read_csv(path)
+
+    def save(self):
+        """Persist the network, the per-year co-occurrences and the per-year scores."""
+        os.makedirs(self.directory, exist_ok=True)
+        self.network.save(os.path.join(self.directory, "network.npz"))
+        for year, (adj, _) in self.coocs.items():
+            sp.save_npz(os.path.join(self.directory, f"cooc_{year}.npz"), adj)
+        for year, scores in self.scores.items():
+            scores.to_csv(os.path.join(self.directory, f"lee_{year}.csv"), index=False)
+        state = {'n_total': {str(year): float(n_total) for year, (_, n_total) in self.coocs.items()},
+                 'focal_years': self.focal_years, 'time_window_cooc': self.time_window_cooc,
+                 'indicators': self.indicators, 'scores_version': SCORES_VERSION}
+        with open(os.path.join(self.directory, "state.json"), 'w') as f:
+            json.dump(state, f)
+
+    def _window_cooc(self, years):
+        n_items = len(self.network.items)
+        adj = sp.csr_matrix((n_items, n_items), dtype=np.int64)
+        n_total = 0
+        for year in years:
+            if year in self.coocs:
+                year_adj, year_total = self.coocs[year]
+                # Matrices of earlier years may have fewer items than the current network
+                year_adj = year_adj.copy()
+                year_adj.resize((n_items, n_items))
+                adj = adj + year_adj
+                n_total += year_total
+        return adj, n_total
+
+    def update(self, records, n_items=None, item_ranks=None):
+        """
+        Bring the persisted state in line with the current corpus and rescore the affected focal
+        years with every indicator.
+
+        Args:
+            records (list): Prepared records of the whole corpus, with 'PMID', 'year' and
+                            'c04_referencelist'. Persisted works missing from them are removed.
+            n_items (int): Size of the ID table when the references are interned indices.
+            item_ranks (numpy.ndarray): Stable rank of each item identifier (see `IdTable.ranks`), for the communities.
+
+        Returns:
+            list: Focal years that were rescored.
+        """
+        with METRICS.stage("network"):
+            previous_years = self.network.data_years() if self.network is not None else None
+            if self.network is None:
+                self.network = CoocNetwork.from_records(records, n_items=n_items)
+                affected = set(self.network.years.tolist())
+            else:
+                affected = self.network.update(records)
+        data_years = self.network.data_years()
+        column_ranks = self.network.column_ranks(item_ranks)
+
+        for year in affected:
+            with METRICS.stage("cooc", year=year):
+                self.coocs[year] = self.network.cooc([year])
+        # The years covered by the data decide which focal years get a Wang et al. score
+        coverage_changed = 'wang' in self.indicators and data_years != previous_years
+        rescored = [year for year in self.focal_years
+                    if year not in self.scores or coverage_changed or affected.intersection(self._window(year))]
+        for focal_year in rescored:
+            with METRICS.stage("lee", year=focal_year):
+                context = YearContext(focal_year, self._window_cooc, self.time_window_cooc,
+                                      item_ranks=column_ranks, data_years=data_years)
+                self.scores[focal_year] = self.network.score_year(context, self.indicators)
+        print(f"Co-occurrences updated for {sorted(affected)}, scores recomputed for {rescored}")
+        return rescored
+
+    def all_scores(self):
+        """Return the scores of every focal year as one DataFrame with 'PMID', 'Year' and one column per indicator."""
+        return _concat_scores([self.scores[year] for year in self.focal_years if year in self.scores], self.indicators)
+
+
+def compare_with_novelpy(records, focal_years, base_dir=None):
+    """
+    Compute Lee novelty with both novelpy and `CoocNetwork` on the same records and compare them.
+
+    Duplicate references are not deduplicated, in either implementation: a reference cited m times
+    forms m * (m - 1) / 2 pairs with itself and m pairs with every other reference of the document
+    (novelpy's weighted network with self loops).
+
+    novelpy reads and writes relative `Data/` and `Result/` folders, so it runs in a temporary
+    working directory that is removed afterwards.
+
+    Args:
+        records (list): Prepared records with 'PMID', 'year' and 'c04_referencelist' (lists of item ids).
+        focal_years (iterable): Years to score.
+        base_dir (str): Optional working directory for novelpy (a temporary one by default).
+
+    Returns:
+        pandas.DataFrame: Columns 'PMID', 'Novelty_engine', 'Novelty_novelpy' and 'abs_diff'.
+    """
+    import novelpy
+
+    focal_years = list(focal_years)
+    engine = CoocNetwork.from_records(records).lee(focal_years)
+
+    cwd = os.getcwd()
+    work_dir = base_dir or tempfile.mkdtemp()
+    try:
+        os.chdir(work_dir)
+        docs_dir = 'Data/docs/references_sample'
+        os.makedirs(docs_dir, exist_ok=True)
+        # novelpy skips falsy items (`if doc_item:`) when it lists the items of a document, but not
+        # when it counts the co-occurrences, so item 0 must not be used: items are renumbered from 1
+        codes = {item: code for code, item in enumerate(
+            sorted({ref for record in records for ref in record['c04_referencelist']}), start=1)}
+        for year in {record['year'] for record in records}:
+            # novelpy expects each reference as a {"item": id} dict
+            docs = [{**record, 'c04_referencelist': [{'item': codes[ref]} for ref in record['c04_referencelist']]}
+                    for record in records if record['year'] == year]
+            with open(os.path.join(docs_dir, f"{year}.json"), 'w') as f:
+                json.dump(docs, f)
+        novelpy.utils.cooc_utils.create_cooc(
+            collection_name='references_sample', year_var='year', var='c04_referencelist',
+            sub_var='item', time_window=focal_years, weighted_network=True, self_loop=True).main()
+        rows = []
+        for focal_year in focal_years:
+            novelpy.indicators.Lee2015(
+                collection_name='references_sample', id_variable='PMID', year_variable='year',
+                variable='c04_referencelist', sub_variable='item', focal_year=focal_year).get_indicator()
+            with open(f"Result/lee/c04_referencelist/{focal_year}.json") as f:
+                for doc in json.load(f):
+                    rows.append({'PMID': doc['PMID'], 'Novelty_novelpy': doc['c04_referencelist_lee']['score']['novelty']})
+    finally:
+        os.chdir(cwd)
+        if base_dir is None:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    reference = pd.DataFrame(rows, columns=['PMID', 'Novelty_novelpy'])
+    result = engine.rename(columns={'Novelty': 'Novelty_engine'})[['PMID', 'Novelty_engine']].merge(
+        reference, on='PMID', how='outer')
+    result['abs_diff'] = (result['Novelty_engine'] - result['Novelty_novelpy']).abs()
+    return result
@@ -0,0 +1,238 @@
+# Concurrent, cursor-paginated harvester for the OpenAlex works endpoint
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from cache import CacheMissError
+from id_table import short_openalex_id
+from http_utils import RateLimiter, get_json, make_session
+from metrics import METRICS
+
+OPENALEX_URL = "https://api.openalex.org/works"
+DATE_FILTER = "from_publication_date:2016-01-01,to_publication_date:2024-12-31"
+
+# Fields of a work read by `get_novelty.prepare_data_for_novelpy`; the API only returns these
+# (no abstract, inverted index or secondary locations), which makes the pages several times smaller
+WORK_FIELDS = ["id", "publication_year", "type", "cited_by_count", "authorships", "referenced_works", "concepts",
+               "sustainable_development_goals", "open_access", "apc_paid", "primary_location"]
+
+# Maximum number of IDs in one OR-filter of a batched lookup
+ID_BATCH_SIZE = 50
+
+# Marker pushed on the result queue once a query is exhausted
+_DONE = object()
+
+
+class OpenAlexHarvester:
+    """
+    Fetch top-cited OpenAlex works with cursor pagination.
+
+    Cursor pagination is not capped at 10,000 results like `page=` pagination, but each
+    page depends on the cursor returned by the previous one, so the pages of a single query
+    are fetched in order. Parallelism therefore happens across queries: up to `max_workers`
+    queries are harvested at the same time, all sharing one pooled session and one rate limiter.
+
+    Args:
+        base_url (str): URL of the works endpoint (point it to a local stub server for tests).
+        per_page (int): Number of works per page (OpenAlex allows at most 200).
+        max_workers (int): Maximum number of queries harvested in parallel.
+        rate_limit (float): Maximum number of requests per second, shared by all workers.
+        max_retries (int): Number of retries for 429/5xx responses and connection errors.
+        backoff (float): Base delay of the jittered exponential backoff, in seconds.
+        timeout (float): Timeout of each request, in seconds.
+        mailto (str): Contact email, which gives access to the OpenAlex "polite pool".
+        cache (ResponseCache): Optional on-disk cache of the pages; in offline mode no request is sent.
+        select (list): Fields of the works to request (`WORK_FIELDS` by default). None requests full works.
+    """
+
+    def __init__(self, base_url=OPENALEX_URL, per_page=200, max_workers=4, rate_limit=10,
+                 max_retries=5, backoff=1.0, timeout=30, mailto=None, cache=None, select=WORK_FIELDS):
+        self.base_url = base_url
+        self.per_page = per_page
+        self.max_workers = max_workers
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.mailto = mailto
+        self.cache = cache
+        self.select = select
+        self.session = make_session(pool_size=max_workers)
+        self.rate_limiter = RateLimiter(rate_limit)
+
+    def query_params(self, query, cursor, per_page):
+        """Build the query string of one page of a title search."""
+        params = {
+            "filter": f"title.search:{query},{DATE_FILTER}",
+            "sort": "cited_by_count:desc",
+            "per-page": per_page,
+            "cursor": cursor,
+        }
+        if self.select:
+            params["select"] = ",".join(self.select)
+        if self.mailto:
+            params["mailto"] = self.mailto
+        return params
+
+    def fetch_page(self, params):
+        """
+        Fetch one page of results, from the cache if possible, retrying transient failures.
+
+        Raises:
+            CacheMissError: In offline mode, if the page is not in the cache.
+        """
+        if self.cache is not None:
+            page = self.cache.get(self.base_url, params)
+            if page is not None:
+                return page
+        page = get_json(
+            self.session,
+            self.base_url,
+            params=params,
+            rate_limiter=self.rate_limiter,
+            max_retries=self.max_retries,
+            backoff=self.backoff,
+            timeout=self.timeout,
+        )
+        if self.cache is not None:
+            self.cache.put(self.base_url, params, page)
+        return page
+
+    def iter_works(self, query, num_results=800):
+        """
+        Yield the most cited works matching a query, page after page.
+
+        Args:
+            query (str): Title search query.
+            num_results (int): Maximum number of works to yield.
+
+        Yields:
+            dict: OpenAlex work objects, sorted by decreasing citation count.
+        """
+        cursor = "*"
+        count = 0
+        per_page = min(self.per_page, num_results)
+        while cursor and count < num_results:
+            page = self.fetch_page(self.query_params(query, cursor, per_page))
+            results = page.get("results", [])
+            for work in results[:num_results - count]:
+                yield work
+            count += len(results)
+            if len(results) < per_page:
+                # A short page means the result set is exhausted
+                break
+            cursor = page.get("meta", {}).get("next_cursor")
+
+    def harvest(self, queries, num_results=800, buffer_size=1000):
+        """
+        Harvest several queries in parallel and stream the works as they arrive.
+
+        Args:
+            queries (list): Title search queries.
+            num_results (int): Maximum number of works per query.
+            buffer_size (int): Number of works buffered before the workers wait for the caller.
+
+        Yields:
+            tuple: (query, work) pairs, interleaved across queries in arrival order.
+
+        Raises:
+            requests.HTTPError: If a query still fails after its retries.
+        """
+        results = queue.Queue(maxsize=buffer_size)
+        stop = threading.Event()
+
+        def put(item):
+            # Give up waiting for room in the buffer once the caller stopped consuming
+            while not stop.is_set():
+                try:
+                    results.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def worker(query):
+            if stop.is_set():
+                return
+            try:
+                with METRICS.stage("harvest_query", query=query):
+                    for work in self.iter_works(query, num_results):
+                        if not put((query, work)):
+                            return
+            except Exception as e:
+                put((query, e))
+            put((query, _DONE))
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            for query in queries:
+                executor.submit(worker, query)
+            try:
+                pending = len(queries)
+                while pending:
+                    query, item = results.get()
+                    if item is _DONE:
+                        pending -= 1
+                    elif isinstance(item, Exception):
+                        raise item
+                    else:
+                        yield query, item
+            finally:
+                stop.set()
+
+    def fetch_by_ids(self, openalex_ids):
+        """
+        Fetch up to `ID_BATCH_SIZE` works in one request, with an OR-filter on their IDs.
+
+        Args:
+            openalex_ids (list): Short or full OpenAlex IDs.
+
+        Returns:
+            list: The works OpenAlex knows among them (deleted or merged IDs are missing).
+
+        Raises:
+            CacheMissError: In offline mode, if the batch is not in the cache.
+        """
+        ids = [short_openalex_id(openalex_id) for openalex_id in openalex_ids]
+        params = {"filter": f"openalex:{'|'.join(ids)}", "per-page": len(ids)}
+        if self.select:
+            params["select"] = ",".join(self.select)
+        if self.mailto:
+            params["mailto"] = self.mailto
+        return self.fetch_page(params).get("results", [])
+
+    def hydrate(self, openalex_ids, batch_size=ID_BATCH_SIZE):
+        """
+        Fetch many works by ID, in batches of `batch_size` IDs fetched concurrently.
+
+        In offline mode, the batches missing from the cache are skipped: their works stay unknown
+        and are requested on the next online run.
+
+        Args:
+            openalex_ids (iterable): Short or full OpenAlex IDs.
+            batch_size (int): Number of IDs per request (OpenAlex accepts up to 100 values in an OR-filter).
+
+        Yields:
+            tuple: (requested short IDs, works returned for them), one batch at a time.
+        """
+        # Sorted, so that the same IDs always form the same batches and hit the same cache entries
+        ids = sorted(set(short_openalex_id(openalex_id) for openalex_id in openalex_ids))
+        batches = [ids[start:start + batch_size] for start in range(0, len(ids), batch_size)]
+
+        def fetch(batch):
+            try:
+                return self.fetch_by_ids(batch)
+            except CacheMissError:
+                return None
+
+        # Submit a few batches per worker at a time, so that fetched works do not pile up in memory
+        window = 4 * self.max_workers
+        skipped = 0
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            for start in range(0, len(batches), window):
+                chunk = batches[start:start + window]
+                for batch, works in zip(chunk, executor.map(fetch, chunk)):
+                    if works is None:
+                        skipped += 1
+                        continue
+                    yield batch, works
+        if skipped:
+            print(f"Offline: skipped {skipped} batches of IDs missing from the cache")
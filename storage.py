@@ -0,0 +1,204 @@
+# Columnar (Parquet) storage of the novelty and location tables
+import ast
+import os
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+# Columns holding lists (or lists of structs), written as typed Parquet list columns
+LIST_COLUMNS = ['authors', 'institutions', 'c04_referencelist', 'sustainable_development_goals', 'authorships']
+
+# Low-cardinality string columns, dictionary-encoded in memory and on disk
+DICTIONARY_COLUMNS = ['sdg', 'type', 'subfield', 'field', 'domain', 'publisher', 'license', 'open_access_status',
+                      'keyword_analysis', 'collaborative_index', 'journal_impact_factor', 'citations_geographical',
+                      'page_count', 'apc_paid', 'Institution', 'City', 'Region', 'State', 'Continent']
+
+# Rows per row group: the min/max statistics of each group let readers skip the ones outside a filter
+ROW_GROUP_SIZE = 50_000
+
+DICTIONARY_TYPE = pa.dictionary(pa.int32(), pa.string())
+
+# Types of the columns that Arrow cannot infer when they hold no value (e.g. in an empty table),
+# so that every file of a folder shares one schema
+COLUMN_TYPES = {
+    'PMID': pa.int64(),
+    'openalex_id': pa.string(),
+    'year': pa.int64(),
+    'Year': pa.int64(),
+    'num_citations': pa.int64(),
+    'num_authors': pa.int64(),
+    'authors': pa.list_(pa.string()),
+    'institutions': pa.list_(pa.string()),
+    'authorships': pa.list_(pa.struct([('author', pa.string()), ('author_position', pa.int64()),
+                                       ('institution_id', pa.string()), ('institution_name', pa.string())])),
+    'c04_referencelist': pa.list_(pa.int64()),
+    'sustainable_development_goals': pa.list_(pa.struct([('id', pa.string()), ('display_name', pa.string()),
+                                                          ('score', pa.float64())])),
+    'reference_age': pa.float64(),
+    'reference_fields': pa.float64(),
+    'references_described': pa.float64(),
+    'Author_Position': pa.int64(),
+    'Author': pa.string(),
+    'Institution_ID': pa.string(),
+    'Latitude': pa.float64(),
+    'Longitude': pa.float64(),
+}
+
+
+def column_type(name):
+    """Return the Arrow type of a known column (see `COLUMN_TYPES`), or None for other columns."""
+    if name in COLUMN_TYPES:
+        return COLUMN_TYPES[name]
+    if name in DICTIONARY_COLUMNS:
+        return DICTIONARY_TYPE
+    if name.startswith('Novelty'):
+        return pa.float64()
+    return None
+
+
+def _has_null_type(arrow_type):
+    return pa.types.is_null(arrow_type) or (pa.types.is_list(arrow_type) and pa.types.is_null(arrow_type.value_type))
+
+
+def to_arrow(df, sdg=None):
+    """
+    Convert a pandas table to Arrow, with an 'sdg' column and dictionary-encoded string columns.
+
+    Args:
+        df (pandas.DataFrame): Novelty or location table; list columns must hold Python lists.
+        sdg (str): Query the table belongs to, stored in a dictionary-encoded 'sdg' column.
+
+    Returns:
+        pyarrow.Table: The table, sorted by year so that row groups can be pruned on the year. Columns
+                       without any value get the type of `column_type` instead of Arrow's null type.
+    """
+    # Work on a copy: the string conversion below must not change the caller's table
+    df = df.assign(sdg=sdg) if sdg is not None else df.copy()
+    year_column = 'year' if 'year' in df.columns else 'Year'
+    if year_column in df.columns:
+        df = df.sort_values(year_column, kind='stable')
+    # Mixed columns (e.g. "Missing" or a number) cannot be typed, store them as strings
+    for column in DICTIONARY_COLUMNS:
+        if column in df.columns and df[column].dtype == object:
+            df[column] = df[column].where(df[column].isna(), df[column].astype(str))
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    for index, field in enumerate(table.schema):
+        declared = column_type(field.name)
+        if declared is None and _has_null_type(field.type):
+            declared = pa.list_(pa.string()) if field.name in LIST_COLUMNS else pa.string()
+        if declared is None or declared == field.type:
+            continue
+        if table[field.name].null_count == len(table):
+            # Columns without any value (e.g. every column of an empty table, or a column of NaN)
+            column = pa.nulls(len(table), declared)
+        elif _has_null_type(field.type):
+            # Lists that are all empty
+            column = table[field.name].cast(declared)
+        else:
+            continue
+        table = table.set_column(index, pa.field(field.name, column.type), column)
+    for column in DICTIONARY_COLUMNS:
+        if column in table.column_names and pa.types.is_string(table.schema.field(column).type):
+            table = table.set_column(table.schema.get_field_index(column), column,
+                                     table[column].dictionary_encode())
+    return table
+
+
+def write_table(df, path, sdg=None):
+    """
+    Write a table to a Parquet file (zstd-compressed, with statistics for predicate pushdown).
+
+    Args:
+        df (pandas.DataFrame): Table to write.
+        path (str): Destination `.parquet` file.
+        sdg (str): Query the table belongs to.
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    pq.write_table(to_arrow(df, sdg), path, compression='zstd', row_group_size=ROW_GROUP_SIZE)
+
+
+def _read_file(path, years=None, sdgs=None, columns=None, pmids=None):
+    # Read one Parquet file with its own schema, pushing the filters down to its row groups
+    dataset = ds.dataset(path, format="parquet")
+    schema = dataset.schema
+    columns = [column for column in columns if column in schema.names] if columns is not None else schema.names
+    filters = {('year' if 'year' in schema.names else 'Year'): years, 'sdg': sdgs, 'PMID': pmids}
+    expression = None
+    for name, values in filters.items():
+        if values is None:
+            continue
+        if name not in schema.names or pa.types.is_null(schema.field(name).type):
+            # A column that is missing or without any value matches no filter
+            return schema.empty_table().select(columns)
+        condition = ds.field(name).isin(list(values))
+        expression = condition if expression is None else expression & condition
+    return dataset.to_table(columns=columns, filter=expression)
+
+
+def read_table(source, years=None, sdgs=None, columns=None, pmids=None):
+    """
+    Read one or several Parquet files, pushing the year, SDG and PMID filters down to the row groups.
+
+    Each file is read with its own schema and the tables are concatenated, so files whose types
+    differ (e.g. the empty table of a query written with null-typed columns) can share a folder.
+
+    Args:
+        source (str or list): A `.parquet` file, a directory of them, or a list of files.
+        years (iterable): Keep only these publication years.
+        sdgs (iterable): Keep only these queries.
+        columns (list): Columns to load (all by default). Columns missing from the files are skipped.
+        pmids (iterable): Keep only these works, e.g. the members of a query in the shared works table.
+
+    Returns:
+        pandas.DataFrame: The table, with list columns as Python lists.
+    """
+    if isinstance(source, str) and os.path.isdir(source):
+        source = sorted(os.path.join(source, name) for name in os.listdir(source) if name.endswith(".parquet"))
+    paths = [source] if isinstance(source, str) else list(source)
+    if pmids is not None:
+        pmids = list(pmids)
+    frames = [_read_file(path, years, sdgs, columns, pmids).to_pandas() for path in paths]
+    if not frames:
+        return pd.DataFrame(columns=columns or [])
+    names = list(dict.fromkeys(column for frame in frames for column in frame.columns))
+    # Empty tables only contribute their columns
+    non_empty = [frame for frame in frames if len(frame)] or frames[:1]
+    df = pd.concat(non_empty, ignore_index=True) if len(non_empty) > 1 else non_empty[0]
+    df = df.reindex(columns=names)
+    # Arrow returns list columns as NumPy arrays, convert them back to lists (a file without the column gives NaN)
+    for column in LIST_COLUMNS:
+        if column in df.columns:
+            df[column] = df[column].map(lambda value: list(value) if hasattr(value, '__iter__') else [])
+    return df
+
+
+def export_csv(df, path):
+    """
+    Optional final export to CSV, in the layout of the original `DF_*.csv` files (lists as Python repr).
+
+    Args:
+        df (pandas.DataFrame): Table to export.
+        path (str): Destination `.csv` file.
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    df.drop(columns=['sdg'], errors='ignore').to_csv(path, encoding='utf-8', index=False)
+
+
+def read_legacy_csv(path):
+    """
+    Read a `DF_*.csv` file written before the Parquet output, parsing the list columns safely.
+
+    Args:
+        path (str): Path of the CSV file.
+
+    Returns:
+        pandas.DataFrame: The table with list columns as Python lists.
+    """
+    df = pd.read_csv(path)
+    for column in LIST_COLUMNS:
+        if column in df.columns:
+            # literal_eval only accepts Python literals, unlike eval
+            df[column] = df[column].map(lambda value: ast.literal_eval(value) if isinstance(value, str) else [])
+    return df
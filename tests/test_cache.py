@@ -0,0 +1,55 @@
+# Checks of the expiry, eviction and offline behaviour of the response cache
+import os
+import time
+
+import pytest
+
+from cache import CacheMissError, ResponseCache, normalize_request
+
+URL = "https://api.openalex.org/works"
+
+
+def test_equivalent_requests_share_an_entry(tmp_path):
+    cache = ResponseCache(str(tmp_path))
+    cache.put("HTTPS://API.openalex.org/works/", {"b": 2, "a": 1, "mailto": "me@example.org"}, {"x": 1})
+
+    assert cache.get(URL, {"a": "1", "b": "2"}) == {"x": 1}
+    assert normalize_request(URL, {"a": 1}) != normalize_request(URL, {"a": 2})
+
+
+def test_expired_entries_are_refetched_online_and_replayed_offline(tmp_path, monkeypatch):
+    cache = ResponseCache(str(tmp_path), ttl=60)
+    cache.put(URL, {"page": 1}, {"x": 1})
+    assert cache.get(URL, {"page": 1}) == {"x": 1}
+
+    now = time.time()
+    monkeypatch.setattr(time, "time", lambda: now + 120)
+    assert cache.get(URL, {"page": 1}) is None
+    assert ResponseCache(str(tmp_path), ttl=60, offline=True).get(URL, {"page": 1}) == {"x": 1}
+
+
+def test_offline_miss_raises(tmp_path):
+    cache = ResponseCache(str(tmp_path), offline=True)
+
+    with pytest.raises(CacheMissError):
+        cache.get(URL, {"page": 1})
+    assert cache.misses == 1
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    """Once over budget, the cache drops its oldest entries first, a hit counting as a use."""
+    cache = ResponseCache(str(tmp_path), max_bytes=None)
+    for page in range(4):
+        cache.put(URL, {"page": page}, {"results": list(range(100 * page, 100 * page + 100))})
+        # Spread the modification times, whose resolution may be coarse
+        os.utime(cache._path(cache.key(URL, {"page": page})), (1000 + page, 1000 + page))
+    cache.get(URL, {"page": 0})
+
+    # Room for about three entries: adding a fifth one evicts the two least recently used (pages 1 and 2)
+    cache.max_bytes = int(cache.size * 1.1)
+    cache.put(URL, {"page": 4}, {"results": list(range(400, 500))})
+
+    assert cache.size <= 0.9 * cache.max_bytes
+    assert cache.get(URL, {"page": 1}) is None and cache.get(URL, {"page": 2}) is None
+    assert cache.get(URL, {"page": 0}) is not None and cache.get(URL, {"page": 4}) is not None
+    assert cache.size == sum(os.path.getsize(path) for path in cache._entries())
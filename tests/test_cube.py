@@ -0,0 +1,41 @@
+# Checks of the pre-aggregated novelty cube of the dashboard
+import os
+
+import pandas as pd
+
+from cube import CUBE_KEYS, QUANTILES, build_cube, sdg_cube
+from storage import write_table
+
+NOVELTY_COLUMNS = ['PMID', 'year', 'field', 'num_citations', 'num_authors', 'Novelty']
+
+
+def write_novelty(folder, sdg, n):
+    path = os.path.join(folder, f"DF_{sdg}.parquet")
+    df = pd.DataFrame({'PMID': list(range(n)), 'year': [2020] * n, 'field': ['Medicine'] * n,
+                       'num_citations': [10] * n, 'num_authors': [3] * n, 'Novelty': [float(i) for i in range(n)]})
+    if not n:
+        df = pd.DataFrame({column: pd.Series([], dtype=object) for column in NOVELTY_COLUMNS})
+    write_table(df, path, sdg=sdg)
+    return path
+
+
+def test_sdg_without_works_gives_an_empty_part(tmp_path):
+    """An SDG without any scored work has no cell, but its part has every column of the cube."""
+    full = sdg_cube(write_novelty(str(tmp_path), "Full", 5))
+    empty = sdg_cube(write_novelty(str(tmp_path), "Empty", 0))
+
+    assert empty.empty
+    assert empty.columns.tolist() == full.columns.tolist()
+    assert [f"Novelty_q{round(q * 100)}" for q in QUANTILES] == full.columns[-len(QUANTILES):].tolist()
+
+
+def test_build_cube_with_an_empty_sdg(tmp_path):
+    novelty_folder = str(tmp_path / "nov")
+    write_novelty(novelty_folder, "Full", 5)
+    write_novelty(novelty_folder, "Empty", 0)
+
+    cube, top = build_cube(novelty_folder, str(tmp_path / "loc"), str(tmp_path / "cube"),
+                           state_dir=str(tmp_path / "state"), top_n=3)
+    assert cube[CUBE_KEYS].values.tolist() == [["Full", 2020, "Unknown", "Unknown", "Unknown", "Medicine"]]
+    assert cube['Works'].tolist() == [5] and cube['Novelty_q50'].tolist() == [2.0]
+    assert top['PMID'].tolist() == [4, 3, 2]
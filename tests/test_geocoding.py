@@ -0,0 +1,160 @@
+# Checks of the persistent geocode store and of the batched geocoding engine
+import pytest
+
+import geocoding
+from geocoding import (GeocodeStore, GoogleBackend, StubBackend, coordinates_key, geocode_batch, normalize_place_name,
+                       reverse_geocode_batch)
+
+BENIN = ("Benin City", "Edo", "Nigeria", 6.3350, 5.6037)
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = GeocodeStore(str(tmp_path / "geocode.sqlite"))
+    yield store
+    store.close()
+
+
+def test_normalize_place_name():
+    assert normalize_place_name(" University  of\tBENIN. ") == "university of benin"
+    assert normalize_place_name("Ｕniversity of Benin") == "university of benin"
+    assert normalize_place_name(" .,") is None
+    assert normalize_place_name(float("nan")) is None
+
+
+def test_forward_entries_are_shared_by_spelling_variants(store):
+    store.put_forward("University of Benin", BENIN)
+
+    assert store.get_forward("  university OF benin ") == BENIN
+    assert store.get_forward("University of Lagos") is None
+    assert store.get_forward_many(["UNIVERSITY OF BENIN", "University of Lagos", None]) == {
+        "university of benin": BENIN}
+
+
+def test_missing_forward_deduplicates_and_skips_known_places(store):
+    store.put_forward("University of Benin", BENIN)
+    store.put_forward("Nowhere Institute", (None,) * 5)
+
+    missing = store.missing_forward(["University of Lagos", "university of lagos ", "University of Benin",
+                                     "Nowhere Institute", "", None])
+    assert missing == {"university of lagos": "University of Lagos"}
+
+
+def test_reverse_entries_are_keyed_by_rounded_coordinates(store):
+    store.put_reverse(6.33501, 5.60369, BENIN[:3])
+
+    assert store.get_reverse(6.33499, 5.60371) == BENIN[:3]
+    assert store.get_reverse(6.3360, 5.6037) is None
+    assert coordinates_key(6.33501, 5.60369) == (6.335, 5.6037)
+
+
+def test_entries_persist_across_reopening(tmp_path):
+    path = str(tmp_path / "geocode.sqlite")
+    store = GeocodeStore(path)
+    store.put_forward("University of Benin", BENIN)
+    store.put_reverse(6.335, 5.6037, BENIN[:3])
+    store.close()
+
+    reopened = GeocodeStore(path)
+    assert reopened.get_forward("University of Benin") == BENIN
+    assert reopened.get_reverse(6.335, 5.6037) == BENIN[:3]
+    reopened.close()
+
+
+# Engine settings without rate limit nor backoff, so that the retries are immediate
+FAST = {"max_workers": 4, "rate_limit": None, "backoff": 0}
+
+
+class FlakyBackend(StubBackend):
+    """Stub backend failing the first `failures` calls of each place."""
+
+    def __init__(self, places, failures):
+        super().__init__(places)
+        self.failures = failures
+        self.attempts = {}
+
+    def geocode(self, place_name):
+        self.attempts[place_name] = self.attempts.get(place_name, 0) + 1
+        if self.attempts[place_name] <= self.failures:
+            raise ConnectionError("quota exceeded")
+        return super().geocode(place_name)
+
+
+def test_geocode_batch_requests_each_place_once(store):
+    backend = StubBackend({"university of benin": BENIN})
+    names = ["University of Benin", "university of benin", "UNIVERSITY OF BENIN ", "Nowhere Institute", None]
+    table = geocode_batch(names, backend, store, **FAST)
+
+    assert backend.calls == 2
+    assert table.loc["university of benin"].tolist() == list(BENIN)
+    assert table.loc["nowhere institute"].isna().all()
+
+    # Both places, including the unknown one, are served by the store on the next run
+    again = geocode_batch(names, backend, store, **FAST)
+    assert backend.calls == 2
+    assert again.sort_index().equals(table.sort_index())
+
+
+def test_geocode_batch_retries_failures_and_never_caches_them(store):
+    backend = FlakyBackend({"university of benin": BENIN}, failures=1)
+    table = geocode_batch(["University of Benin"], backend, store, max_retries=1, **FAST)
+    assert table.loc["university of benin"].tolist() == list(BENIN)
+
+    failing = FlakyBackend({"university of lagos": BENIN}, failures=3)
+    table = geocode_batch(["University of Lagos"], failing, store, max_retries=1, **FAST)
+    assert "university of lagos" not in table.index
+    assert store.get_forward("University of Lagos") is None
+    assert failing.attempts["University of Lagos"] == 2
+
+
+def test_reverse_geocode_batch_requests_each_point_once(store):
+    backend = StubBackend(coordinates={(6.335, 5.6037): BENIN[:3]})
+    table = reverse_geocode_batch([(6.33501, 5.60369), (6.33499, 5.60371), (0, 0)], backend, store, **FAST)
+
+    assert backend.calls == 2
+    assert table.loc[(6.335, 5.6037)].tolist() == list(BENIN[:3])
+    assert table.loc[(0.0, 0.0)].isna().all()
+    reverse_geocode_batch([(6.335, 5.6037)], backend, store, **FAST)
+    assert backend.calls == 2
+
+
+def test_google_backend_statuses(monkeypatch):
+    """ZERO_RESULTS means "not found"; any other non-OK status is a failure, raised so that it is not cached."""
+    responses = {
+        "University of Benin": {"status": "OK", "results": [{
+            "geometry": {"location": {"lat": 6.335, "lng": 5.6037}},
+            "address_components": [{"long_name": "Benin City", "types": ["locality"]},
+                                   {"long_name": "Edo", "types": ["administrative_area_level_1"]},
+                                   {"long_name": "Nigeria", "types": ["country"]}]}]},
+        "Nowhere Institute": {"status": "ZERO_RESULTS", "results": []},
+        "University of Lagos": {"status": "OVER_QUERY_LIMIT", "error_message": "quota"},
+    }
+    monkeypatch.setattr(geocoding, "get_json", lambda session, url, params, **kwargs: responses[params["address"]])
+    backend = GoogleBackend("key")
+
+    assert backend.geocode("University of Benin") == BENIN[:3] + (6.335, 5.6037)
+    assert backend.geocode("Nowhere Institute") is None
+    with pytest.raises(RuntimeError, match="OVER_QUERY_LIMIT"):
+        backend.geocode("University of Lagos")
+
+
+def test_google_lookups_are_counted_once_as_requests(monkeypatch):
+    """`get_json` counts the HTTP request; the batch engine only records the lookup."""
+    class Response:
+        status_code = 200
+        headers = {}
+        content = b'{"status": "ZERO_RESULTS", "results": []}'
+
+        def raise_for_status(self):
+            pass
+
+    backend = GoogleBackend("key")
+    monkeypatch.setattr(backend.session, "get", lambda url, params, timeout: Response())
+    geocoding.METRICS.reset()
+    geocode_batch(["Nowhere Institute", "Elsewhere Institute"], backend, **FAST)
+
+    counters = geocoding.METRICS.snapshot()["counters"]
+    requests = {key: value for key, value in counters.items() if key.startswith("http.requests")}
+    lookups = {key: value for key, value in counters.items() if key.startswith("geocode.lookups")}
+    assert sum(requests.values()) == 2 and list(requests) == ["http.requests{service=maps.googleapis.com,status=200}"]
+    assert lookups == {"geocode.lookups{outcome=not_found,service=GoogleBackend.geocode}": 2}
@@ -0,0 +1,50 @@
+# Checks of the location stage on novelty tables, with a stub geocoding backend
+import os
+
+import pandas as pd
+
+from geocoding import StubBackend
+from get_location import locate_file, locate_files
+from manifest import StageManifest
+from storage import read_table, write_table
+
+AUTHORSHIP = {'author': 'A. Author', 'author_position': 0, 'institution_id': 'I1',
+              'institution_name': 'University of Benin'}
+PLACES = {'university of benin': ("Benin City", "Edo", "Nigeria", 6.335, 5.6037)}
+
+
+def write_novelty(folder, name, authorships):
+    path = os.path.join(folder, f"{name}.parquet")
+    write_table(pd.DataFrame({'PMID': list(range(len(authorships))), 'year': [2020] * len(authorships),
+                              'authorships': authorships, 'Novelty': [1.0] * len(authorships)}),
+                path, sdg=name[len("DF_"):])
+    return path
+
+
+def test_tables_without_authors_are_written_and_recorded(tmp_path):
+    """A table without any author row still gets an output and a manifest record, so a rerun skips it."""
+    files = {"DF_Authors": write_novelty(str(tmp_path), "DF_Authors", [[AUTHORSHIP]]),
+             "DF_No authors": write_novelty(str(tmp_path), "DF_No authors", [[], []]),
+             "DF_Empty": write_novelty(str(tmp_path), "DF_Empty", [])}
+    destination = str(tmp_path / "loc")
+    manifest = StageManifest(str(tmp_path / "manifest"))
+    backend = StubBackend(PLACES)
+
+    outputs = locate_files(files, destination, backend, manifest=manifest)
+    assert sorted(outputs) == sorted(files)
+    assert read_table(outputs["DF_Authors"])['City'].tolist() == ["Benin City"]
+    assert read_table(outputs["DF_No authors"]).empty and read_table(outputs["DF_Empty"]).empty
+    assert all(manifest.get("geocode", name) is not None for name in files)
+
+    calls = backend.calls
+    assert locate_files(files, destination, backend, manifest=manifest) == outputs
+    assert backend.calls == calls
+
+
+def test_locate_file_records_a_table_without_authors(tmp_path):
+    path = write_novelty(str(tmp_path), "DF_No authors", [[]])
+    manifest = StageManifest(str(tmp_path / "manifest"))
+
+    output = locate_file(path, str(tmp_path / "loc"), StubBackend(PLACES), manifest=manifest)
+    assert read_table(output).empty
+    assert manifest.get("geocode", "DF_No authors")['info']['rows'] == 0
@@ -0,0 +1,126 @@
+# Checks of the in-process novelty indicators against novelpy and against full recomputations
+import json
+import os
+
+import numpy as np
+import pytest
+
+from id_table import IdTable
+from novelty_engine import (INDICATORS, WANG_FUTURE_YEARS, WANG_PAST_YEARS, CoocNetwork, IncrementalLee,
+                            compare_with_novelpy, indicator_column)
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures")
+
+# Largest accepted difference with novelpy (both compute in float64)
+TOLERANCE = 1e-9
+
+
+def load_fixture(name):
+    with open(os.path.join(FIXTURES, name)) as f:
+        return json.load(f)
+
+
+def test_lee_matches_novelpy_fixture():
+    """Lee scores equal the novelpy scores stored with the fixture, including works citing a reference twice."""
+    fixture = load_fixture("lee_novelpy.json")
+    scores = CoocNetwork.from_records(fixture['records']).lee(fixture['focal_years'])
+    expected = {int(pmid): score for pmid, score in fixture['novelpy'].items()}
+
+    assert sorted(scores['PMID']) == sorted(expected)
+    np.testing.assert_allclose(scores['Novelty'], [expected[pmid] for pmid in scores['PMID']], atol=TOLERANCE)
+    # The fixture covers duplicate references, and item 0 among them
+    duplicated = [record['PMID'] for record in fixture['records']
+                  if len(set(record['c04_referencelist'])) < len(record['c04_referencelist'])
+                  and record['PMID'] in expected]
+    assert 121 in duplicated and len(duplicated) > 4
+
+
+def test_lee_matches_novelpy_run():
+    """`compare_with_novelpy` finds no difference when novelpy itself runs on the fixture."""
+    pytest.importorskip("novelpy")
+    fixture = load_fixture("lee_novelpy.json")
+    result = compare_with_novelpy(fixture['records'], fixture['focal_years'])
+
+    assert not result[['Novelty_engine', 'Novelty_novelpy']].isna().any().any()
+    assert result['abs_diff'].max() <= TOLERANCE
+
+
+def synthetic_records(n_works, n_items, seed, years=range(2014, 2025)):
+    """Records whose references are already interned indices, as in the pipeline."""
+    rng = np.random.default_rng(seed)
+    years = list(years)
+    return [{'PMID': pmid, 'year': years[rng.integers(len(years))],
+             'c04_referencelist': rng.integers(0, n_items, size=rng.integers(1, 12)).tolist()}
+            for pmid in range(n_works)]
+
+
+def sorted_scores(scores):
+    return scores.sort_values('PMID').reset_index(drop=True)
+
+
+def test_incremental_update_with_shrunken_corpus(tmp_path):
+    """Works that leave the corpus are removed: the update equals a computation from scratch."""
+    n_items = 150
+    indicators = list(INDICATORS)
+    records = synthetic_records(1200, n_items, seed=3)
+    incremental = IncrementalLee(str(tmp_path / "incremental"), indicators=indicators)
+    incremental.update(records, n_items=n_items)
+    incremental.save()
+
+    # 100 works leave the corpus, a few others change and a few new ones arrive
+    rng = np.random.default_rng(4)
+    dropped = set(rng.choice(len(records), size=100, replace=False).tolist())
+    current = [record for record in records if record['PMID'] not in dropped]
+    for record in current[:10]:
+        record['c04_referencelist'] = record['c04_referencelist'][::-1] + [0]
+    current += synthetic_records(20, n_items, seed=5)
+    for pmid, record in enumerate(current[-20:], start=len(records)):
+        record['PMID'] = pmid
+
+    # Reload the persisted state, as a later run would
+    incremental = IncrementalLee(str(tmp_path / "incremental"), indicators=indicators)
+    incremental.update(current, n_items=n_items)
+    fresh = IncrementalLee(str(tmp_path / "fresh"), indicators=indicators)
+    fresh.update(current, n_items=n_items)
+
+    updated, expected = sorted_scores(incremental.all_scores()), sorted_scores(fresh.all_scores())
+    assert not set(updated['PMID']) & dropped
+    assert updated['PMID'].tolist() == expected['PMID'].tolist()
+    for name in indicators:
+        column = indicator_column(name)
+        np.testing.assert_allclose(updated[column], expected[column], rtol=1e-12, atol=1e-12, err_msg=column)
+
+
+def interned(records, id_table):
+    """Copy of records with their references (OpenAlex-like IDs) interned in `id_table`."""
+    return [{**record, 'c04_referencelist': id_table.intern_many(record['c04_referencelist']).tolist()}
+            for record in records]
+
+
+def test_foster_independent_of_interning_order():
+    """Two ID tables filled in different orders give the same communities, hence the same Foster scores."""
+    records = [{**record, 'c04_referencelist': [f"W{ref}" for ref in record['c04_referencelist']]}
+               for record in synthetic_records(1500, 300, seed=6)]
+    scores = []
+    for seed in (0, 1):
+        # Intern the IDs in a random order, as concurrent harvest responses would
+        id_table = IdTable(path=None)
+        ids = sorted({ref for record in records for ref in record['c04_referencelist']})
+        id_table.intern_many(np.random.default_rng(seed).permutation(ids))
+        network = CoocNetwork.from_records(interned(records, id_table), n_items=len(id_table))
+        scores.append(sorted_scores(network.indicators(range(2016, 2025), ['foster'], item_ranks=id_table.ranks())))
+
+    assert scores[0]['PMID'].tolist() == scores[1]['PMID'].tolist()
+    np.testing.assert_array_equal(scores[0]['Novelty_foster'], scores[1]['Novelty_foster'])
+
+
+def test_wang_only_scores_covered_focal_years():
+    """Focal years whose past or future window runs outside the data get NaN Wang scores."""
+    records = synthetic_records(2000, 100, seed=8, years=range(2014, 2025))
+    scores = CoocNetwork.from_records(records, n_items=100).indicators(range(2014, 2025), ['lee', 'wang'])
+    covered = scores['Year'].between(2014 + WANG_PAST_YEARS, 2024 - WANG_FUTURE_YEARS)
+
+    assert covered.any() and (~covered).any()
+    assert scores.loc[covered, 'Novelty_wang'].notna().all()
+    assert scores.loc[~covered, 'Novelty_wang'].isna().all()
+    assert scores['Novelty'].notna().all()
@@ -0,0 +1,106 @@
+# Checks of the OpenAlex harvester and of the retries of `http_utils.get_json`, against a local stub server
+import pytest
+import requests
+
+from cache import CacheMissError, ResponseCache
+from http_utils import get_json, make_session
+from openalex import OpenAlexHarvester
+
+
+def paged_works(total):
+    """Build a `respond` function serving `total` works with cursor pagination."""
+    def respond(params):
+        start = 0 if params["cursor"] == "*" else int(params["cursor"])
+        per_page = int(params["per-page"])
+        works = [{"id": f"https://openalex.org/W{i}", "cited_by_count": total - i}
+                 for i in range(start, min(total, start + per_page))]
+        next_cursor = str(start + per_page) if start + per_page < total else None
+        return 200, {}, {"meta": {"next_cursor": next_cursor}, "results": works}
+    return respond
+
+
+def harvester(server, **kwargs):
+    return OpenAlexHarvester(base_url=server.url, rate_limit=None, backoff=0, **kwargs)
+
+
+def test_iter_works_follows_cursors(stub_server):
+    """Pages are requested cursor after cursor and the last, short page ends the loop."""
+    server = stub_server(paged_works(450))
+    works = list(harvester(server, per_page=200).iter_works("malaria", num_results=1000))
+
+    assert [work["id"] for work in works] == [f"https://openalex.org/W{i}" for i in range(450)]
+    assert [params["cursor"] for params in server.requests] == ["*", "200", "400"]
+    assert all(params["filter"].startswith("title.search:malaria,") for params in server.requests)
+
+
+def test_iter_works_stops_at_num_results(stub_server):
+    server = stub_server(paged_works(1000))
+    works = list(harvester(server, per_page=200).iter_works("malaria", num_results=300))
+
+    assert len(works) == 300
+    assert len(server.requests) == 2
+
+
+def test_harvest_interleaves_queries(stub_server):
+    server = stub_server(paged_works(30))
+    pairs = list(harvester(server, per_page=20, max_workers=2).harvest(["a", "b"], num_results=30))
+
+    assert sorted(query for query, _ in pairs) == ["a"] * 30 + ["b"] * 30
+
+
+def test_get_json_retries_after_429(stub_server):
+    """A 429 is retried after the delay of its Retry-After header, then the body is returned."""
+    def respond(params):
+        if len(server.requests) == 1:
+            return 429, {"Retry-After": "0"}, {"error": "rate limited"}
+        return 200, {}, {"results": [1]}
+    server = stub_server(respond)
+
+    assert get_json(make_session(), server.url, max_retries=2, backoff=0) == {"results": [1]}
+    assert len(server.requests) == 2
+
+
+def test_get_json_raises_once_retries_are_exhausted(stub_server):
+    server = stub_server(lambda params: (503, {"Retry-After": "0"}, {}))
+
+    with pytest.raises(requests.HTTPError):
+        get_json(make_session(), server.url, max_retries=2, backoff=0)
+    assert len(server.requests) == 3
+
+
+def test_cached_pages_are_replayed_offline(stub_server, tmp_path):
+    """A harvest served from the cache sends no request, and offline misses raise instead of fetching."""
+    server = stub_server(paged_works(250))
+    online = harvester(server, per_page=200, cache=ResponseCache(str(tmp_path)))
+    expected = list(online.iter_works("malaria"))
+    sent = len(server.requests)
+
+    offline = harvester(server, per_page=200, cache=ResponseCache(str(tmp_path), offline=True))
+    assert list(offline.iter_works("malaria")) == expected
+    with pytest.raises(CacheMissError):
+        list(offline.iter_works("tuberculosis"))
+    assert len(server.requests) == sent
+
+
+def lookup_works(params):
+    """`respond` function of an ID lookup: every requested ID exists, except W0."""
+    ids = params["filter"][len("openalex:"):].split("|")
+    return 200, {}, {"results": [{"id": f"https://openalex.org/{i}"} for i in ids if i != "W0"]}
+
+
+def test_hydration_goes_through_the_cache(stub_server, tmp_path):
+    """Hydrated batches are cached like pages: an offline rerun sends no request and skips uncached batches."""
+    server = stub_server(lookup_works)
+    ids = [f"W{i}" for i in range(25)]
+    online = harvester(server, cache=ResponseCache(str(tmp_path)))
+    fetched = {work["id"] for _, works in online.hydrate(ids, batch_size=10) for work in works}
+    assert len(server.requests) == 3 and len(fetched) == 24
+
+    offline = harvester(server, cache=ResponseCache(str(tmp_path), offline=True))
+    batches = list(offline.hydrate([f"https://openalex.org/{i}" for i in reversed(ids)], batch_size=10))
+    assert {work["id"] for _, works in batches for work in works} == fetched
+    assert [len(batch) for batch, _ in batches] == [10, 10, 5]
+
+    # The batches of new IDs are not cached: skipped offline, without any request
+    assert list(offline.hydrate(["W100", "W101"], batch_size=10)) == []
+    assert len(server.requests) == 3
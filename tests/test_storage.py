@@ -0,0 +1,61 @@
+# Checks of the Parquet storage of the novelty and location tables
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from storage import DICTIONARY_TYPE, read_table, to_arrow, write_table
+
+
+def novelty_table(n):
+    return pd.DataFrame({
+        'PMID': list(range(n)),
+        'year': [2020 + i % 3 for i in range(n)],
+        'type': ['article'] * n,
+        'authors': [['A1', 'A2']] * n,
+        'c04_referencelist': [[1, 2, 3]] * n,
+        'sustainable_development_goals': [[]] * n,
+        'Novelty': [float(i) for i in range(n)],
+    })
+
+
+def test_empty_tables_keep_their_types(tmp_path):
+    """An empty table is written with the types of a full one, not with Arrow's null type."""
+    empty = pd.DataFrame({column: pd.Series([], dtype=object) for column in novelty_table(0).columns})
+    path = str(tmp_path / "DF_Empty.parquet")
+    write_table(empty, path, sdg="Empty")
+
+    schema = pq.read_schema(path)
+    full = to_arrow(novelty_table(3), sdg="Full").schema
+    for name in ['PMID', 'year', 'authors', 'c04_referencelist', 'Novelty']:
+        assert schema.field(name).type == full.field(name).type
+    assert schema.field('sdg').type == DICTIONARY_TYPE
+    assert not any(pa.types.is_null(field.type) for field in schema)
+    assert read_table(path).empty
+
+
+def test_all_null_dictionary_columns_are_strings():
+    table = to_arrow(pd.DataFrame({'PMID': [1, 2], 'State': [float('nan')] * 2}))
+
+    assert table.schema.field('State').type == DICTIONARY_TYPE
+
+
+def test_to_arrow_leaves_the_caller_table_unchanged():
+    df = pd.DataFrame({'PMID': [2, 1], 'page_count': [12, "Missing"]})
+    to_arrow(df)
+
+    assert df['page_count'].tolist() == [12, "Missing"]
+
+
+def test_folders_mixing_schemas_are_read(tmp_path):
+    """Files whose types differ, e.g. an empty table written with null-typed columns, are read together."""
+    null_typed = pa.table({'PMID': pa.nulls(0), 'year': pa.nulls(0), 'authors': pa.nulls(0, pa.list_(pa.null())),
+                           'Novelty': pa.nulls(0), 'sdg': pa.nulls(0)})
+    pq.write_table(null_typed, str(tmp_path / "DF_A empty.parquet"))
+    write_table(novelty_table(4), str(tmp_path / "DF_B full.parquet"), sdg="B full")
+    write_table(novelty_table(2).drop(columns=['authors']), str(tmp_path / "DF_C older.parquet"), sdg="C older")
+
+    df = read_table(str(tmp_path))
+    assert sorted(df['PMID']) == [0, 0, 1, 1, 2, 3]
+    assert df['authors'].tolist() == [['A1', 'A2']] * 4 + [[], []]
+    assert read_table(str(tmp_path), sdgs=["C older"], years=[2020])['PMID'].tolist() == [0]
+    assert read_table(str(tmp_path), sdgs=["Nothing"], columns=['PMID', 'Novelty']).empty
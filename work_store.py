@@ -0,0 +1,113 @@
+# Persistent local store of OpenAlex works and of their SDG memberships
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from id_table import short_openalex_id
+
+
+class WorkStore:
+    """
+    SQLite-backed store of OpenAlex works, keyed by their short ID ("W123").
+
+    Works are kept as the JSON returned by the API, with their publication year in a separate
+    column. IDs that OpenAlex does not know (deleted or merged works) are stored with an empty
+    body, so they are not requested again. The many-to-many membership of the harvested works in
+    the SDG queries is kept in a separate table, so a work matched by several queries is stored,
+    scored and geocoded once; the recorded queries are listed in a third one, so a query that
+    returned no work is still known.
+
+    Args:
+        path (str): SQLite database file.
+    """
+
+    def __init__(self, path="Cache/works.sqlite"):
+        self.path = path
+        self.lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS works (
+                id TEXT PRIMARY KEY, publication_year INTEGER, body TEXT, fetched_at REAL);
+            CREATE TABLE IF NOT EXISTS memberships (
+                sdg TEXT, id TEXT, PRIMARY KEY (sdg, id));
+            CREATE TABLE IF NOT EXISTS queries (
+                sdg TEXT PRIMARY KEY, works INTEGER, recorded_at REAL);
+            CREATE INDEX IF NOT EXISTS memberships_id ON memberships (id);
+        """)
+
+    def __len__(self):
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM works").fetchone()[0]
+
+    def known(self, openalex_ids):
+        """Return the subset of `openalex_ids` (short IDs) already in the store, found or not."""
+        ids = list(openalex_ids)
+        found = set()
+        with self.lock:
+            for start in range(0, len(ids), 500):
+                chunk = ids[start:start + 500]
+                rows = self.conn.execute(f"SELECT id FROM works WHERE id IN ({','.join('?' * len(chunk))})", chunk)
+                found.update(row[0] for row in rows)
+        return found
+
+    def put_many(self, works, not_found=()):
+        """
+        Store works, and mark IDs that OpenAlex did not return.
+
+        Args:
+            works (iterable): OpenAlex work objects.
+            not_found (iterable): Short IDs requested but not returned.
+        """
+        now = time.time()
+        rows = [(short_openalex_id(work['id']), work.get('publication_year'), json.dumps(work), now) for work in works]
+        rows += [(openalex_id, None, None, now) for openalex_id in not_found]
+        with self.lock, self.conn:
+            self.conn.executemany("INSERT OR REPLACE INTO works VALUES (?, ?, ?, ?)", rows)
+
+    def get_many(self, openalex_ids):
+        """Return a dict short ID -> work, for the stored works among `openalex_ids`."""
+        ids = [short_openalex_id(openalex_id) for openalex_id in openalex_ids]
+        found = {}
+        with self.lock:
+            for start in range(0, len(ids), 500):
+                chunk = ids[start:start + 500]
+                rows = self.conn.execute(
+                    f"SELECT id, body FROM works WHERE body IS NOT NULL AND id IN ({','.join('?' * len(chunk))})", chunk)
+                found.update((row[0], json.loads(row[1])) for row in rows)
+        return found
+
+    def set_members(self, sdg, openalex_ids):
+        """
+        Replace the works of an SDG query.
+
+        Args:
+            sdg (str): Query.
+            openalex_ids (iterable): Short IDs of the works the query returned.
+        """
+        rows = [(sdg, openalex_id) for openalex_id in dict.fromkeys(openalex_ids)]
+        with self.lock, self.conn:
+            self.conn.execute("DELETE FROM memberships WHERE sdg = ?", (sdg,))
+            self.conn.executemany("INSERT INTO memberships VALUES (?, ?)", rows)
+            self.conn.execute("INSERT OR REPLACE INTO queries VALUES (?, ?, ?)", (sdg, len(rows), time.time()))
+
+    def members(self, sdg):
+        """
+        Return the short IDs of the works of an SDG query.
+
+        Returns:
+            list: The works in the order they were recorded, empty for a query recorded without any
+                  work, or None if the query was never recorded.
+        """
+        with self.lock:
+            recorded = self.conn.execute("SELECT 1 FROM queries WHERE sdg = ?", (sdg,)).fetchone()
+            rows = self.conn.execute("SELECT id FROM memberships WHERE sdg = ? ORDER BY rowid", (sdg,)).fetchall()
+        # Stores written before the queries table only list the queries that have works
+        if not recorded and not rows:
+            return None
+        return [row[0] for row in rows]
+
+    def close(self):
+        self.conn.close()